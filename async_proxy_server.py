@@ -0,0 +1,623 @@
+#!/usr/bin/env python3
+"""
+Async TECHNO Proxy Server
+ASGI version of the Suno, Udio and multi-service proxy endpoints
+
+The Flask proxies hold a thread for every in-flight upstream call. Here the
+same endpoints run as coroutines on one event loop with an async HTTP
+client, so a single process can keep thousands of generations in flight.
+Request and response JSON match the Flask servers; their prompt builders,
+rate limiters, router, track store and Udio status tracker are reused as-is.
+
+Usage:
+  python async_proxy_server.py                     # all proxies under /suno, /udio, /real_udio, /multi
+  python async_proxy_server.py --backend suno      # just Suno at /, drop-in for suno_server.py
+  uvicorn async_proxy_server:app --port 5007
+
+Settings:
+  ASYNC_PROXY_BACKEND - serve one backend at / instead of mounting all of them
+  ASYNC_POOL_SIZE     - upstream connections per provider (default 200; UPSTREAM_POOL_SIZE stay idle)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import http_pool
+import metrics
+import multi_service_server
+import real_udio_server
+import suno_server
+import track_catalog
+import udio_server
+from backend_router import NoBackendAvailable
+from rate_limiter import RateLimited, get_limiter, limiter_stats
+
+POOL_SIZE = int(os.environ.get('ASYNC_POOL_SIZE', 200))
+KEEPALIVE_SIZE = min(http_pool.POOL_SIZE, POOL_SIZE)
+STATUS_POLL_SECONDS = 0.5
+
+_clients = {}  # provider -> (event loop, httpx.AsyncClient)
+
+
+def client(name):
+    """Keep-alive async client per upstream provider, bound to the running loop"""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(name)
+    if entry is None or entry[0] is not loop:
+        # Bursts may open up to POOL_SIZE connections, but only a few are kept idle:
+        # with httpx, reusing hundreds of idle keep-alive connections at once was
+        # several times slower than reconnecting
+        limits = httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=KEEPALIVE_SIZE)
+        entry = (loop, httpx.AsyncClient(timeout=30, limits=limits))
+        _clients[name] = entry
+    return entry[1]
+
+
+def client_stats():
+    return {name: {'pool_size': POOL_SIZE, 'keepalive': KEEPALIVE_SIZE} for name in _clients}
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        return {}
+    if isinstance(data, dict):
+        request.state.metrics_style = data.get('style')
+    return data
+
+
+def rate_limited(e):
+    retry_after = max(int(e.retry_after + 0.999), 1)
+    return JSONResponse(
+        {'error': str(e), 'provider': e.provider, 'retry_after': retry_after},
+        status_code=429, headers={'Retry-After': str(retry_after)}
+    )
+
+
+def generation_error(e, details=None):
+    print(f"❌ Generation error: {str(e)}")
+    payload = {'error': f'Generation failed: {str(e)}', 'type': type(e).__name__}
+    if details:
+        payload['details'] = details
+    return JSONResponse(payload, status_code=500)
+
+
+async def post_json(provider, api_key, url, headers, data):
+    """Rate-limited POST to an upstream; returns the httpx response"""
+    return await get_limiter(provider).async_request(
+        api_key, lambda: client(provider).post(url, headers=headers, json=data)
+    )
+
+
+# --- Suno -------------------------------------------------------------------
+
+async def suno_home(request):
+    return HTMLResponse(suno_server.home())
+
+
+async def suno_health(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'service': 'suno-techno-generator',
+        'mode': 'async',
+        'upstream_clients': client_stats(),
+        'rate_limits': limiter_stats(),
+        'track_store': suno_server.track_store.stats(),
+        'track_poller': suno_server.track_poller.stats(),
+        'single_flight': suno_server.generation_flight.stats()
+    })
+
+
+async def suno_test(request):
+    data = await read_json(request)
+    api_key = data.get('api_key', '')
+    if len(api_key) < 10:
+        return JSONResponse({'error': 'API key too short - need real Suno API key'}, status_code=400)
+    return JSONResponse({
+        'success': True,
+        'message': 'Suno API test ready',
+        'key_length': len(api_key),
+        'service': 'suno-ai'
+    })
+
+
+async def suno_generate(request):
+    try:
+        data = await read_json(request)
+        style = data.get('style', 'minimal')
+        user_prompt = data.get('prompt', 'TECHNO')
+        api_key = data.get('api_key')
+
+        if not api_key:
+            return JSONResponse({
+                'error': 'Missing api_key',
+                'instructions': 'Get your Suno API key from https://app.suno.ai/account'
+            }, status_code=400)
+
+        full_prompt = suno_server.create_techno_prompt(style, user_prompt)
+
+        async def generate():
+            url, headers, body = suno_server.SunoAPI(api_key).generate_request(
+                full_prompt, True, f"techno, {style}, electronic, instrumental"
+            )
+            response = await post_json('suno', api_key, url, headers, body)
+            result = response.json() if response.status_code == 200 else None
+            if response.status_code != 200:
+                print(f"Suno API Error: {response.status_code} - {response.text}")
+            if result and 'id' in result:
+                suno_server.track_store.add(
+                    result['id'], api_key,
+                    status=result.get('status', 'processing'),
+                    audio_url=result.get('audio_url'),
+                    style=style
+                )
+                suno_server.catalog.add(suno_server.build_track(result, style, user_prompt, full_prompt), 'suno')
+                suno_server.track_poller.wake()
+            return result
+
+        result = await suno_server.generation_flight.ado(suno_server.generation_key(style, full_prompt, api_key), generate)
+        if result and 'id' in result:
+            return JSONResponse({
+                'success': True,
+                'track': suno_server.build_track(result, style, user_prompt, full_prompt),
+                'message': f'Real {style} TECHNO generation started with Suno!',
+                'track_id': result['id']
+            })
+        return JSONResponse({
+            'error': 'Generation failed',
+            'details': 'Suno API may be busy or key invalid',
+            'prompt': full_prompt
+        }, status_code=500)
+
+    except RateLimited as e:
+        return rate_limited(e)
+    except Exception as e:
+        return generation_error(e, 'Check your Suno API key and try again')
+
+
+async def wait_for_track(track_id, version, timeout):
+    """Non-blocking TrackStore.wait: check the store until the track changes or finishes"""
+    deadline = time.time() + timeout
+    while True:
+        state = suno_server.track_store.get(track_id)
+        if state is None or state['finished'] or state['version'] > version or time.time() >= deadline:
+            return state
+        await asyncio.sleep(STATUS_POLL_SECONDS)
+
+
+async def suno_status(request):
+    track_id = request.path_params['track_id']
+    state = suno_server.track_store.get(track_id)
+    if not state:
+        return JSONResponse({'error': f'Unknown track: {track_id}'}, status_code=404)
+
+    try:
+        wait = min(float(request.query_params.get('wait', 0)), suno_server.MAX_WAIT_SECONDS)
+        version = int(request.query_params.get('version', state['version']))
+    except ValueError:
+        wait, version = 0, state['version']
+    if wait > 0 and not state['finished']:
+        state = await wait_for_track(track_id, version, wait)
+    return JSONResponse(suno_server.public_state(state))
+
+
+async def suno_status_events(request):
+    track_id = request.path_params['track_id']
+    if not suno_server.track_store.get(track_id):
+        return JSONResponse({'error': f'Unknown track: {track_id}'}, status_code=404)
+
+    async def events():
+        version = 0
+        deadline = time.time() + suno_server.MAX_STREAM_SECONDS
+        while time.time() < deadline:
+            state = await wait_for_track(track_id, version, min(15, deadline - time.time()))
+            if state['version'] > version:
+                version = state['version']
+                yield f"event: status\ndata: {json.dumps(suno_server.public_state(state))}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if state['finished']:
+                return
+        state = suno_server.track_store.get(track_id)
+        yield f"event: timeout\ndata: {json.dumps(suno_server.public_state(state))}\n\n"
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+
+suno_routes = [
+    Route('/', suno_home),
+    Route('/health', suno_health),
+    Route('/test', suno_test, methods=['POST']),
+    Route('/generate', suno_generate, methods=['POST']),
+    Route('/status/{track_id}', suno_status),
+    Route('/status/{track_id}/events', suno_status_events),
+]
+
+
+# --- Udio (mock) ------------------------------------------------------------
+
+async def udio_home(request):
+    return HTMLResponse(udio_server.home())
+
+
+async def udio_health(request):
+    return JSONResponse({'status': 'healthy', 'service': 'udio-techno-generator', 'mode': 'async'})
+
+
+async def udio_test(request):
+    data = await read_json(request)
+    style = data.get('style', 'minimal')
+    user_prompt = data.get('prompt', 'TECHNO')
+    if style not in udio_server.TECHNO_STYLES:
+        return JSONResponse({'error': f"Test failed: '{style}'"}, status_code=500)
+    return JSONResponse({
+        'success': True,
+        'track': {
+            'id': f'test-{style}-{int(time.time())}',
+            'title': f'Test {style.title()} TECHNO Track',
+            'audio_url': 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav',
+            'style': style,
+            'prompt': f'{udio_server.TECHNO_STYLES[style]}, {user_prompt}'
+        }
+    })
+
+
+async def udio_generate(request):
+    try:
+        data = await read_json(request)
+        style = data.get('style', 'minimal')
+        user_prompt = data.get('prompt', 'TECHNO')
+        auth_token = data.get('auth_token')
+
+        if not auth_token:
+            return JSONResponse({
+                'error': 'Missing auth_token. Get it from udio.com cookies (sb-api-auth-token)',
+                'instructions': 'Go to udio.com → F12 → Application → Cookies → sb-api-auth-token'
+            }, status_code=400)
+
+        full_prompt = udio_server.create_techno_prompt(style, user_prompt)
+        await asyncio.sleep(2)  # Same simulated generation time as udio_server.py
+        return JSONResponse({
+            'success': True,
+            'track': udio_server.catalog.add({
+                'id': track_catalog.new_track_id('udio'),
+                'title': f'{style.title()} TECHNO - {user_prompt}',
+                'audio_url': 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav',
+                'style': style,
+                'prompt': full_prompt,
+                'status': 'generated'
+            }, 'udio'),
+            'message': f'Mock {style} TECHNO generated! Real Udio integration coming soon...'
+        })
+    except Exception as e:
+        return generation_error(e)
+
+
+udio_routes = [
+    Route('/', udio_home),
+    Route('/health', udio_health),
+    Route('/test', udio_test, methods=['POST']),
+    Route('/generate', udio_generate, methods=['POST']),
+]
+
+
+# --- Real Udio --------------------------------------------------------------
+
+async def real_udio_home(request):
+    return HTMLResponse(real_udio_server.home())
+
+
+async def real_udio_health(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'service': 'real-udio-techno-generator',
+        'mode': 'async',
+        'upstream_clients': client_stats(),
+        'rate_limits': limiter_stats(),
+        'status_tracker': real_udio_server.status_tracker.stats(),
+        'single_flight': real_udio_server.generation_flight.stats()
+    })
+
+
+async def real_udio_test(request):
+    data = await read_json(request)
+    auth_token = data.get('auth_token', '')
+    if len(auth_token) < 10:
+        return JSONResponse({'error': 'Token too short - need real Udio auth token'}, status_code=400)
+    return JSONResponse({
+        'success': True,
+        'message': 'Real Udio API test ready',
+        'token_length': len(auth_token),
+        'api_base': real_udio_server.UdioWrapper.API_BASE_URL
+    })
+
+
+async def real_udio_generate(request):
+    try:
+        data = await read_json(request)
+        style = data.get('style', 'minimal')
+        user_prompt = data.get('prompt', 'TECHNO')
+        auth_token = data.get('auth_token')
+
+        if not auth_token:
+            return JSONResponse({
+                'error': 'Missing auth_token',
+                'instructions': 'Get your Udio auth token from udio.com cookies (sb-api-auth-token)'
+            }, status_code=400)
+        if len(auth_token) < 10:
+            return JSONResponse({
+                'error': 'Invalid auth token format',
+                'instructions': 'Token should be a long string from Udio cookies'
+            }, status_code=400)
+
+        full_prompt = real_udio_server.create_techno_prompt(style, user_prompt)
+        flight = real_udio_server.generation_flight
+
+        async def start():
+            url, headers, body = real_udio_server.UdioWrapper(auth_token).generate_request(full_prompt, -1, "")
+            response = await post_json('udio', auth_token, url, headers, body)
+            return response.json().get('track_ids', []) if response.status_code == 200 else []
+
+        # Like the Flask server: Udio takes minutes, so answer with a job the status tracker finishes
+        async def start_job():
+            track_ids = await start()
+            if not track_ids:
+                return None
+            return real_udio_server.follow_generation(auth_token, track_ids, style, user_prompt, full_prompt)
+
+        job = await flight.ado(real_udio_server.generation_key(style, full_prompt, 'async', auth_token), start_job)
+        if job is None:
+            return JSONResponse({
+                'error': 'No tracks generated',
+                'details': 'Udio API may be busy or token invalid',
+                'prompt': full_prompt
+            }, status_code=500)
+        return JSONResponse({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'track_ids': job.params['track_ids'],
+            'status_url': f"{request.scope.get('root_path', '')}/jobs/{job.id}"
+        }, status_code=202)
+
+    except RateLimited as e:
+        return rate_limited(e)
+    except Exception as e:
+        return generation_error(e, 'Check your Udio auth token and try again')
+
+
+async def real_udio_job(request):
+    job = real_udio_server.udio_jobs.get(request.path_params['job_id'])
+    if not job:
+        return JSONResponse({'error': f"Unknown job: {request.path_params['job_id']}"}, status_code=404)
+    return JSONResponse(real_udio_server.job_payload(job))
+
+
+real_udio_routes = [
+    Route('/', real_udio_home),
+    Route('/health', real_udio_health),
+    Route('/test', real_udio_test, methods=['POST']),
+    Route('/generate', real_udio_generate, methods=['POST']),
+    Route('/jobs/{job_id}', real_udio_job),
+]
+
+
+# --- Multi-service ----------------------------------------------------------
+
+async def multi_home(request):
+    return HTMLResponse(multi_service_server.home())
+
+
+async def multi_health(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'service': 'multi-techno-generator',
+        'mode': 'async',
+        'available_services': list(multi_service_server.SERVICES.keys()),
+        'upstream_clients': client_stats(),
+        'routing': multi_service_server.router.stats(),
+        'rate_limits': limiter_stats(),
+        'service_health': multi_service_server.health_prober.stats(),
+        'single_flight': multi_service_server.generation_flight.stats()
+    })
+
+
+async def multi_services(request):
+    return JSONResponse(multi_service_server.services_status())
+
+
+async def multi_test(request):
+    data = await read_json(request)
+    service_name = data.get('service', 'suno')
+    api_key = data.get('api_key', '')
+    service = multi_service_server.SERVICES.get(service_name)
+    if service is None:
+        return JSONResponse({'error': f'Unknown service: {service_name}'}, status_code=400)
+    if service.requires_auth and len(api_key) < 10:
+        return JSONResponse({'error': f'{service.name} requires valid API key'}, status_code=400)
+    return JSONResponse({
+        'success': True,
+        'service': service.name,
+        'message': f'{service.name} API test ready',
+        'requires_auth': service.requires_auth
+    })
+
+
+async def multi_generate(request):
+    services = multi_service_server.SERVICES
+    try:
+        data = await read_json(request)
+        style = data.get('style', 'minimal')
+        user_prompt = data.get('prompt', 'TECHNO')
+        service_name = data.get('service', 'suno')
+        duration = min(int(data.get('duration', 20)), 30)
+        hedge = bool(data.get('hedge', False))
+
+        if service_name != 'auto' and service_name not in services:
+            return JSONResponse({'error': f'Unknown service: {service_name}'}, status_code=400)
+
+        keys = multi_service_server.service_keys(data, service_name)
+        if not keys:
+            if service_name == 'auto':
+                return JSONResponse({
+                    'error': 'Missing API keys',
+                    'instructions': 'Include api_key or api_keys for at least one service'
+                }, status_code=400)
+            service = services[service_name]
+            return JSONResponse({
+                'error': f'Missing API key for {service.name}',
+                'instructions': f'Get API key for {service.name} and include in request'
+            }, status_code=400)
+
+        prompts = {name: multi_service_server.create_techno_prompt(style, user_prompt, name) for name in keys}
+
+        async def generate_with(name):
+            service = services[name]
+            path, headers, body = service.build_request(prompts[name], style, keys[name], duration=duration)
+            response = await post_json(service.pool_name, keys[name], f"{service.base_url}{path}", headers, body)
+            return response.json() if response.status_code == service.success_status else None
+
+        async def generate():
+            used, result = await multi_service_server.router.acall(
+                list(keys), generate_with, hedge=hedge and service_name == 'auto'
+            )
+            if not result:
+                return used, None
+            return used, multi_service_server.catalog_track(used, result, style, user_prompt, prompts[used])
+
+        try:
+            used, track = await multi_service_server.generation_flight.ado(
+                multi_service_server.generation_key(service_name, keys, style, user_prompt, duration),
+                generate
+            )
+        except NoBackendAvailable as e:
+            return JSONResponse({
+                'error': str(e),
+                'details': 'Every candidate service is failing; try again shortly',
+                'routing': multi_service_server.router.stats()['backends']
+            }, status_code=503)
+
+        if track:
+            request.state.metrics_backend = used
+            service = services[used]
+            return JSONResponse({
+                'success': True,
+                'track': track,
+                'message': f'Real {style} TECHNO generation started with {service.name}!',
+                'service_used': service.name
+            })
+        names = ', '.join(services[name].name for name in keys)
+        return JSONResponse({
+            'error': f'Generation failed with {names}',
+            'details': 'API may be busy or key invalid',
+            'prompt': prompts.get(service_name, next(iter(prompts.values())))
+        }, status_code=500)
+
+    except RateLimited as e:
+        return rate_limited(e)
+    except Exception as e:
+        return generation_error(e)
+
+
+multi_routes = [
+    Route('/', multi_home),
+    Route('/health', multi_health),
+    Route('/services', multi_services),
+    Route('/test', multi_test, methods=['POST']),
+    Route('/generate', multi_generate, methods=['POST']),
+]
+
+
+BACKEND_ROUTES = {
+    'suno': suno_routes,
+    'udio': udio_routes,
+    'real_udio': real_udio_routes,
+    'multi': multi_routes
+}
+
+
+async def index(request):
+    links = ''.join(f'<li><a href="/{name}/">/{name}</a></li>' for name in BACKEND_ROUTES)
+    return HTMLResponse(f"<h1>🤖 Async TECHNO Proxy</h1><ul>{links}</ul>")
+
+
+async def metrics_endpoint(request):
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+
+async def tracks(request):
+    body, status = track_catalog.catalog_from_env().listing(request.query_params)
+    return JSONResponse(body, status_code=status)
+
+
+async def health(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'service': 'async-techno-proxy',
+        'backends': list(BACKEND_ROUTES),
+        'upstream_clients': client_stats(),
+        'upstream_pools': http_pool.pool_stats(),
+        'rate_limits': limiter_stats(),
+        'track_catalog': track_catalog.catalog_from_env().stats()
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    if app.state.probe_services:
+        # The Flask app starts its prober per request; here the serving process starts it once
+        multi_service_server.health_prober.start()
+    yield
+    for _, async_client in list(_clients.values()):
+        await async_client.aclose()
+    _clients.clear()
+
+
+def build_app(backend=None):
+    """One backend served at /, or every backend mounted under /<name>"""
+    if backend:
+        routes = BACKEND_ROUTES[backend] + [Route('/metrics', metrics_endpoint), Route('/tracks', tracks)]
+    else:
+        routes = [Route('/', index), Route('/health', health), Route('/metrics', metrics_endpoint),
+                  Route('/tracks', tracks)]
+        routes += [Mount(f'/{name}', routes=backend_routes) for name, backend_routes in BACKEND_ROUTES.items()]
+    app = Starlette(
+        routes=routes,
+        middleware=[
+            Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+            Middleware(metrics.MetricsMiddleware, service=f'async_{backend}' if backend else 'async')
+        ],
+        lifespan=lifespan
+    )
+    app.state.probe_services = backend in (None, 'multi')
+    return app
+
+
+app = build_app(os.environ.get('ASYNC_PROXY_BACKEND') or None)
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Async TECHNO proxy server')
+    parser.add_argument('--backend', choices=list(BACKEND_ROUTES), help='Serve one backend at / instead of all')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5007)))
+    args = parser.parse_args()
+
+    print("🎵 Starting Async TECHNO Proxy")
+    print(f"📡 Server: http://localhost:{args.port}")
+    print("🔌 Backends:", args.backend or ', '.join(f'/{name}' for name in BACKEND_ROUTES))
+    print("=" * 60)
+
+    uvicorn.run(build_app(args.backend), host='0.0.0.0', port=args.port)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Compressed Audio Encoding
+Turns the float WAV MusicGen writes into Opus, MP3, FLAC or 16-bit WAV on a process pool
+
+Encoding runs in separate processes, so it neither holds the GIL nor
+competes with generation threads for a request's time. The preferred format
+is encoded as soon as a track is generated. Other formats are encoded the
+first time a client asks for them, and concurrent requests for the same
+file share one encode. Encoded files sit next to the scratch audio and
+expire with it. Their names carry the source's mtime and size, so a source
+the cache regenerates under the same id is never served an old encoding.
+
+Needs the soundfile package (libsndfile 1.1+ for MP3 and Opus). Without it
+only the original WAV is served. Only Opus needs resampling from MusicGen's
+32 kHz; scipy is used for it when installed.
+
+Settings:
+  AUDIO_FORMATS           - formats to offer, most preferred first (default mp3,opus,flac,wav)
+  AUDIO_EAGER_FORMATS     - formats encoded right after generation (default: the first one)
+  AUDIO_ENCODE_WORKERS    - encoder processes (default 2)
+  AUDIO_ENCODE_TIMEOUT    - seconds a request waits for an encode before getting WAV (default 30)
+  AUDIO_COMPRESSION_LEVEL - 0 (best quality) to 1 (smallest) for MP3/Opus/FLAC (default: codec default)
+"""
+
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+try:
+    import soundfile
+    encoding_available = True
+except (ImportError, OSError):
+    encoding_available = False
+
+# Format name -> file extension, MIME type and libsndfile format/subtype
+FORMATS = {
+    'mp3': {'ext': '.mp3', 'mimetype': 'audio/mpeg', 'format': 'MP3', 'subtype': 'MPEG_LAYER_III'},
+    'opus': {'ext': '.opus', 'mimetype': 'audio/ogg', 'format': 'OGG', 'subtype': 'OPUS'},
+    'flac': {'ext': '.flac', 'mimetype': 'audio/flac', 'format': 'FLAC', 'subtype': 'PCM_16'},
+    'wav': {'ext': '.wav', 'mimetype': 'audio/wav', 'format': 'WAV', 'subtype': 'PCM_16'},
+}
+
+# Opus only supports these rates; MusicGen outputs 32 kHz
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+def resample(data, rate, target):
+    """Resample (frames, channels) float data, with scipy's polyphase filter if installed"""
+    import numpy as np
+
+    g = math.gcd(rate, target)
+    up, down = target // g, rate // g
+    try:
+        from scipy.signal import resample_poly
+    except ImportError:
+        return _resample_polyphase(data, up, down)
+    return resample_poly(data, up, down, axis=0).astype(np.float32)
+
+
+def _resample_polyphase(data, up, down):
+    """Windowed-sinc resampling that only filters the input samples, not the stuffed zeros
+
+    Same result as upsampling by zero-stuffing, filtering and keeping every
+    down-th sample. Outputs are grouped by their phase between input samples,
+    and each phase convolves the input once with its own slice of the kernel,
+    so the work is taps per input sample instead of up * taps.
+    """
+    import numpy as np
+
+    factor = max(up, down)
+    taps = 24 * factor + 1
+    n = np.arange(taps) - taps // 2
+    kernel = np.sinc(n / factor) / factor * np.hamming(taps) * up
+
+    frames = len(data)
+    outputs = -(-frames * up // down)
+    samples = data.astype(np.float64)
+    out = np.zeros((outputs, data.shape[1]), dtype=np.float32)
+    # Output m sits at m * down in the stuffed signal, so every up-th output shares a
+    # phase, and consecutive ones read the filtered input down samples apart
+    for first in range(min(up, outputs)):
+        position, phase = divmod(first * down + taps // 2, up)
+        count = len(range(first, outputs, up))
+        for c in range(data.shape[1]):
+            filtered = np.convolve(samples[:, c], kernel[phase::up])
+            # Outputs past the end of the convolution only saw zeros
+            filtered = np.pad(filtered, (0, max(position + (count - 1) * down + 1 - len(filtered), 0)))
+            out[first::up, c] = filtered[position:position + count * down:down]
+    return out
+
+
+def encode_file(source, target, fmt, compression_level=None):
+    """Encode source into target; runs in a pool process"""
+    spec = FORMATS[fmt]
+    data, rate = soundfile.read(source, dtype='float32', always_2d=True)
+    # MP3, FLAC and WAV take MusicGen's 32 kHz as is; only Opus needs another rate
+    if fmt == 'opus' and rate not in OPUS_RATES:
+        data, rate = resample(data, rate, 48000), 48000
+    options = {}
+    if compression_level is not None and fmt != 'wav':
+        options['compression_level'] = compression_level
+    # Write under a temporary name so readers never see a partial file
+    partial = f'{target}.{os.getpid()}.part'
+    soundfile.write(partial, data, rate, format=spec['format'], subtype=spec['subtype'], **options)
+    os.replace(partial, target)
+    return os.path.getsize(target)
+
+
+class AudioEncoder:
+    """Encodes audio files into a directory, one process pool per serving process"""
+
+    def __init__(self, directory, formats=('mp3', 'opus', 'flac', 'wav'), eager=None, workers=2,
+                 timeout=30.0, compression_level=None):
+        self.directory = directory
+        self.enabled = encoding_available
+        self.formats = [fmt for fmt in formats if fmt in FORMATS] if self.enabled else []
+        self.eager = [fmt for fmt in (eager if eager is not None else self.formats[:1]) if fmt in self.formats]
+        self.workers = workers
+        self.timeout = timeout
+        self.compression_level = compression_level
+        self.encoded = 0
+        self.failed = 0
+        self.source_bytes = 0
+        self.encoded_bytes = 0
+        self._pending = {}  # target path -> Future
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _executor(self):
+        # A pool inherited across fork has no management thread, so make one per process.
+        # Its workers are spawned, not forked: by now this process runs torch's thread
+        # pools, the batcher and job workers, and a forked child could inherit their
+        # locks held and deadlock on them.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+
+    def path(self, source, audio_id, fmt):
+        # Rewriting the source changes its mtime (touch() only moves the atime), and so the name
+        stat = os.stat(source)
+        return os.path.join(
+            self.directory, f"{audio_id}-{stat.st_mtime_ns:x}-{stat.st_size:x}{FORMATS[fmt]['ext']}"
+        )
+
+    def submit(self, source, audio_id, fmt):
+        """Future resolving to the encoded path; shared by concurrent callers"""
+        target = self.path(source, audio_id, fmt)
+        with self._lock:
+            future = self._pending.get(target)
+            if future is not None:
+                return future
+            if os.path.exists(target):
+                future = Future()
+                future.set_result(target)
+                return future
+            future = Future()
+            self._pending[target] = future
+        source_size = os.path.getsize(source)
+        encode = self._executor().submit(encode_file, source, target, fmt, self.compression_level)
+        encode.add_done_callback(lambda done: self._finish(done, future, target, fmt, source_size))
+        return future
+
+    def _finish(self, done, future, target, fmt, source_size):
+        with self._lock:
+            self._pending.pop(target, None)
+            error = done.exception()
+            if error is None:
+                self.encoded += 1
+                self.source_bytes += source_size
+                self.encoded_bytes += done.result()
+            else:
+                self.failed += 1
+        if error is None:
+            future.set_result(target)
+        else:
+            print(f"❌ Encoding to {fmt} failed: {error}")
+            future.set_exception(error)
+
+    def encode_eager(self, source, audio_id):
+        """Start encoding the eager formats in the background"""
+        for fmt in self.eager:
+            self.submit(source, audio_id, fmt)
+
+    def get(self, source, audio_id, fmt):
+        """Encoded path, waiting up to the timeout; None if encoding failed or is too slow"""
+        try:
+            return self.submit(source, audio_id, fmt).result(timeout=self.timeout)
+        except Exception as e:
+            print(f"⚠ Serving WAV instead of {fmt}: {e or type(e).__name__}")
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'formats': self.formats,
+                'eager': self.eager,
+                'workers': self.workers,
+                'encoded': self.encoded,
+                'failed': self.failed,
+                'in_flight': len(self._pending),
+                'compression_ratio': round(self.source_bytes / self.encoded_bytes, 1) if self.encoded_bytes else None
+            }
+
+
+def encoder_from_env(directory):
+    formats = os.environ.get('AUDIO_FORMATS', 'mp3,opus,flac,wav').split(',')
+    eager = os.environ.get('AUDIO_EAGER_FORMATS')
+    compression_level = os.environ.get('AUDIO_COMPRESSION_LEVEL')
+    return AudioEncoder(
+        directory,
+        formats=[fmt.strip() for fmt in formats if fmt.strip()],
+        eager=[fmt.strip() for fmt in eager.split(',') if fmt.strip()] if eager is not None else None,
+        workers=int(os.environ.get('AUDIO_ENCODE_WORKERS', 2)),
+        timeout=float(os.environ.get('AUDIO_ENCODE_TIMEOUT', 30)),
+        compression_level=float(compression_level) if compression_level else None
+    )
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Generated Audio Store
+Gives every generated file a URL-safe id and serves it with Range and ETag support
+
+Ids are file names rather than entries in a process-local table, so any
+worker can serve any track: cached tracks use their generation cache key,
+and tracks generated with the cache disabled live in a scratch directory
+until they are older than the TTL. The scratch directory is swept as new
+files are written, which also removes leftovers from earlier runs.
+
+Clients get the format they ask for with ?format=mp3, or else the best
+match for their Accept header among AUDIO_FORMATS (see audio_encoding).
+Responses go through Flask's send_file, so the WSGI server's file wrapper
+(sendfile under gunicorn) does the copying. Set USE_X_SENDFILE=1 behind a
+proxy that handles X-Sendfile to hand the transfer off entirely.
+
+Settings:
+  AUDIO_DIR     - scratch directory for uncached audio (default <tmp>/techno_audio)
+  AUDIO_TTL     - seconds uncached audio is kept (default 3600)
+  AUDIO_MAX_AGE - Cache-Control max-age for served audio (default 3600)
+"""
+
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from audio_encoding import FORMATS, encoder_from_env
+from generation_cache import cache_from_env, last_used, touch
+
+DEFAULT_AUDIO_DIR = os.path.join(tempfile.gettempdir(), 'techno_audio')
+
+# Extensions of generated (unencoded) files
+MIMETYPES = {
+    '.wav': 'audio/wav',
+}
+
+_AUDIO_ID = re.compile(r'[0-9a-f]{32,64}')
+
+
+class AudioStore:
+    """Scratch files for new audio plus id -> path lookup across scratch and cache"""
+
+    def __init__(self, cache, directory=DEFAULT_AUDIO_DIR, ttl=3600, max_age=3600, encoder=None):
+        self.cache = cache
+        self.encoder = encoder
+        self.directory = directory
+        self.ttl = ttl
+        self.max_age = max_age
+        self.swept = 0
+        self._last_sweep = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.sweep()
+
+    def new_path(self, suffix='.wav'):
+        """Path for a new generated file; replaces NamedTemporaryFile(delete=False)"""
+        self._maybe_sweep()
+        return os.path.join(self.directory, uuid.uuid4().hex + suffix)
+
+    def audio_id(self, path):
+        """Public id of a file written by new_path() or moved into the cache"""
+        return os.path.splitext(os.path.basename(path))[0]
+
+    def resolve(self, audio_id):
+        """Path for an audio id, or None if it is unknown or expired"""
+        if not _AUDIO_ID.fullmatch(audio_id or ''):
+            return None
+        cached = self.cache.get(audio_id, record=False)
+        if cached:
+            return cached
+        for suffix in MIMETYPES:
+            path = os.path.join(self.directory, audio_id + suffix)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def prepare(self, path):
+        """Start encoding a freshly generated file into the eager formats"""
+        if self.encoder and self.encoder.enabled:
+            self.encoder.encode_eager(path, self.audio_id(path))
+
+    def _maybe_sweep(self):
+        with self._lock:
+            if time.time() - self._last_sweep < min(self.ttl / 10, 60):
+                return
+        self.sweep()
+
+    def sweep(self):
+        """Delete scratch files older than the TTL"""
+        with self._lock:
+            self._last_sweep = time.time()
+        cutoff = time.time() - self.ttl
+        removed = 0
+        directories = [self.directory] + ([self.encoder.directory] if self.encoder else [])
+        paths = [os.path.join(d, name) for d in directories for name in os.listdir(d)]
+        for path in paths:
+            try:
+                if os.path.isfile(path) and last_used(os.stat(path)) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass  # Already removed by another worker
+        if removed:
+            with self._lock:
+                self.swept += removed
+            print(f"🧹 Removed {removed} expired audio files")
+        return removed
+
+    def offered_formats(self):
+        return self.encoder.formats if self.encoder else []
+
+    def negotiate(self):
+        """Format for the current request: ?format=, else the best Accept match, else None for WAV"""
+        from flask import request
+
+        offered = self.offered_formats()
+        requested = request.args.get('format')
+        if requested:
+            return requested
+        if not offered:
+            return None
+        if not request.accept_mimetypes:
+            return offered[0]
+        best = request.accept_mimetypes.best_match([FORMATS[fmt]['mimetype'] for fmt in offered])
+        return next((fmt for fmt in offered if FORMATS[fmt]['mimetype'] == best), None)
+
+    def send(self, audio_id):
+        """Flask response for an audio id, honouring format, Range and If-None-Match"""
+        from flask import jsonify, send_file
+
+        source = self.resolve(audio_id)
+        if source is None:
+            return jsonify({'error': f'Unknown or expired audio: {audio_id}'}), 404
+
+        fmt = self.negotiate()
+        if fmt is not None and fmt not in self.offered_formats():
+            return jsonify({'error': f'Unsupported format: {fmt}', 'formats': self.offered_formats()}), 406
+
+        path = self.encoder.get(source, audio_id, fmt) if fmt else None
+        if path:
+            touch(path)  # Keep variants that are still being played from expiring
+            mimetype = FORMATS[fmt]['mimetype']
+        else:
+            fmt, path = 'source', source
+            mimetype = MIMETYPES.get(os.path.splitext(path)[1], 'application/octet-stream')
+        stat = os.stat(path)
+        # Every write replaces the file, so inode and mtime change whenever the content does
+        # (touch() only moves the atime)
+        response = send_file(
+            path,
+            mimetype=mimetype,
+            conditional=True,
+            etag=f'{audio_id}-{fmt}-{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}',
+            max_age=self.max_age
+        )
+        response.vary.add('Accept')
+        return response
+
+    def track_urls(self, audio_id, endpoint='serve_audio'):
+        """Playback URL plus a download URL in the preferred format"""
+        from flask import url_for
+
+        urls = {'audio_url': url_for(endpoint, audio_id=audio_id, _external=True)}
+        offered = self.offered_formats()
+        if offered:
+            urls['download_url'] = url_for(endpoint, audio_id=audio_id, format=offered[0], _external=True)
+            urls['download_format'] = FORMATS[offered[0]]['ext'].lstrip('.')
+        return urls
+
+    def stats(self):
+        try:
+            scratch = sum(1 for entry in os.scandir(self.directory) if entry.is_file())
+        except OSError:
+            scratch = 0
+        return {
+            'directory': self.directory,
+            'scratch_files': scratch,
+            'ttl': self.ttl,
+            'swept': self.swept,
+            'encoding': self.encoder.stats() if self.encoder else None
+        }
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def store_from_env():
+    """Audio store for AUDIO_DIR, shared by every app in the process"""
+    directory = os.environ.get('AUDIO_DIR', DEFAULT_AUDIO_DIR)
+    with _shared_lock:
+        if directory not in _shared:
+            _shared[directory] = AudioStore(
+                cache_from_env(),
+                directory=directory,
+                ttl=float(os.environ.get('AUDIO_TTL', 3600)),
+                max_age=int(os.environ.get('AUDIO_MAX_AGE', 3600)),
+                encoder=encoder_from_env(os.path.join(directory, 'encoded'))
+            )
+        return _shared[directory]
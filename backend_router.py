@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Backend Router
+Picks the generation backend with the best recent latency and error record
+
+Every call is timed per backend. Ranking uses the rolling p95 latency
+(falling back to the EWMA until there are enough samples) inflated by the
+EWMA error rate. A per-backend circuit breaker stops sending traffic to a
+backend after repeated failures and lets a single trial through once the
+cooldown has passed. Calls fail over down the ranking, and can optionally
+be hedged: if the first backend is slower than its own p90, the next one
+is started too and whichever succeeds first wins.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+MIN_SAMPLES = 5
+
+
+class NoBackendAvailable(Exception):
+    """Raised when every candidate backend has an open circuit"""
+
+
+class BackendStats:
+    """Rolling latency/error statistics and circuit breaker for one backend"""
+
+    def __init__(self, name, alpha=0.2, window=100, failure_threshold=3, cooldown=30.0):
+        self.name = name
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latencies = deque(maxlen=window)
+        self.ewma_latency = None
+        self.ewma_error = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.state = 'closed'
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    def percentile(self, pct):
+        with self._lock:
+            if len(self.latencies) < MIN_SAMPLES:
+                return self.ewma_latency
+            ordered = sorted(self.latencies)
+        rank = math.ceil(pct / 100 * len(ordered))
+        return ordered[max(0, min(len(ordered), rank) - 1)]
+
+    def score(self):
+        """Expected cost of sending a request here; unknown backends score 0 so they get tried"""
+        p95 = self.percentile(95) or 0.0
+        return p95 * (1 + 4 * self.ewma_error)
+
+    def allow(self):
+        """Whether a request may go to this backend now"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() - self.opened_at >= self.cooldown:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record(self, latency, ok):
+        with self._lock:
+            self.calls += 1
+            self.ewma_error = self.alpha * (0.0 if ok else 1.0) + (1 - self.alpha) * self.ewma_error
+            self.trial_running = False
+            if ok:
+                # Only successful calls say anything about how fast the backend is
+                self.latencies.append(latency)
+                if self.ewma_latency is None:
+                    self.ewma_latency = latency
+                else:
+                    self.ewma_latency = self.alpha * latency + (1 - self.alpha) * self.ewma_latency
+                self.consecutive_failures = 0
+                self.state = 'closed'
+                return
+
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == 'half_open' or self.consecutive_failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"⚡ Circuit opened for {self.name}")
+                self.state = 'open'
+                self.opened_at = time.time()
+
+    def to_dict(self):
+        p90 = self.percentile(90)
+        p95 = self.percentile(95)
+        return {
+            'state': self.state,
+            'calls': self.calls,
+            'failures': self.failures,
+            'error_rate_ewma': round(self.ewma_error, 3),
+            'latency_ewma_ms': round(self.ewma_latency * 1000, 1) if self.ewma_latency is not None else None,
+            'latency_p90_ms': round(p90 * 1000, 1) if p90 is not None else None,
+            'latency_p95_ms': round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+
+class BackendRouter:
+    """Ranks backends by their stats and runs calls with failover and optional hedging"""
+
+    def __init__(self, names, failure_threshold=3, cooldown=30.0, window=100, alpha=0.2, max_workers=32,
+                 neutral_errors=()):
+        self.backends = {
+            name: BackendStats(name, alpha, window, failure_threshold, cooldown) for name in names
+        }
+        self.hedges = 0
+        self.failovers = 0
+        # Exceptions that still fail over but say nothing about backend health, e.g. per-key rate limits
+        self.neutral_errors = tuple(neutral_errors)
+        self.health_check = None  # Optional name -> bool hook, e.g. HealthProber.is_healthy
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='backend-call')
+
+    def rank(self, candidates):
+        """Candidates ordered best first, with ones failing health checks last"""
+        def key(name):
+            healthy = self.health_check(name) if self.health_check else True
+            return (not healthy, self.backends[name].score())
+        return sorted([name for name in candidates if name in self.backends], key=key)
+
+    def _timed_call(self, name, call):
+        started = time.perf_counter()
+        try:
+            result = call(name)
+        except self.neutral_errors as e:
+            self.backends[name].trial_running = False
+            return None, e
+        except Exception as e:
+            print(f"❌ {name} call failed: {e}")
+            result = None
+        self.backends[name].record(time.perf_counter() - started, result is not None)
+        return result, None
+
+    def _next(self, queue):
+        # Skip backends whose circuit is open; allow() also claims half-open trials
+        while queue:
+            name = queue.pop(0)
+            if self.backends[name].allow():
+                return name
+        return None
+
+    def call(self, candidates, call, hedge=False):
+        """Run call(name) on the best backend, failing over on None or errors
+
+        Returns (name, result), or (None, None) if every backend failed.
+        Raises NoBackendAvailable if no candidate would accept traffic, or the
+        last neutral error if every backend failed and one failed that way.
+        """
+        neutral = None
+        queue = self.rank(candidates)
+        name = self._next(queue)
+        if name is None:
+            raise NoBackendAvailable(f"No backend available among {', '.join(candidates)}")
+
+        running = {self._pool.submit(self._timed_call, name, call): name}
+        while running:
+            timeout = None
+            if hedge and queue and len(running) == 1:
+                timeout = self.backends[name].percentile(90)
+
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # The first backend is slower than usual; race the next one against it
+                hedge_name = self._next(queue)
+                if hedge_name:
+                    self.hedges += 1
+                    running[self._pool.submit(self._timed_call, hedge_name, call)] = hedge_name
+                continue
+
+            for future in done:
+                finished = running.pop(future)
+                result, error = future.result()
+                if result is not None:
+                    return finished, result
+                neutral = error or neutral
+
+            if not running:
+                name = self._next(queue)
+                if name:
+                    self.failovers += 1
+                    running[self._pool.submit(self._timed_call, name, call)] = name
+
+        if neutral is not None:
+            raise neutral
+        return None, None
+
+    async def _timed_acall(self, name, call):
+        started = time.perf_counter()
+        try:
+            result = await call(name)
+        except self.neutral_errors as e:
+            self.backends[name].trial_running = False
+            return None, e
+        except Exception as e:
+            print(f"❌ {name} call failed: {e}")
+            result = None
+        self.backends[name].record(time.perf_counter() - started, result is not None)
+        return result, None
+
+    async def acall(self, candidates, call, hedge=False):
+        """call() for coroutines: await call(name) with the same ranking, failover and hedging"""
+        neutral = None
+        queue = self.rank(candidates)
+        name = self._next(queue)
+        if name is None:
+            raise NoBackendAvailable(f"No backend available among {', '.join(candidates)}")
+
+        # A losing hedge is left to finish in the background so its stats still count
+        running = {asyncio.ensure_future(self._timed_acall(name, call)): name}
+        while running:
+            timeout = None
+            if hedge and queue and len(running) == 1:
+                timeout = self.backends[name].percentile(90)
+
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedge_name = self._next(queue)
+                if hedge_name:
+                    self.hedges += 1
+                    running[asyncio.ensure_future(self._timed_acall(hedge_name, call))] = hedge_name
+                continue
+
+            for task in done:
+                finished = running.pop(task)
+                result, error = task.result()
+                if result is not None:
+                    return finished, result
+                neutral = error or neutral
+
+            if not running:
+                name = self._next(queue)
+                if name:
+                    self.failovers += 1
+                    running[asyncio.ensure_future(self._timed_acall(name, call))] = name
+
+        if neutral is not None:
+            raise neutral
+        return None, None
+
+    def stats(self):
+        return {
+            'hedges': self.hedges,
+            'failovers': self.failovers,
+            'backends': {name: backend.to_dict() for name, backend in self.backends.items()}
+        }
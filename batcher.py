@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Micro-Batching Scheduler
+Collects concurrent requests for a short window and runs them as one batch
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """Groups submissions by key and calls run_batch(key, items) once per group
+
+    run_batch must return one result per item, in order. It always runs on the
+    batcher's own thread, so only one batch executes at a time.
+    """
+
+    def __init__(self, run_batch, window=0.1, max_batch=4, name='batcher'):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.name = name
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self.batches_run = 0
+        self.items_run = 0
+
+    def _ensure_thread(self):
+        # Threads don't survive fork, so start lazily in the serving process
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._loop, name=self.name, daemon=True).start()
+
+    def submit(self, key, item):
+        """Queue an item and return a Future for its result"""
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((key, item, future))
+        return future
+
+    def _collect(self):
+        key, item, future = self._queue.get()
+        groups = {key: [(item, future)]}
+        deadline = time.monotonic() + self.window
+
+        while len(groups[key]) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                other_key, other_item, other_future = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            groups.setdefault(other_key, []).append((other_item, other_future))
+
+        return groups
+
+    def _loop(self):
+        while True:
+            groups = self._collect()
+            for key, entries in groups.items():
+                for start in range(0, len(entries), self.max_batch):
+                    self._run(key, entries[start:start + self.max_batch])
+
+    def _run(self, key, entries):
+        items = [item for item, _ in entries]
+        try:
+            results = self.run_batch(key, items)
+            if len(results) != len(items):
+                raise RuntimeError(f"run_batch returned {len(results)} results for {len(items)} items")
+        except Exception as e:
+            for _, future in entries:
+                future.set_exception(e)
+            return
+
+        self.batches_run += 1
+        self.items_run += len(items)
+        for (_, future), result in zip(entries, results):
+            future.set_result(result)
+
+    def stats(self):
+        return {
+            'window_ms': int(self.window * 1000),
+            'max_batch': self.max_batch,
+            'pending': self._queue.qsize(),
+            'batches_run': self.batches_run,
+            'items_run': self.items_run,
+            'avg_batch_size': round(self.items_run / self.batches_run, 2) if self.batches_run else 0
+        }
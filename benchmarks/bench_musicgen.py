@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+MusicGen Microbenchmark
+Measures tokens/s and real-time factor of model.generate on a tiny randomly-initialized MusicGen
+
+The tiny model keeps the real architecture (T5 text encoder, delayed-codebook
+decoder, EnCodec audio decoder) so relative changes to the generation path
+show up without downloading weights. Pass --real to time facebook/musicgen-small.
+
+Usage:
+  python benchmarks/bench_musicgen.py
+  python benchmarks/bench_musicgen.py --mode int8 --batch-sizes 1,4 --seconds 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def tiny_model():
+    """Randomly-initialized MusicGen with the small model's audio geometry"""
+    from transformers import (
+        EncodecConfig, MusicgenConfig, MusicgenDecoderConfig, MusicgenForConditionalGeneration, T5Config
+    )
+
+    codebook_size = 64
+    text_encoder = T5Config(vocab_size=256, d_model=64, d_ff=128, d_kv=16, num_layers=2, num_heads=4)
+    audio_encoder = EncodecConfig(
+        sampling_rate=32000,
+        audio_channels=1,
+        hidden_size=32,
+        num_filters=8,
+        upsampling_ratios=[8, 5, 4, 4],  # 640x hop -> 50 frames/s like musicgen-small
+        codebook_size=codebook_size,
+        codebook_dim=32,
+        target_bandwidths=[2.2],  # 4 codebooks
+    )
+    decoder = MusicgenDecoderConfig(
+        vocab_size=codebook_size,
+        hidden_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        ffn_dim=128,
+        num_codebooks=4,
+        pad_token_id=codebook_size,
+        bos_token_id=codebook_size,
+        decoder_start_token_id=codebook_size,
+        tie_word_embeddings=False,
+    )
+    config = MusicgenConfig.from_sub_models_config(text_encoder, audio_encoder, decoder)
+    model = MusicgenForConditionalGeneration(config)
+    model.generation_config.pad_token_id = codebook_size
+    model.generation_config.decoder_start_token_id = codebook_size
+    return model.eval()
+
+
+def make_inputs(batch_size, vocab_size, seq_len=24):
+    import torch
+
+    return {
+        'input_ids': torch.randint(0, vocab_size, (batch_size, seq_len)),
+        'attention_mask': torch.ones(batch_size, seq_len, dtype=torch.long)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MusicGen generate() microbenchmark')
+    parser.add_argument('--mode', default=None, help='MUSICGEN_CPU_MODE to test: fp32, int8 or bf16')
+    parser.add_argument('--seconds', type=float, default=5, help='Seconds of audio per generation')
+    parser.add_argument('--batch-sizes', default='1,2,4', help='Comma-separated batch sizes')
+    parser.add_argument('--repeats', type=int, default=3, help='Timed runs per batch size')
+    parser.add_argument('--real', action='store_true', help='Use facebook/musicgen-small instead of the tiny model')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    if args.mode:
+        os.environ['MUSICGEN_CPU_MODE'] = args.mode
+
+    # Imported after MUSICGEN_CPU_MODE is set so the requested mode applies
+    import torch
+    import cpu_inference
+
+    cpu_inference.configure_threads()
+    if args.real:
+        import model_pool
+        model, processor = model_pool.get_model('facebook/musicgen-small')
+        vocab_size = processor.tokenizer.vocab_size
+    else:
+        model = cpu_inference.optimize_for_cpu(tiny_model())
+        vocab_size = model.config.text_encoder.vocab_size
+
+    frame_rate = model.config.audio_encoder.frame_rate
+    max_new_tokens = int(args.seconds * frame_rate)
+    mode = cpu_inference.active_mode(model)
+    print(f"🎛 {'musicgen-small' if args.real else 'tiny MusicGen'} | mode {mode} | "
+          f"{args.seconds}s = {max_new_tokens} tokens | threads {torch.get_num_threads()}")
+    print(f"{'batch':>5} {'gen s':>8} {'tokens/s':>10} {'RTF':>7} {'audio s/s':>10}")
+
+    results = []
+    for batch_size in [int(size) for size in args.batch_sizes.split(',')]:
+        inputs = make_inputs(batch_size, vocab_size)
+
+        # Warm-up run so one-off allocation and kernel selection aren't timed
+        with cpu_inference.inference_context(model):
+            model.generate(**inputs, max_new_tokens=frame_rate // 5 or 1, do_sample=True, guidance_scale=3.0)
+
+        timings = []
+        for _ in range(args.repeats):
+            started = time.perf_counter()
+            with cpu_inference.inference_context(model):
+                model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=True, guidance_scale=3.0)
+            timings.append(time.perf_counter() - started)
+
+        elapsed = sorted(timings)[len(timings) // 2]  # Median
+        result = {
+            'batch_size': batch_size,
+            'mode': mode,
+            'generate_seconds': round(elapsed, 3),
+            'tokens_per_second': round(max_new_tokens * batch_size / elapsed, 1),
+            'real_time_factor': round(elapsed / args.seconds, 3),
+            'audio_seconds_per_second': round(args.seconds * batch_size / elapsed, 2)
+        }
+        results.append(result)
+        print(f"{batch_size:>5} {result['generate_seconds']:>8} {result['tokens_per_second']:>10} "
+              f"{result['real_time_factor']:>7} {result['audio_seconds_per_second']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'config': vars(args), 'results': results}, output, indent=2)
+        print(f"💾 Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
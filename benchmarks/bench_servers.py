@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Generator Server Benchmark
+Starts each app against the fake upstream and drives /generate at fixed concurrency levels
+
+Usage:
+  python benchmarks/bench_servers.py
+  python benchmarks/bench_servers.py --targets suno,multi --concurrency 1,8,32 --latency 0.5
+  python benchmarks/bench_servers.py --targets musicgen --concurrency 1,4 --requests 2
+  python benchmarks/bench_servers.py --targets real_udio,async_real_udio --concurrency 16,256 --finish-after 5
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_upstream import start_fake_upstream, upstream_env
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run an app without the debug reloader so the measured pid is the one serving
+RUNNER = """
+import logging, sys
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+module = __import__(sys.argv[1])
+module.app.run(host='127.0.0.1', port=int(sys.argv[2]), debug=False, threaded=True)
+"""
+
+# Run one backend of the async proxy under uvicorn
+ASGI_RUNNER = """
+import sys, uvicorn
+from async_proxy_server import build_app
+uvicorn.run(build_app(sys.argv[1]), host='127.0.0.1', port=int(sys.argv[2]), log_level='warning')
+"""
+
+TARGETS = {
+    'simple': {'module': 'simple_server', 'payload': {'auth_token': 'bench'}},
+    'quiet': {'module': 'quiet_server', 'payload': {'auth_token': 'bench'}},
+    'demo': {'module': 'demo_server', 'payload': {}},
+    'udio': {'module': 'udio_server', 'payload': {'auth_token': 'bench-token-0123456789'}},
+    'real_udio': {'module': 'real_udio_server', 'payload': {'auth_token': 'bench-token-0123456789'}, 'jobs': True},
+    'suno': {'module': 'suno_server', 'payload': {'api_key': 'bench-key-0123456789'}},
+    'multi': {'module': 'multi_service_server', 'payload': {'service': 'suno', 'api_key': 'bench-key-0123456789'}},
+    'musicgen': {'module': 'musicgen_server', 'payload': {'duration': 5}, 'heavy': True, 'jobs': True},
+    'simple_musicgen': {'module': 'simple_musicgen_server', 'payload': {'duration': 5}, 'heavy': True},
+    'async_udio': {'asgi': 'udio', 'payload': {'auth_token': 'bench-token-0123456789'}},
+    'async_real_udio': {'asgi': 'real_udio', 'payload': {'auth_token': 'bench-token-0123456789'}, 'jobs': True},
+    'async_suno': {'asgi': 'suno', 'payload': {'api_key': 'bench-key-0123456789'}},
+    'async_multi': {'asgi': 'multi', 'payload': {'service': 'suno', 'api_key': 'bench-key-0123456789'}},
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def rss_mb(pid):
+    """Resident set size of a process from /proc (Linux only)"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def target_name(target):
+    return f"async_proxy_server ({target['asgi']})" if target.get('asgi') else target['module']
+
+
+def start_server(target, port, env):
+    if target.get('asgi'):
+        command = [sys.executable, '-c', ASGI_RUNNER, target['asgi'], str(port)]
+    else:
+        command = [sys.executable, '-c', RUNNER, target['module'], str(port)]
+    process = subprocess.Popen(
+        command,
+        cwd=REPO_ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + (900 if target.get('heavy') else 30)
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{target_name(target)} exited with code {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/health', timeout=1).status_code == 200:
+                return process, base_url
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"{target_name(target)} did not become healthy")
+
+
+def run_request(session, base_url, target, index, same_prompt):
+    payload = dict(target['payload'], style='minimal')
+    payload['prompt'] = 'benchmark' if same_prompt else f'benchmark {index}'
+
+    started = time.perf_counter()
+    response = session.post(f'{base_url}/generate', json=payload, timeout=600)
+    ok = response.status_code < 300
+
+    if ok and target.get('jobs') and response.status_code == 202:
+        # Queued generation - wait for the job so latency is end to end
+        status_url = base_url + response.json()['status_url']
+        while True:
+            job = session.get(status_url, timeout=30).json()
+            if job['status'] in ('completed', 'failed'):
+                ok = job['status'] == 'completed'
+                break
+            time.sleep(0.25)
+
+    return time.perf_counter() - started, ok, response.status_code
+
+
+def run_level(base_url, target, concurrency, total, same_prompt):
+    local = threading.local()
+
+    def one(index):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        try:
+            return run_request(local.session, base_url, target, index, same_prompt)
+        except requests.exceptions.RequestException:
+            return None, False, 'error'
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies = [latency for latency, ok, _ in results if ok]
+    statuses = {}
+    for _, _, status in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'ok': len(latencies),
+        'errors': total - len(latencies),
+        'statuses': statuses,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None
+    }
+
+
+def print_row(name, level):
+    print(f"{name:<16} {level['concurrency']:>5} {level['ok']:>5}/{level['requests']:<5} "
+          f"{level['p50_ms'] or '-':>9} {level['p95_ms'] or '-':>9} {level['p99_ms'] or '-':>9} "
+          f"{level['throughput_rps'] or '-':>8} {level['rss_mb'] or '-':>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the TECHNO generator servers')
+    parser.add_argument('--targets', default=','.join(name for name, t in TARGETS.items() if not t.get('heavy')),
+                        help=f"Comma-separated list from: {', '.join(TARGETS)}")
+    parser.add_argument('--concurrency', default='1,4,16', help='Comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=8, help='Requests per unit of concurrency')
+    parser.add_argument('--latency', type=float, default=0.2, help='Fake upstream mean latency (s)')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Fake upstream latency stddev (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fake upstream 500 rate')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fake upstream 429 rate')
+    parser.add_argument('--finish-after', type=float, default=0.0, help='Seconds until fake tracks finish')
+    parser.add_argument('--same-prompt', action='store_true', help='Send identical prompts (cache/dedupe path)')
+    parser.add_argument('--port', type=int, default=5900, help='First port to run apps on')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    upstream = start_fake_upstream(
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, finish_after=args.finish_after
+    )
+    cache_dir = tempfile.mkdtemp(prefix='techno_bench_cache_')
+    env = dict(os.environ, **upstream_env(upstream), GENERATION_CACHE_DIR=cache_dir)
+    # Every benchmark request shares one API key; measure the servers, not the per-key limiter
+    for setting in ('UPSTREAM_RATE', 'UPSTREAM_BURST', 'UPSTREAM_MAX_CONCURRENCY'):
+        env.setdefault(setting, '10000')
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    print(f"🎭 Fake upstream: latency {args.latency}s ±{args.jitter}s, "
+          f"errors {args.error_rate:.0%}, 429s {args.rate_limit_rate:.0%}")
+    print(f"{'target':<16} {'conc':>5} {'ok/total':>11} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'req/s':>8} {'RSS MB':>8}")
+    print("-" * 82)
+
+    results = {}
+    for offset, name in enumerate(args.targets.split(',')):
+        target = TARGETS[name]
+        try:
+            process, base_url = start_server(target, args.port + offset, env)
+        except RuntimeError as e:
+            print(f"{name:<16} ❌ {e}")
+            continue
+
+        results[name] = {'idle_rss_mb': rss_mb(process.pid), 'levels': []}
+        try:
+            for concurrency in levels:
+                level = run_level(base_url, target, concurrency, concurrency * args.requests, args.same_prompt)
+                level['rss_mb'] = rss_mb(process.pid)
+                results[name]['levels'].append(level)
+                print_row(name, level)
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+
+    print(f"\n📡 Upstream requests served: {upstream.requests}")
+    upstream.shutdown()
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump({'config': vars(args), 'results': results}, output, indent=2)
+        print(f"💾 Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
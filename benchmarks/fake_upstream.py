@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Fake Upstream for Benchmarks
+Local stand-in for the Suno, Udio, Replicate and Muzic APIs with configurable latency and errors
+
+Point the servers at it with:
+  SUNO_API_BASE=http://127.0.0.1:9000/v1
+  MUZIC_API_BASE=http://127.0.0.1:9000/v1
+  REPLICATE_API_BASE=http://127.0.0.1:9000/v1
+  UDIO_API_BASE=http://127.0.0.1:9000/api
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+DEMO_AUDIO = 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav'
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real APIs
+
+    def log_message(self, format, *args):
+        pass
+
+    def _delay(self):
+        config = self.server.config
+        latency = max(0.0, random.gauss(config['latency'], config['jitter']))
+        time.sleep(latency)
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def _fail_randomly(self):
+        config = self.server.config
+        roll = random.random()
+        if roll < config['rate_limit_rate']:
+            self._send(429, {'error': 'rate limited'}, {'Retry-After': '1'})
+            return True
+        if roll < config['rate_limit_rate'] + config['error_rate']:
+            self._send(500, {'error': 'upstream error'})
+            return True
+        return False
+
+    def _count(self):
+        with self.server.lock:
+            self.server.requests += 1
+
+    def _register(self, *track_ids):
+        with self.server.lock:
+            for track_id in track_ids:
+                self.server.created[track_id] = time.time()
+
+    def _finished(self, track_id):
+        created = self.server.created.get(track_id, 0)
+        return time.time() - created >= self.server.config['finish_after']
+
+    def do_GET(self):
+        self._count()
+        url = urlparse(self.path)
+
+        if url.path.endswith('/health'):
+            if self.server.config['healthy']:
+                self._send(200, {'status': 'ok'})
+            else:
+                self._send(503, {'status': 'down'})
+            return
+
+        self._delay()
+        if self._fail_randomly():
+            return
+
+        if url.path.startswith('/v1/tracks/'):
+            # Suno track status
+            track_id = url.path.rsplit('/', 1)[-1]
+            finished = self._finished(track_id)
+            self._send(200, {
+                'id': track_id,
+                'status': 'complete' if finished else 'processing',
+                'audio_url': DEMO_AUDIO if finished else None
+            })
+        elif url.path == '/api/songs':
+            # Udio batched song status
+            song_ids = parse_qs(url.query).get('songIds', [''])[0].split(',')
+            self._send(200, {'songs': [{
+                'id': song_id,
+                'title': 'Fake Udio TECHNO',
+                'finished': self._finished(song_id),
+                'song_path': DEMO_AUDIO if self._finished(song_id) else None,
+                'duration_seconds': 32,
+                'created_at': time.time()
+            } for song_id in song_ids if song_id]})
+        else:
+            self._send(404, {'error': f'Unknown path: {url.path}'})
+
+    def do_POST(self):
+        self._count()
+        url = urlparse(self.path)
+        self._read_body()
+        self._delay()
+        if self._fail_randomly():
+            return
+
+        track_id = uuid.uuid4().hex
+        self._register(track_id)
+        if url.path == '/v1/generate':
+            # Suno and Muzic
+            self._send(200, {
+                'id': track_id,
+                'status': 'processing',
+                'audio_url': DEMO_AUDIO,
+                'created_at': time.time()
+            })
+        elif url.path == '/v1/predictions':
+            # Replicate
+            self._send(201, {'id': track_id, 'status': 'starting', 'created_at': time.time()})
+        elif url.path == '/api/generate-proxy':
+            # Udio returns two tracks per generation
+            second_id = uuid.uuid4().hex
+            self._register(second_id)
+            self._send(200, {'track_ids': [track_id, second_id]})
+        else:
+            self._send(404, {'error': f'Unknown path: {url.path}'})
+
+
+class FakeUpstreamServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # Async clients open many connections at once; don't drop SYNs
+
+
+def start_fake_upstream(port=0, latency=0.2, jitter=0.05, error_rate=0.0, rate_limit_rate=0.0, finish_after=0.0):
+    """Start the fake upstream on a background thread and return the server
+
+    Tracks report as finished finish_after seconds after they were created.
+    Set server.config['healthy'] = False to make /health answer 503.
+    """
+    server = FakeUpstreamServer(('127.0.0.1', port), FakeUpstreamHandler)
+    server.config = {
+        'latency': latency,
+        'jitter': jitter,
+        'error_rate': error_rate,
+        'rate_limit_rate': rate_limit_rate,
+        'finish_after': finish_after,
+        'healthy': True
+    }
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.created = {}
+    threading.Thread(target=server.serve_forever, name='fake-upstream', daemon=True).start()
+    return server
+
+
+def upstream_env(server):
+    """Environment variables that point every server at this fake upstream"""
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    return {
+        'SUNO_API_BASE': f'{base}/v1',
+        'MUZIC_API_BASE': f'{base}/v1',
+        'REPLICATE_API_BASE': f'{base}/v1',
+        'UDIO_API_BASE': f'{base}/api'
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Suno/Udio/Replicate upstream')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', type=float, default=0.2, help='Mean response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.05, help='Latency standard deviation in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction answered with 429')
+    parser.add_argument('--finish-after', type=float, default=0.0, help='Seconds until tracks report finished')
+    args = parser.parse_args()
+
+    server = start_fake_upstream(
+        args.port, args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.finish_after
+    )
+    print(f"🎭 Fake upstream on http://127.0.0.1:{args.port}")
+    for name, value in upstream_env(server).items():
+        print(f"   {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
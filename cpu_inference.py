@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+CPU Inference Tuning for MusicGen
+Thread settings, int8 dynamic quantization, bf16 autocast and real-time factor tracking
+
+MUSICGEN_CPU_MODE selects the CPU path:
+  fp32 - full precision (default, same as before)
+  int8 - dynamic int8 quantization of the decoder's Linear layers
+  bf16 - bfloat16 autocast, on CPUs with native bf16 support
+MUSICGEN_THREADS / MUSICGEN_INTEROP_THREADS set torch intra/inter-op threads
+per worker process.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+import torch
+
+CPU_MODE = os.environ.get('MUSICGEN_CPU_MODE', 'fp32')
+
+_stats_lock = threading.Lock()
+_stats = {'generations': 0, 'generate_seconds': 0.0, 'audio_seconds': 0.0, 'last_rtf': None}
+_active = 0  # Threads currently inside inference_context
+
+
+def configure_threads():
+    """Apply thread settings; call before any torch work in the process"""
+    intra_op = os.environ.get('MUSICGEN_THREADS')
+    inter_op = os.environ.get('MUSICGEN_INTEROP_THREADS')
+    if intra_op:
+        torch.set_num_threads(int(intra_op))
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(int(inter_op))
+        except RuntimeError as e:
+            # Only allowed once, before inter-op parallel work has started
+            print(f"⚠ Could not set inter-op threads: {e}")
+    return {'intra_op': torch.get_num_threads(), 'inter_op': torch.get_num_interop_threads()}
+
+
+def bf16_supported():
+    """Whether this CPU has native bfloat16 kernels"""
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def active_mode(model):
+    """The mode actually in effect for a loaded model"""
+    if model.device.type != 'cpu':
+        return model.device.type
+    if CPU_MODE == 'bf16' and not bf16_supported():
+        return 'fp32'
+    return CPU_MODE
+
+
+def optimize_for_cpu(model):
+    """Quantize the decoder in place when running int8 on CPU"""
+    if model.device.type != 'cpu':
+        return model
+    if CPU_MODE == 'int8':
+        print("⚡ Applying int8 dynamic quantization to MusicGen decoder")
+        torch.ao.quantization.quantize_dynamic(
+            model.decoder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+    elif CPU_MODE == 'bf16' and not bf16_supported():
+        print("⚠ bf16 requested but not supported on this CPU - using fp32")
+    return model
+
+
+@contextmanager
+def inference_context(model):
+    """inference_mode plus bf16 autocast when enabled"""
+    global _active
+    with _stats_lock:
+        _active += 1
+    try:
+        with torch.inference_mode():
+            if active_mode(model) == 'bf16':
+                with torch.autocast('cpu', dtype=torch.bfloat16):
+                    yield
+            else:
+                yield
+    finally:
+        with _stats_lock:
+            _active -= 1
+
+
+def active_inference():
+    """Inference calls running in this process, for background work that should yield to them"""
+    with _stats_lock:
+        return _active
+
+
+def record_generation(elapsed, audio_seconds):
+    """Track a generation and return its real-time factor (<1 is faster than real time)"""
+    rtf = elapsed / audio_seconds if audio_seconds else None
+    with _stats_lock:
+        _stats['generations'] += 1
+        _stats['generate_seconds'] += elapsed
+        _stats['audio_seconds'] += audio_seconds
+        _stats['last_rtf'] = round(rtf, 3) if rtf is not None else None
+    return rtf
+
+
+def inference_stats(model=None):
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['mean_rtf'] = (
+        round(stats['generate_seconds'] / stats['audio_seconds'], 3) if stats['audio_seconds'] else None
+    )
+    stats['generate_seconds'] = round(stats['generate_seconds'], 1)
+    stats['audio_seconds'] = round(stats['audio_seconds'], 1)
+    stats['cpu_mode'] = active_mode(model) if model is not None else CPU_MODE
+    stats['threads'] = {'intra_op': torch.get_num_threads(), 'inter_op': torch.get_num_interop_threads()}
+    return stats
@@ -2,6 +2,15 @@
 """
 Simple Demo Server with Working TECHNO Generation
 Uses alternative free services for real music generation
+
+With MusicGen installed, requests without a custom prompt are served
+instantly from a pool of pre-generated tracks per style (see style_pool.py).
+A background producer keeps the pool stocked at idle priority. Importing
+the app (e.g. from the gateway) never starts it: `python demo_server.py`
+and `launcher.py demo` do, and anything else can opt in.
+
+Settings:
+  STYLE_POOL_PRODUCER - 1 to run the pool producer in the serving workers (default 0)
 """
 
 from flask import Flask, request, jsonify
@@ -11,8 +20,29 @@ import time
 import random
 import os
 
+import audio_store
+import metrics
+import track_catalog
+from style_pool import pool_from_env
+
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app, 'demo')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+
+# MusicGen is optional here; without it every request gets a demo track
+try:
+    import torch
+    import torchaudio
+    import transformers
+    musicgen_available = True
+except ImportError:
+    musicgen_available = False
+
+MUSICGEN_MODEL = "facebook/musicgen-small"
+DEFAULT_PROMPT = 'TECHNO'
 
 # TECHNO styles
 TECHNO_STYLES = {
@@ -34,6 +64,77 @@ DEMO_TRACKS = {
     'industrial': 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav'
 }
 
+def create_techno_prompt(style, user_prompt):
+    return f"{TECHNO_STYLES[style]}, {user_prompt}, electronic dance music, instrumental"
+
+def generate_stock(style, seed, path):
+    """Style pool producer: one MusicGen track for the style's default prompt
+
+    Stops early and returns False as soon as another generation starts in
+    this process, so the pool never holds up a real request.
+    """
+    import model_pool
+    from transformers import StoppingCriteria
+    from cpu_inference import active_inference, inference_context
+    from encoder_cache import encoder_cache_from_env
+    from seeded_sampling import sampling_kwargs
+
+    class YieldToRequests(StoppingCriteria):
+        yielded = False
+
+        def __call__(self, input_ids, scores, **kwargs):
+            # This generation counts as one; anything more is someone waiting on the CPU
+            self.yielded = self.yielded or active_inference() > 1
+            return torch.full((input_ids.shape[0],), self.yielded, dtype=torch.bool, device=input_ids.device)
+
+    model, processor = model_pool.get_model(MUSICGEN_MODEL)
+    inputs = processor(text=[create_techno_prompt(style, DEFAULT_PROMPT)], padding=True, return_tensors="pt")
+    device = next(model.parameters()).device
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+    encoder_cache = encoder_cache_from_env()
+    inputs = encoder_cache.conditioning(model, inputs, 3.0)
+
+    criteria = YieldToRequests()
+    with inference_context(model), metrics.stage('generate'):
+        audio_values = encoder_cache.generate(
+            model,
+            inputs,
+            max_new_tokens=style_pool.duration * 50,
+            guidance_scale=3.0,
+            stopping_criteria=[criteria],
+            **sampling_kwargs(model, seed)
+        )
+    if criteria.yielded:
+        return False
+
+    sample_rate = model.config.audio_encoder.sample_rate
+    audio = audio_values[0, 0, :style_pool.duration * sample_rate].float().cpu()
+    with metrics.stage('save'):
+        torchaudio.save(path, audio.unsqueeze(0), sample_rate)
+    return True
+
+def musicgen_busy():
+    """Whether a MusicGen generation is running in this process (e.g. behind the gateway)"""
+    from cpu_inference import active_inference
+    return active_inference() > 0
+
+# Ready-made tracks per style for instant answers; audio is served from /audio/<id>
+style_pool = pool_from_env(generate_stock, TECHNO_STYLES, busy=musicgen_busy, enabled=musicgen_available)
+audio_files = audio_store.store_from_env()
+# Generating stock costs minutes of CPU, so only servers that ask for it produce
+PRODUCE_STOCK = os.environ.get('STYLE_POOL_PRODUCER') == '1'
+
+# Read when /metrics is rendered
+if style_pool.enabled:
+    for pool_style in TECHNO_STYLES:
+        metrics.POOL_STOCK.set_function(lambda pool_style=pool_style: style_pool.count(pool_style), style=pool_style)
+
+@app.before_request
+def ensure_style_pool():
+    # Starts the producer thread in each serving process (threads don't survive fork)
+    if PRODUCE_STOCK:
+        style_pool.start()
+
 def try_free_music_api(prompt, style):
     """Try free music generation APIs"""
     
@@ -75,7 +176,14 @@ def home():
 
 @app.route('/health')
 def health():
-    return jsonify({'status': 'healthy', 'service': 'demo-techno-generator'})
+    return jsonify({
+        'status': 'healthy',
+        'service': 'demo-techno-generator',
+        'musicgen_available': musicgen_available,
+        'style_pool': style_pool.stats(),
+        'audio': audio_files.stats(),
+        'track_catalog': catalog.stats()
+    })
 
 @app.route('/test', methods=['POST'])
 def test_api():
@@ -100,10 +208,36 @@ def generate_techno():
         data = request.get_json()
         
         style = data.get('style', 'minimal')
-        user_prompt = data.get('prompt', 'TECHNO')
+        user_prompt = (data.get('prompt') or '').strip() or DEFAULT_PROMPT
         
         # Create TECHNO prompt
-        full_prompt = f"{TECHNO_STYLES[style]}, {user_prompt}, electronic dance music, instrumental"
+        full_prompt = create_techno_prompt(style, user_prompt)
+        
+        # The most common request - a style with no prompt of its own - comes straight from stock
+        if user_prompt == DEFAULT_PROMPT:
+            path = audio_files.new_path('.wav')
+            seed = style_pool.claim(style, path)
+            if seed is not None:
+                audio_files.prepare(path)
+                audio_id = audio_files.audio_id(path)
+                track = catalog.add({
+                    'id': track_catalog.new_track_id('demo'),
+                    'title': f'{style.title()} TECHNO - {user_prompt}',
+                    'audio_id': audio_id,
+                    **audio_files.track_urls(audio_id),
+                    'style': style,
+                    'prompt': full_prompt,
+                    'seed': seed,
+                    'status': 'generated',
+                    'service': 'MusicGen AI (instant)',
+                    'duration': f'{style_pool.duration} seconds'
+                }, 'demo')
+                return jsonify({
+                    'success': True,
+                    'track': track,
+                    'message': f'{style.title()} TECHNO served instantly from the pre-generated pool',
+                    'instant': True
+                })
         
         print(f"🎵 Generating {style} TECHNO demo...")
         print(f"📝 Prompt: {full_prompt}")
@@ -114,21 +248,21 @@ def generate_techno():
         # Try free API or return demo
         result = try_free_music_api(full_prompt, style)
         
-        track_id = f'demo_{style}_{int(time.time())}'
+        track = catalog.add({
+            'id': track_catalog.new_track_id('demo'),
+            'title': f'{style.title()} TECHNO - {user_prompt}',
+            'audio_url': result['audio_url'],
+            'style': style,
+            'prompt': full_prompt,
+            'status': 'generated',
+            'service': result['service'],
+            'duration': '20 seconds',
+            'note': 'Demo version - upgrade for full AI generation'
+        }, 'demo')
         
         return jsonify({
             'success': True,
-            'track': {
-                'id': track_id,
-                'title': f'{style.title()} TECHNO - {user_prompt}',
-                'audio_url': result['audio_url'],
-                'style': style,
-                'prompt': full_prompt,
-                'status': 'generated',
-                'service': result['service'],
-                'duration': '20 seconds',
-                'note': 'Demo version - upgrade for full AI generation'
-            },
+            'track': track,
             'message': f'Demo {style} TECHNO generated successfully!',
             'upgrade_info': {
                 'for_real_generation': 'Use Suno AI, Replicate, or MusicGen APIs',
@@ -143,6 +277,11 @@ def generate_techno():
             'type': type(e).__name__
         }), 500
 
+@app.route('/audio/<audio_id>')
+def serve_audio(audio_id):
+    """Pre-generated audio with Range support"""
+    return audio_files.send(audio_id)
+
 @app.route('/upgrade_info')
 def upgrade_info():
     """Information about real AI music generation options"""
@@ -193,7 +332,11 @@ if __name__ == '__main__':
     print("🎛 Styles:", list(TECHNO_STYLES.keys()))
     print("✅ No API key required")
     print("🎧 Demo tracks ready for all styles")
+    if style_pool.enabled:
+        print(f"⚡ Instant mode: {style_pool.stock} pre-generated MusicGen tracks per style")
     print("💡 Check /upgrade_info for real AI generation options")
     print("=" * 60)
+    PRODUCE_STOCK = True
+    style_pool.start()
     
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
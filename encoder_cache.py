@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+MusicGen Prompt Encoder Cache
+Keeps T5 encoder outputs for recent prompts so generate() skips the text encoder
+
+Every prompt starts with one of a handful of long TECHNO_STYLES strings and
+popular prompts repeat, so the same token sequences go through the text
+encoder again and again. EncoderCache keeps the encoder's hidden states per
+exact token sequence (least recently used first out) and hands
+model.generate the encoder_outputs and attention mask it would otherwise
+compute itself.
+
+With classifier-free guidance MusicGen pairs every prompt with an
+unconditional branch: all-zero hidden states under an all-zero mask. That
+buffer is allocated once per model and sliced to each batch's width.
+
+Prompts seen more than once also keep the decoder's cross-attention keys and
+values, which only depend on the encoder output. They are handed to
+model.generate as a pre-filled past_key_values, so the first decoding step
+no longer projects the prompt in every layer and the projections are not
+reallocated on each request. Within one generate call transformers already
+reuses them, so this saves per-request work rather than per-step work.
+Cross-attention entries are much larger than hidden states (about 12 MB per
+prompt for musicgen-small), so they have their own memory budget.
+
+Run generation through EncoderCache.generate. If a model's generate()
+rejects the cached encoder_outputs or past_key_values (e.g. after a
+transformers upgrade), it is retried once with the plain inputs and that
+model bypasses the cache from then on, instead of failing every request.
+
+Settings:
+  MUSICGEN_ENCODER_CACHE      - prompts kept per process (default 256, 0 disables)
+  MUSICGEN_CROSS_KV_CACHE_MB  - memory for cross-attention keys/values (default 256, 0 disables)
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+
+import metrics
+from cpu_inference import inference_context
+
+
+class EncoderCache:
+    """LRU of text-encoder hidden states keyed on (model, token ids)"""
+
+    def __init__(self, max_entries=256, kv_max_bytes=256 * 2**20):
+        self.max_entries = max_entries
+        self.kv_max_bytes = kv_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.kv_hits = 0
+        self.kv_evicted = 0
+        self._entries = OrderedDict()  # (model id, token ids) -> (tokens, hidden) tensor
+        self._null = {}  # model id -> zero hidden states for the unconditional branch
+        self._bytes = 0
+        self._kv = OrderedDict()  # (model id, token ids) -> [(keys, values)] per decoder layer
+        self._null_kv = {}  # model id -> cross-attention keys/values of the unconditional branch
+        self._kv_bytes = 0
+        self._kv_unsupported = set()
+        self._unsupported = set()  # model ids whose generate() rejected the cached inputs
+        self._lock = threading.Lock()
+
+    def _lookup(self, keys):
+        with self._lock:
+            states = []
+            for key in keys:
+                state = self._entries.get(key)
+                if state is None:
+                    self.misses += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                states.append(state)
+            return states
+
+    def _store(self, key, state):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = state
+            self._bytes += state.numel() * state.element_size()
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.numel() * evicted.element_size()
+
+    def _unconditional(self, model, like):
+        """Zero hidden states shaped like `like`, from one buffer per model"""
+        with self._lock:
+            null = self._null.get(id(model))
+            if null is None or null.shape[1] < like.shape[1] or null.dtype != like.dtype:
+                null = torch.zeros(1, like.shape[1], like.shape[2], dtype=like.dtype, device=like.device)
+                self._null[id(model)] = null
+        return null[:, :like.shape[1]].expand(like.shape[0], -1, -1)
+
+    def _kv_lookup(self, keys):
+        with self._lock:
+            entries = []
+            for key in keys:
+                entry = self._kv.get(key)
+                if entry is not None:
+                    self._kv.move_to_end(key)
+                    self.kv_hits += 1
+                entries.append(entry)
+            return entries
+
+    def _kv_store(self, key, entry):
+        size = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in entry)
+        if size > self.kv_max_bytes:
+            return
+        with self._lock:
+            if key in self._kv:
+                return
+            self._kv[key] = entry
+            self._kv_bytes += size
+            while self._kv_bytes > self.kv_max_bytes:
+                _, evicted = self._kv.popitem(last=False)
+                self._kv_bytes -= sum(k.numel() * k.element_size() + v.numel() * v.element_size()
+                                      for k, v in evicted)
+                self.kv_evicted += 1
+
+    def _project(self, model, hidden, mask):
+        """Cross-attention keys and values per decoder layer, as MusicGen's forward computes them"""
+        config = model.decoder.config
+        with metrics.stage('encode'), inference_context(model):
+            if (model.text_encoder.config.hidden_size != config.hidden_size
+                    and config.cross_attention_hidden_size is None):
+                hidden = model.enc_to_dec_proj(hidden)
+            hidden = hidden * mask[..., None]
+            shape = (hidden.shape[0], hidden.shape[1], config.num_attention_heads, -1)
+            entry = []
+            for layer in model.decoder.model.decoder.layers:
+                attn = layer.encoder_attn
+                entry.append((
+                    attn.k_proj(hidden).view(shape).transpose(1, 2).contiguous(),
+                    attn.v_proj(hidden).view(shape).transpose(1, 2).contiguous()
+                ))
+        return entry
+
+    def _unconditional_kv(self, model, dim):
+        with self._lock:
+            entry = self._null_kv.get(id(model))
+        if entry is None:
+            param = next(model.parameters())
+            device = param.device
+            zeros = torch.zeros(1, 1, dim, dtype=param.dtype, device=device)
+            entry = self._project(model, zeros, torch.zeros(1, 1, dtype=torch.long, device=device))
+            with self._lock:
+                self._null_kv[id(model)] = entry
+        return entry
+
+    def _cross_attention_cache(self, model, keys, states, hot, guidance):
+        """past_key_values with cross-attention filled in, or None to let generate compute it"""
+        if not self.kv_max_bytes or id(model) in self._kv_unsupported or not all(hot):
+            return None
+        # Older transformers releases keep MusicGen's cache as per-layer tuples
+        layout = 'cache' if hasattr(sys.modules[type(model).__module__], 'EncoderDecoderCache') else 'legacy'
+        try:
+            entries = self._kv_lookup(keys)
+            for i, entry in enumerate(entries):
+                if entry is None:
+                    state = states[i][None]
+                    entries[i] = self._project(model, state, torch.ones(state.shape[:2], dtype=torch.long,
+                                                                        device=state.device))
+                    self._kv_store(keys[i], entries[i])
+
+            width = max(len(state) for state in states)
+            null = self._unconditional_kv(model, states[0].shape[-1]) if guidance else None
+            layers = []
+            for layer, (first_k, _) in enumerate(entries[0]):
+                heads, head_dim = first_k.shape[1], first_k.shape[3]
+                k = first_k.new_zeros(len(entries), heads, width, head_dim)
+                v = first_k.new_zeros(len(entries), heads, width, head_dim)
+                for row, entry in enumerate(entries):
+                    length = entry[layer][0].shape[2]
+                    k[row, :, :length] = entry[layer][0][0]
+                    v[row, :, :length] = entry[layer][1][0]
+                if null is not None:
+                    k = torch.cat([k, null[layer][0].expand(len(entries), -1, width, -1)], dim=0)
+                    v = torch.cat([v, null[layer][1].expand(len(entries), -1, width, -1)], dim=0)
+                layers.append((k, v))
+        except Exception as e:
+            print(f"⚠ Cross-attention reuse unavailable for this model: {e}")
+            self._kv_unsupported.add(id(model))
+            return None
+
+        if layout == 'legacy':
+            empty = [k[:, :, :0] for k, _ in layers]
+            return tuple((e, e, k, v) for e, (k, v) in zip(empty, layers))
+        from transformers.cache_utils import DynamicCache, EncoderDecoderCache
+        cross = DynamicCache()
+        for layer, (k, v) in enumerate(layers):
+            cross.update(k, v, layer)
+        return EncoderDecoderCache(DynamicCache(), cross)
+
+    def conditioning(self, model, inputs, guidance_scale=None):
+        """inputs plus encoder_outputs, ready for model.generate(**inputs)
+
+        Prompts already in the cache skip the text encoder; the rest are
+        encoded together in one pass and cached. Audio prompt entries
+        (input_values, padding_mask) are passed through untouched.
+        """
+        if not self.max_entries or id(model) in self._unsupported:
+            return inputs
+        if guidance_scale is None:
+            guidance_scale = model.generation_config.guidance_scale
+
+        input_ids = inputs['input_ids']
+        attention_mask = inputs.get('attention_mask')
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        # Key on the real tokens only, so padding to a batch's longest prompt doesn't matter
+        rows = [ids[mask.bool()] for ids, mask in zip(input_ids, attention_mask)]
+        keys = [(id(model), tuple(row.tolist())) for row in rows]
+        states = self._lookup(keys)
+
+        hot = [state is not None for state in states]
+        missing = [i for i, state in enumerate(states) if state is None]
+        if missing:
+            with metrics.stage('encode'), inference_context(model):
+                hidden = model.text_encoder(
+                    input_ids=input_ids[missing],
+                    attention_mask=attention_mask[missing]
+                ).last_hidden_state
+            for row, i in enumerate(missing):
+                states[i] = hidden[row][attention_mask[i].bool()].clone()
+                self._store(keys[i], states[i])
+
+        # Rebuild the batch right-padded, as the tokenizer produced it
+        width = max(len(state) for state in states)
+        hidden = torch.zeros(len(states), width, states[0].shape[-1], dtype=states[0].dtype, device=states[0].device)
+        mask = torch.zeros(len(states), width, dtype=attention_mask.dtype, device=attention_mask.device)
+        for i, state in enumerate(states):
+            hidden[i, :len(state)] = state
+            mask[i, :len(state)] = 1
+
+        guidance = guidance_scale is not None and guidance_scale > 1
+        if guidance:
+            # Same layout model.generate builds: conditional rows, then unconditional ones
+            hidden = torch.cat([hidden, self._unconditional(model, hidden)], dim=0)
+            mask = torch.cat([mask, torch.zeros_like(mask)], dim=0)
+
+        conditioned = dict(inputs, attention_mask=mask, encoder_outputs=BaseModelOutput(last_hidden_state=hidden))
+        # Only prompts seen before get their cross-attention kept; one-off prompts aren't worth 12 MB
+        past = self._cross_attention_cache(model, keys, states, hot, guidance)
+        if past is not None:
+            conditioned['past_key_values'] = past
+        return conditioned
+
+    def generate(self, model, inputs, **kwargs):
+        """model.generate(**inputs, **kwargs) for conditioning() output
+
+        If generate rejects the cached encoder_outputs / past_key_values, it
+        runs once more on the plain inputs and the model stops using the
+        cache. A streamer is restarted first if it has a restart() method;
+        one that returns False (audio already sent) gets the error instead.
+        """
+        if 'encoder_outputs' not in inputs:
+            return model.generate(**inputs, **kwargs)
+        try:
+            return model.generate(**inputs, **kwargs)
+        except (TypeError, ValueError, RuntimeError, AttributeError, IndexError, KeyError) as e:
+            streamer = kwargs.get('streamer')
+            if streamer is not None and hasattr(streamer, 'restart') and not streamer.restart():
+                raise
+            print(f"⚠ Cached encoder outputs rejected by generate, retrying without them: {e}")
+            error = e
+
+        plain = {k: v for k, v in inputs.items() if k not in ('encoder_outputs', 'past_key_values')}
+        # conditioning() appended the unconditional rows; the prompt rows are the tokenizer's mask
+        plain['attention_mask'] = inputs['attention_mask'][:len(inputs['input_ids'])]
+        audio_values = model.generate(**plain, **kwargs)
+        with self._lock:
+            self._unsupported.add(id(model))
+        print(f"⚠ Encoder cache disabled for this model ({type(error).__name__})")
+        return audio_values
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'size_mb': round(self._bytes / 2**20, 1),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'disabled_models': len(self._unsupported),
+                'cross_attention': {
+                    'entries': len(self._kv),
+                    'size_mb': round(self._kv_bytes / 2**20, 1),
+                    'max_mb': round(self.kv_max_bytes / 2**20, 1),
+                    'hits': self.kv_hits,
+                    'evicted': self.kv_evicted
+                }
+            }
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def encoder_cache_from_env():
+    """Encoder cache shared by every app in the process"""
+    with _shared_lock:
+        if 'cache' not in _shared:
+            _shared['cache'] = EncoderCache(
+                max_entries=int(os.environ.get('MUSICGEN_ENCODER_CACHE', 256)),
+                kv_max_bytes=int(float(os.environ.get('MUSICGEN_CROSS_KV_CACHE_MB', 256)) * 2**20)
+            )
+        return _shared['cache']
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+TECHNO Generator Gateway
+Every generator backend in one process on one port
+
+Each backend app is mounted under its own prefix (/suno/..., /musicgen/...)
+and imported on first use, so a gateway without torch installed still serves
+the proxy backends. POST /generate with a "backend" field to pick one;
+the rest of the body is passed to that backend's /generate unchanged,
+along with every end-to-end header (Authorization, API keys, X-Forwarded-For).
+Backends in the same process share connection pools, rate limiters, the
+generation cache and a single copy of each MusicGen model.
+
+Settings:
+  GATEWAY_BACKENDS        - comma-separated backends to mount (default: all)
+  GATEWAY_DEFAULT_BACKEND - backend used when /generate has no "backend" (default demo)
+"""
+
+import importlib
+import json
+import os
+import threading
+import time
+
+from flask import Flask, request, jsonify
+from flask_cors import CORS
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response
+
+import http_pool
+import metrics
+import track_catalog
+from rate_limiter import limiter_stats
+
+# Backend name -> module defining a Flask `app`
+BACKEND_MODULES = {
+    'simple': 'simple_server',
+    'demo': 'demo_server',
+    'udio': 'udio_server',
+    'real_udio': 'real_udio_server',
+    'suno': 'suno_server',
+    'multi': 'multi_service_server',
+    'musicgen': 'musicgen_server',
+    'simple_musicgen': 'simple_musicgen_server'
+}
+
+
+class LazyBackend:
+    """WSGI app that imports its backend module on the first request"""
+
+    def __init__(self, name, module_name):
+        self.name = name
+        self.module_name = module_name
+        self.app = None
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.app is None and self.error is None:
+                started = time.time()
+                try:
+                    self.app = importlib.import_module(self.module_name).app
+                    self.load_seconds = round(time.time() - started, 2)
+                    print(f"🔌 Mounted {self.name} ({self.module_name}) at /{self.name}")
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    print(f"❌ Could not load {self.name}: {self.error}")
+        return self.app
+
+    def __call__(self, environ, start_response):
+        app = self.load()
+        if app is None:
+            return unavailable(self)(environ, start_response)
+        return app(environ, start_response)
+
+    def to_dict(self):
+        return {
+            'module': self.module_name,
+            'mount': f'/{self.name}',
+            'loaded': self.app is not None,
+            'error': self.error,
+            'load_seconds': self.load_seconds
+        }
+
+
+def unavailable(backend):
+    body = json.dumps({'error': f'Backend {backend.name} is unavailable', 'details': backend.error})
+    return Response(body, status=503, mimetype='application/json')
+
+
+enabled = [name.strip() for name in os.environ.get('GATEWAY_BACKENDS', ','.join(BACKEND_MODULES)).split(',')
+           if name.strip()]
+BACKENDS = {name: LazyBackend(name, BACKEND_MODULES[name]) for name in enabled if name in BACKEND_MODULES}
+DEFAULT_BACKEND = os.environ.get('GATEWAY_DEFAULT_BACKEND', 'demo')
+
+gateway = Flask(__name__)
+CORS(gateway)
+metrics.instrument(gateway, 'gateway')
+# Every backend writes to the same catalog, so /tracks lists all of them
+track_catalog.install(gateway, track_catalog.catalog_from_env())
+
+@gateway.route('/')
+def home():
+    links = ''.join(f'<li><a href="/{name}/">/{name}</a> - {backend.module_name}</li>'
+                    for name, backend in BACKENDS.items())
+    return f"""
+    <h1>🤖 TECHNO Generator Gateway</h1>
+    <p>POST to /generate with JSON: {{"backend": "suno", "style": "minimal", "prompt": "dark vibes", ...}}</p>
+    <p>Default backend: {DEFAULT_BACKEND}</p>
+    <ul>{links}</ul>
+    """
+
+@gateway.route('/health')
+def health():
+    return jsonify({
+        'status': 'healthy',
+        'service': 'techno-gateway',
+        'backends': {name: backend.to_dict() for name, backend in BACKENDS.items()},
+        'upstream_pools': http_pool.pool_stats(),
+        'rate_limits': limiter_stats()
+    })
+
+@gateway.route('/backends')
+def list_backends():
+    return jsonify({name: backend.to_dict() for name, backend in BACKENDS.items()})
+
+# Headers that describe this hop rather than the request, plus the ones EnvironBuilder sets itself
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'proxy-connection',
+    'te', 'trailer', 'transfer-encoding', 'upgrade', 'host', 'content-length', 'content-type'
+}
+
+def forwarded_headers():
+    """The incoming request's end-to-end headers (auth, API keys, X-Forwarded-For, ...)"""
+    # Connection may name further per-hop headers
+    listed = {h.strip().lower() for h in request.headers.get('Connection', '').split(',') if h.strip()}
+    return [(key, value) for key, value in request.headers.items()
+            if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() not in listed]
+
+@gateway.route('/generate', methods=['POST'])
+def generate_techno():
+    """Forward a generation to the backend named in the request body"""
+    data = request.get_json(silent=True) or {}
+    name = data.get('backend', DEFAULT_BACKEND)
+    backend = BACKENDS.get(name)
+    if backend is None:
+        return jsonify({'error': f'Unknown backend: {name}', 'backends': list(BACKENDS)}), 400
+
+    backend_app = backend.load()
+    if backend_app is None:
+        return unavailable(backend)
+
+    # Run the backend's own /generate as if it were called under its mount,
+    # so any links it returns (e.g. job status URLs) point at /<name>/...
+    environ = EnvironBuilder(
+        path='/generate',
+        base_url=f'{request.host_url.rstrip("/")}/{name}',
+        method='POST',
+        headers=forwarded_headers(),
+        data=request.get_data(),
+        content_type=request.content_type,
+        environ_base={'REMOTE_ADDR': request.remote_addr}
+    ).get_environ()
+    return Response.from_app(backend_app, environ)
+
+app = DispatcherMiddleware(gateway, {f'/{name}': backend for name, backend in BACKENDS.items()})
+
+if __name__ == '__main__':
+    from werkzeug.serving import run_simple
+
+    port = int(os.environ.get('PORT', 5010))
+    print("🎵 Starting TECHNO Generator Gateway")
+    print(f"📡 Server: http://localhost:{port}")
+    print("🔌 Backends:", ', '.join(f'/{name}' for name in BACKENDS))
+    print(f"🎯 Default /generate backend: {DEFAULT_BACKEND}")
+    print("=" * 60)
+
+    # Like the other servers, the reloader and debugger only run with FLASK_DEBUG=1
+    debug = os.environ.get('FLASK_DEBUG') == '1'
+    run_simple('0.0.0.0', port, app, use_reloader=debug, use_debugger=debug, threaded=True)
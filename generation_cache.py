@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Content-Addressed Generation Cache
+Stores generated audio on disk keyed by everything that determines the output
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'techno_cache')
+
+
+
+def touch(path):
+    """Mark path as just used; only its atime moves, so the mtime keeps dating the content"""
+    os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+
+
+def last_used(stat):
+    """When a file was last written or touched()"""
+    return max(stat.st_atime, stat.st_mtime)
+
+class GenerationCache:
+    """On-disk LRU of generated files, capped by total size in bytes"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=2 * 1024 ** 3, suffix='.wav'):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.enabled = max_bytes > 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+            self._load_existing()
+
+    @staticmethod
+    def make_key(prompt, duration, seed, guidance_scale, model_name, **extra):
+        """Hash the generation parameters into a stable cache key
+
+        extra holds any further settings that change the output, e.g. long-form windowing.
+        """
+        payload = json.dumps(dict({
+            'prompt': prompt,
+            'duration': duration,
+            'seed': seed,
+            'guidance_scale': guidance_scale,
+            'model': model_name
+        }, **extra), sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def _load_existing(self):
+        # Rebuild the LRU order from last-use times so the cache survives restarts
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.directory, name)
+            stat = os.stat(path)
+            files.append((last_used(stat), name[:-len(self.suffix)], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key, record=True):
+        """Return the cached file path for key, or None on a miss
+
+        Pass record=False for repeat lookups of a request already counted.
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        with self._lock:
+            if key in self._entries and os.path.exists(path):
+                self._entries.move_to_end(key)
+                if record:
+                    self.hits += 1
+                try:
+                    touch(path)
+                except OSError:
+                    pass
+                return path
+            if key in self._entries:
+                # Removed behind our back (another process or manual cleanup)
+                self._bytes -= self._entries.pop(key)
+            if record:
+                self.misses += 1
+            return None
+
+    def put(self, key, source_path):
+        """Move a freshly generated file into the cache and return its new path"""
+        if not self.enabled:
+            return source_path
+        path = self._path(key)
+        shutil.move(source_path, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)
+            self._entries[key] = size
+            self._bytes += size
+            self._evict()
+        return path
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size_mb': round(self._bytes / 1024 ** 2, 1),
+                'max_mb': round(self.max_bytes / 1024 ** 2, 1)
+            }
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def cache_from_env():
+    """Cache for GENERATION_CACHE_DIR / GENERATION_CACHE_MAX_MB, shared by every app in the process"""
+    directory = os.environ.get('GENERATION_CACHE_DIR', DEFAULT_CACHE_DIR)
+    with _shared_lock:
+        # One index per directory, so apps mounted together don't evict behind each other's backs
+        if directory not in _shared:
+            _shared[directory] = GenerationCache(
+                directory=directory,
+                max_bytes=int(os.environ.get('GENERATION_CACHE_MAX_MB', 2048)) * 1024 ** 2
+            )
+        return _shared[directory]
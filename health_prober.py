@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Background Health Prober
+Checks every upstream service on a jittered interval and caches the results
+
+Requests never wait on a health check: they read the last cached result.
+Results older than the TTL count as unknown, and unknown is treated as
+healthy so a stalled prober never takes every service out of rotation.
+
+Settings:
+  HEALTH_PROBE_INTERVAL - seconds between probes of one service (default 30)
+  HEALTH_PROBE_JITTER   - fraction of the interval to randomize by (default 0.2)
+  HEALTH_PROBE_TTL      - seconds a probe result stays valid (default 90)
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class HealthProber:
+    """Runs probe(name) -> bool for each service in the background
+
+    probes maps a service name to a blocking callable returning True when the
+    service is up. A probe that raises counts as down.
+    """
+
+    def __init__(self, probes, interval=30.0, jitter=0.2, ttl=90.0):
+        self.probes = dict(probes)
+        self.interval = interval
+        self.jitter = jitter
+        self.ttl = ttl
+        self._results = {}
+        self._due = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+
+    def start(self):
+        # Threads don't survive fork, so start lazily in the serving process
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Spread the first round out a little so services aren't probed in lockstep
+            now = time.time()
+            self._due = {name: now + random.uniform(0, 1) for name in self.probes}
+        threading.Thread(target=self._run, name='health-prober', daemon=True).start()
+
+    def _next_delay(self):
+        spread = self.interval * self.jitter
+        return self.interval + random.uniform(-spread, spread)
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=max(len(self.probes), 1), thread_name_prefix='health-probe') as pool:
+            while True:
+                now = time.time()
+                with self._lock:
+                    due = [name for name, at in self._due.items() if at <= now]
+                    for name in due:
+                        # Schedule before probing so a hanging probe isn't started twice
+                        self._due[name] = now + self._next_delay()
+                    next_at = min(self._due.values()) if self._due else now + self.interval
+                for name in due:
+                    pool.submit(self.probe_now, name)
+                self._wakeup.wait(max(next_at - time.time(), 0.05))
+                self._wakeup.clear()
+
+    def probe_now(self, name):
+        """Probe one service synchronously and cache the result"""
+        started = time.perf_counter()
+        try:
+            healthy = bool(self.probes[name]())
+            error = None if healthy else 'unhealthy response'
+        except Exception as e:
+            healthy = False
+            error = str(e)
+        result = {
+            'healthy': healthy,
+            'error': error,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'checked_at': time.time()
+        }
+        with self._lock:
+            previous = self._results.get(name)
+            self._results[name] = result
+        if previous and previous['healthy'] != healthy:
+            print(f"{'💚' if healthy else '💔'} {name} is now {'healthy' if healthy else 'unhealthy'}")
+        return result
+
+    def status(self, name):
+        """Last cached result, with healthy=None once it is older than the TTL"""
+        with self._lock:
+            result = self._results.get(name)
+        if result is None:
+            return {'healthy': None, 'error': None, 'latency_ms': None, 'checked_at': None, 'stale': True}
+        stale = time.time() - result['checked_at'] > self.ttl
+        return dict(result, healthy=None if stale else result['healthy'], stale=stale)
+
+    def is_healthy(self, name):
+        """False only when a fresh probe said the service is down"""
+        return self.status(name)['healthy'] is not False
+
+    def stats(self):
+        return {name: self.status(name) for name in self.probes}
+
+
+def prober_from_env(probes):
+    return HealthProber(
+        probes,
+        interval=float(os.environ.get('HEALTH_PROBE_INTERVAL', 30)),
+        jitter=float(os.environ.get('HEALTH_PROBE_JITTER', 0.2)),
+        ttl=float(os.environ.get('HEALTH_PROBE_TTL', 90))
+    )
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Pooled HTTP Sessions for Upstream APIs
+One keep-alive connection pool per upstream, with retry/backoff and reuse metrics
+
+Settings:
+  UPSTREAM_POOL_SIZE - connections kept alive per upstream host (default 20)
+  UPSTREAM_RETRIES   - retries for connection errors and 502/503/504 on GETs (default 2)
+  UPSTREAM_BACKOFF   - exponential backoff factor in seconds (default 0.5)
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 20))
+RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+BACKOFF = float(os.environ.get('UPSTREAM_BACKOFF', 0.5))
+
+_sessions = {}  # upstream name -> (pid, session, adapter)
+_lock = threading.Lock()
+
+
+def _build_session():
+    # Connection errors are retried for every method since nothing was sent;
+    # status retries only apply to idempotent methods so a POST never runs twice
+    retry = Retry(
+        total=RETRIES,
+        connect=RETRIES,
+        read=RETRIES,
+        status=RETRIES,
+        backoff_factor=BACKOFF,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session, adapter
+
+
+def get_session(name):
+    """Shared session for one upstream, e.g. 'suno', 'udio' or 'replicate'"""
+    pid = os.getpid()
+    with _lock:
+        entry = _sessions.get(name)
+        # Sockets must not be shared with a forked parent, so rebuild per process
+        if entry is None or entry[0] != pid:
+            session, adapter = _build_session()
+            entry = (pid, session, adapter)
+            _sessions[name] = entry
+        return entry[1]
+
+
+def _adapter_stats(adapter):
+    requests_made = 0
+    connections = 0
+    pools = adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        requests_made += pool.num_requests
+        connections += pool.num_connections
+    return requests_made, connections
+
+
+def pool_stats():
+    """Requests sent and connections opened per upstream in this process"""
+    with _lock:
+        entries = {name: entry for name, entry in _sessions.items() if entry[0] == os.getpid()}
+
+    stats = {}
+    for name, (_, _, adapter) in entries.items():
+        requests_made, connections = _adapter_stats(adapter)
+        reused = max(requests_made - connections, 0)
+        stats[name] = {
+            'requests': requests_made,
+            'connections_opened': connections,
+            'reused': reused,
+            'reuse_rate': round(reused / requests_made, 3) if requests_made else 0,
+            'pool_size': POOL_SIZE
+        }
+    return stats
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Bounded In-Process Job Queue
+Runs long generations on dedicated worker threads so HTTP requests return at once
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+
+import metrics
+
+
+class QueueFull(Exception):
+    """Raised when the job queue has no free slots"""
+
+    def __init__(self, depth, max_size):
+        super().__init__(f"Job queue full ({depth}/{max_size})")
+        self.depth = depth
+        self.max_size = max_size
+
+
+class Job:
+    """A single queued generation and its progress"""
+
+    def __init__(self, params, key=None):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.key = key
+        self.shared = 0  # Identical requests that joined this job
+        self.status = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': round(self.progress, 3),
+            'error': self.error,
+            'shared': self.shared,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobQueue:
+    """Fixed-size queue drained by worker threads calling handler(job)"""
+
+    def __init__(self, handler, max_size=16, workers=1, ttl=3600, name='jobs'):
+        self.handler = handler
+        self.max_size = max_size
+        self.workers = workers
+        self.ttl = ttl
+        self.name = name
+        self._queue = queue.Queue(maxsize=max_size)
+        self._jobs = {}
+        self._active = {}  # key -> unfinished job, for joining identical requests
+        self._running = 0
+        self.collapsed = 0
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def _ensure_workers(self):
+        # Threads don't survive fork, so start them lazily in the serving process
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'{self.name}-worker-{i}', daemon=True)
+            thread.start()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._running += 1
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                job.result = self.handler(job)
+                if job.result is None:
+                    job.status = 'failed'
+                    job.error = job.error or 'Generation returned no result'
+                else:
+                    job.status = 'completed'
+                    job.progress = 1.0
+            except Exception as e:
+                print(f"❌ Job {job.id} failed: {e}")
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self._running -= 1
+                    if self._active.get(job.key) is job:
+                        del self._active[job.key]
+                job.done.set()
+                self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def submit(self, params, key=None):
+        """Queue a job, raising QueueFull instead of blocking when saturated"""
+        return self.submit_or_join(params, key)[0]
+
+    def submit_or_join(self, params, key=None):
+        """Queue a job, or join the unfinished job with the same key; returns (job, joined)"""
+        self._ensure_workers()
+        self._prune()
+        with self._lock:
+            active = self._active.get(key) if key is not None else None
+            if active is None:
+                job = Job(params, key)
+                try:
+                    self._queue.put_nowait(job)
+                except queue.Full:
+                    raise QueueFull(self._queue.qsize(), self.max_size)
+                self._jobs[job.id] = job
+                if key is not None:
+                    self._active[key] = job
+                return job, False
+            active.shared += 1
+            self.collapsed += 1
+        metrics.COLLAPSED.inc(flight=self.name)
+        return active, True
+
+    def add_completed(self, params, result):
+        """Record a job whose result is already known, bypassing the workers"""
+        self._prune()
+        job = Job(params)
+        job.status = 'completed'
+        job.progress = 1.0
+        job.result = result
+        job.started_at = job.finished_at = job.created_at
+        job.done.set()
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def add_external(self, params):
+        """Record a running job that something other than the workers will finish"""
+        self._prune()
+        job = Job(params)
+        job.status = 'running'
+        job.started_at = job.created_at
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def finish(self, job, result=None, error=None):
+        """Complete an external job; a None result marks it failed"""
+        job.result = result
+        if result is None:
+            job.status = 'failed'
+            job.error = error or 'Generation returned no result'
+        else:
+            job.status = 'completed'
+            job.progress = 1.0
+        job.finished_at = time.time()
+        job.done.set()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def depth(self):
+        """Jobs waiting for a worker"""
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            running = self._running
+            tracked = len(self._jobs)
+            collapsed = self.collapsed
+        return {
+            'queue_depth': self.depth(),
+            'max_queue': self.max_size,
+            'running': running,
+            'workers': self.workers,
+            'tracked_jobs': tracked,
+            'collapsed': collapsed
+        }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+TECHNO Generator Launcher
+Runs any generator app under a production server instead of the Flask dev server
+
+Flask apps run under gunicorn with threaded workers; the async proxy runs
+under uvicorn. Each backend gets defaults that suit it: MusicGen is
+CPU-bound and keeps its model, job queue and cache index in process, so it
+runs one preloaded worker with a few threads; stateless proxies spend their
+time waiting on the network, so they get several workers with many threads.
+
+Usage:
+  python launcher.py suno
+  python launcher.py musicgen --port 5003
+  python launcher.py multi --workers 8 --threads 64 --max-requests 2000
+  python launcher.py async --backend suno
+  python launcher.py --list
+
+Reload code without dropping requests with `kill -HUP <master pid>`.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+
+CPUS = multiprocessing.cpu_count()
+
+# Profiles per kind of backend. Apps holding jobs, tracks or models in memory
+# run a single worker, since other workers could not see that state.
+PROFILES = {
+    'proxy': {'workers': min(2 * CPUS, 8), 'threads': 32, 'timeout': 60, 'max_requests': 2000, 'preload': False},
+    'stateful': {'workers': 1, 'threads': 128, 'timeout': 360, 'max_requests': 0, 'preload': False},
+    'musicgen': {'workers': 1, 'threads': 8, 'timeout': 900, 'max_requests': 0, 'preload': True},
+}
+
+# Backend name -> (module, default port, profile)
+APPS = {
+    'simple': ('simple_server', 5000, 'proxy'),
+    'quiet': ('quiet_server', 5000, 'proxy'),
+    'udio': ('udio_server', 5000, 'proxy'),
+    'real_udio': ('real_udio_server', 5001, 'stateful'),
+    'suno': ('suno_server', 5002, 'stateful'),
+    'musicgen': ('musicgen_server', 5003, 'musicgen'),
+    'multi': ('multi_service_server', 5004, 'proxy'),
+    'demo': ('demo_server', 5005, 'proxy'),
+    'simple_musicgen': ('simple_musicgen_server', 5006, 'musicgen'),
+    'gateway': ('gateway', 5010, 'stateful'),
+    'async': ('async_proxy_server', 5007, 'async'),
+}
+
+
+def run_gunicorn(module, options):
+    from gunicorn.app.base import BaseApplication
+
+    class TechnoApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return getattr(__import__(module), 'app')
+
+    TechnoApplication().run()
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    if args.backend:
+        os.environ['ASYNC_PROXY_BACKEND'] = args.backend
+    # Extra workers would each run their own Udio tracker and track poller
+    uvicorn.run(
+        'async_proxy_server:app',
+        host=args.host,
+        port=args.port,
+        workers=args.workers or 1,
+        reload=args.reload,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level='info'
+    )
+
+
+def gunicorn_options(args, profile):
+    workers = args.workers or profile['workers']
+    threads = args.threads or profile['threads']
+    max_requests = profile['max_requests'] if args.max_requests is None else args.max_requests
+    return {
+        'bind': f'{args.host}:{args.port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout or profile['timeout'],
+        'graceful_timeout': args.graceful_timeout,
+        'keepalive': 5,
+        'max_requests': max_requests,
+        'max_requests_jitter': max_requests // 10,
+        'preload_app': profile['preload'] if args.preload is None else args.preload,
+        'reload': args.reload,
+        'accesslog': '-' if args.access_log else None,
+        'errorlog': '-',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a TECHNO generator app under gunicorn or uvicorn')
+    parser.add_argument('app', nargs='?', choices=list(APPS), help='App to run')
+    parser.add_argument('--list', action='store_true', help='Show apps and their default settings')
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes')
+    parser.add_argument('--threads', type=int, default=None, help='Threads per worker (gunicorn)')
+    parser.add_argument('--timeout', type=int, default=None, help='Seconds before a silent worker is restarted')
+    parser.add_argument('--graceful-timeout', type=int, default=30, help='Seconds to finish requests on reload/stop')
+    parser.add_argument('--max-requests', type=int, default=None, help='Recycle a worker after this many requests')
+    parser.add_argument('--preload', dest='preload', action='store_true', default=None,
+                        help='Import the app before forking workers')
+    parser.add_argument('--no-preload', dest='preload', action='store_false')
+    parser.add_argument('--reload', action='store_true', help='Restart workers when code changes (development)')
+    parser.add_argument('--access-log', action='store_true', help='Log every request')
+    parser.add_argument('--backend', help='For async: serve one proxy backend at /')
+    args = parser.parse_args()
+
+    if args.list or not args.app:
+        print(f"{'app':<16} {'module':<24} {'port':>5}  profile")
+        for name, (module, port, profile) in APPS.items():
+            settings = PROFILES.get(profile, {'workers': 1})
+            print(f"{name:<16} {module:<24} {port:>5}  {profile} {settings}")
+        return
+
+    module, default_port, profile_name = APPS[args.app]
+    args.port = args.port or int(os.environ.get('PORT', default_port))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    print(f"🚀 Starting {args.app} ({module}) on http://{args.host}:{args.port}")
+    if profile_name == 'async':
+        run_uvicorn(args)
+        return
+
+    if args.app == 'demo':
+        # The demo app only stocks its style pool when asked to
+        os.environ.setdefault('STYLE_POOL_PRODUCER', '1')
+
+    profile = PROFILES[profile_name]
+    options = gunicorn_options(args, profile)
+    if options['workers'] > 1:
+        # Let /metrics add up every worker's numbers
+        os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'techno_metrics_{args.port}'))
+    if options['workers'] > 1 and profile_name != 'proxy':
+        print(f"⚠️ {args.app} keeps jobs in memory; with {options['workers']} workers a job is only "
+              f"visible to the worker that created it")
+    print(f"⚙️ {options['workers']} workers x {options['threads']} threads, preload {options['preload_app']}, "
+          f"max requests {options['max_requests'] or 'unlimited'}")
+    run_gunicorn(module, options)
+
+
+if __name__ == '__main__':
+    main()
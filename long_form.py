@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Long-Form MusicGen Generation
+Builds multi-minute tracks from overlapping windows, each continuing the last
+
+A single model.generate over the whole track gets slower with every token,
+because attention covers everything generated so far. Here the track is
+produced in windows of at most `window` seconds. Each window after the first
+is prompted with the last `overlap` seconds of audio, so it carries on the
+groove instead of starting over. Seams are crossfaded and finished audio is
+written straight to a 16-bit WAV, so memory stays bounded by one window
+however long the track is.
+"""
+
+import math
+import wave
+
+import numpy as np
+
+import metrics
+from cpu_inference import inference_context
+from encoder_cache import encoder_cache_from_env
+from musicgen_streaming import pcm16
+from seeded_sampling import sampling_kwargs
+
+
+def window_count(duration, window, overlap):
+    """Number of generate calls needed for duration seconds"""
+    if duration <= window:
+        return 1
+    return 1 + math.ceil((duration - window) / (window - overlap))
+
+
+def generate_long(model, processor, prompt, duration, path, window=30.0, overlap=10.0, crossfade=1.0,
+                  guidance_scale=3.0, seed=None, on_progress=None):
+    """Generate duration seconds of audio for prompt into a WAV file at path
+
+    on_progress(done, total) is called after every window. A seed makes the
+    output reproducible; every window samples from the same seeded generator.
+    """
+    if not 0 < overlap < window:
+        raise ValueError('overlap must be between 0 and the window length')
+    crossfade = min(crossfade, overlap)
+    sample_rate = model.config.audio_encoder.sample_rate
+    frame_rate = model.config.audio_encoder.frame_rate
+    device = next(model.parameters()).device
+    total = window_count(duration, window, overlap)
+    encoder_cache = encoder_cache_from_env()
+    sampling = sampling_kwargs(model, seed)
+
+    total_samples = int(duration * sample_rate)
+    overlap_samples = int(overlap * sample_rate)
+    fade_samples = int(crossfade * sample_rate)
+    fade_in = np.linspace(0.0, 1.0, fade_samples, dtype=np.float32)
+
+    written_tail = np.zeros(0, dtype=np.float32)  # Last `overlap` seconds already written
+    held = np.zeros(0, dtype=np.float32)  # End of the last window, waiting to be crossfaded
+    written = 0
+
+    with wave.open(path, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+
+        for index in range(total):
+            remaining = total_samples - written - len(held)
+            # Prompt with the end of the track so far, held-back samples included
+            tail = np.concatenate([written_tail, held])[-overlap_samples:] if index else None
+            with metrics.stage('tokenize'):
+                if tail is None:
+                    new_samples = min(int(window * sample_rate), remaining)
+                    inputs = processor(text=[prompt], padding=True, return_tensors='pt')
+                else:
+                    new_samples = min(int((window - overlap) * sample_rate), remaining)
+                    inputs = processor(audio=tail, sampling_rate=sample_rate, text=[prompt],
+                                       padding=True, return_tensors='pt')
+                inputs = {k: v.to(device) for k, v in inputs.items()}
+                # Every window has the same text, so only the first one runs the encoder
+                inputs = encoder_cache.conditioning(model, inputs, guidance_scale)
+
+            with inference_context(model), metrics.stage('generate'):
+                audio_values = encoder_cache.generate(
+                    model,
+                    inputs,
+                    max_new_tokens=math.ceil(new_samples / sample_rate * frame_rate),
+                    guidance_scale=guidance_scale,
+                    **sampling
+                )
+            audio = audio_values[0, 0].float().cpu().numpy()
+
+            # With an audio prompt the output starts with the decoded prompt itself
+            start = 0 if tail is None else len(tail)
+            segment = audio[start:start + new_samples]
+            if len(held):
+                # Blend the held-back end of the last window into the same stretch of this one
+                overlap_audio = audio[start - len(held):start]
+                segment = np.concatenate([held * (1 - fade_in[:len(held)]) + overlap_audio * fade_in[:len(held)],
+                                          segment])
+
+            last = index == total - 1
+            keep = 0 if last else min(fade_samples, len(segment))
+            ready, held = segment[:len(segment) - keep], segment[len(segment) - keep:]
+            with metrics.stage('save'):
+                out.writeframes(pcm16(ready))
+            written += len(ready)
+
+            written_tail = np.concatenate([written_tail, ready])[-overlap_samples:]
+
+            if on_progress:
+                on_progress(index + 1, total)
+
+    return path
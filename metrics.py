@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Prometheus Metrics
+Counters, histograms and gauges shared by every server, exposed at /metrics
+
+Flask apps get request counts and latency per endpoint, style and backend
+from instrument(app). The rate limiter records every upstream call, and the
+MusicGen servers time each stage (tokenize, generate, decode, save) with
+stage(). Stages nest: time spent in an inner stage is not counted again in
+the outer one, so generate excludes the audio decode that runs inside
+model.generate. Queue depth and cache hits are read through set_function()
+callbacks when metrics are rendered.
+
+Metrics live in the process that records them. With several workers per app
+(gunicorn -w 4), set METRICS_DIR to a directory shared by the workers. Each
+worker then writes a snapshot there every few seconds, and /metrics adds up
+the fresh snapshots of every worker.
+
+Settings:
+  METRICS_DIR   - directory for per-worker snapshots (default: off, single process)
+  METRICS_FLUSH - seconds between snapshots (default 5)
+"""
+
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH', 5))
+
+# Request latency up to MusicGen's multi-second generations
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = {}  # name -> metric
+_registry_lock = threading.Lock()
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, '')) for name in labelnames)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._sources = {}  # label values -> fn() read at render time
+        self._lock = threading.Lock()
+
+    def set_function(self, fn, **labels):
+        """Read this series from fn() whenever metrics are rendered"""
+        with self._lock:
+            self._sources[_label_key(self.labelnames, labels)] = fn
+
+    def snapshot(self):
+        with self._lock:
+            values = {json.dumps(key): value for key, value in self._values.items()}
+            sources = list(self._sources.items())
+        for key, fn in sources:
+            try:
+                values[json.dumps(key)] = fn()
+            except Exception as e:
+                print(f"⚠ Metrics callback for {self.name} failed: {e}")
+        return values
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(self.labelnames, labels)] = value
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket plus +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): list(counts) for key, counts in self._values.items()}
+
+
+def _register(metric):
+    with _registry_lock:
+        # Apps mounted together in one process share the same series
+        return _registry.setdefault(metric.name, metric)
+
+
+def counter(name, help, labelnames=()):
+    return _register(Counter(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, help, labelnames, buckets))
+
+
+def gauge(name, help, labelnames=()):
+    return _register(Gauge(name, help, labelnames))
+
+
+REQUESTS = counter('techno_requests_total', 'HTTP requests handled',
+                   ('service', 'endpoint', 'method', 'status', 'style', 'backend'))
+REQUEST_SECONDS = histogram('techno_request_seconds', 'Time to response headers',
+                            ('service', 'endpoint', 'style', 'backend'))
+UPSTREAM_REQUESTS = counter('techno_upstream_requests_total', 'Calls to upstream APIs', ('provider', 'status'))
+UPSTREAM_SECONDS = histogram('techno_upstream_seconds', 'Upstream API call latency', ('provider',))
+STAGE_SECONDS = histogram('techno_musicgen_stage_seconds', 'Time per MusicGen pipeline stage', ('stage',))
+QUEUE_DEPTH = gauge('techno_queue_depth', 'Jobs waiting for a worker', ('queue',))
+CACHE_HITS = counter('techno_cache_hits_total', 'Generation cache hits', ('cache',))
+CACHE_MISSES = counter('techno_cache_misses_total', 'Generation cache misses', ('cache',))
+COLLAPSED = counter('techno_collapsed_requests_total', 'Requests that joined an identical in-flight generation',
+                    ('flight',))
+POOL_STOCK = gauge('techno_style_pool_stock', 'Pre-generated tracks ready per style', ('style',))
+MODEL_LOAD_SECONDS = gauge('techno_model_load_seconds', 'Time taken to load a model', ('model',))
+
+
+# -- Stage timing -------------------------------------------------------------
+
+_stages = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage, excluding any stages nested inside it"""
+    stack = getattr(_stages, 'stack', None)
+    if stack is None:
+        stack = _stages.stack = []
+    frame = {'started': time.perf_counter(), 'nested': 0.0}
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - frame['started']
+        stack.pop()
+        if stack:
+            stack[-1]['nested'] += elapsed
+        STAGE_SECONDS.observe(max(elapsed - frame['nested'], 0.0), stage=name)
+
+
+def record_upstream(provider, status, seconds):
+    UPSTREAM_REQUESTS.inc(provider=provider, status=status)
+    UPSTREAM_SECONDS.observe(seconds, provider=provider)
+
+
+# -- Exposition ---------------------------------------------------------------
+
+def snapshot():
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {
+        metric.name: {
+            'type': metric.type,
+            'help': metric.help,
+            'labelnames': list(metric.labelnames),
+            'buckets': list(getattr(metric, 'buckets', [])),
+            'values': metric.snapshot()
+        }
+        for metric in metrics
+    }
+
+
+def _merge(into, other):
+    for name, metric in other.items():
+        target = into.setdefault(name, dict(metric, values={}))
+        for key, value in metric['values'].items():
+            current = target['values'].get(key)
+            if current is None:
+                target['values'][key] = value
+            elif isinstance(value, list):
+                target['values'][key] = [a + b for a, b in zip(current, value)]
+            else:
+                target['values'][key] = current + value
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def render():
+    """Prometheus text exposition of this process, plus other workers' snapshots"""
+    merged = {}
+    _merge(merged, snapshot())
+    for other in _read_snapshots():
+        _merge(merged, other)
+
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric['labelnames']
+        for key, value in sorted(metric['values'].items()):
+            values = json.loads(key)
+            if metric['type'] != 'histogram':
+                lines.append(f'{name}{_labels(names, values)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(metric['buckets'] + ['+Inf'], value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(names, values, [("le", str(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(names, values)} {value[-1]}')
+            lines.append(f'{name}_count{_labels(names, values)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+# -- Multi-worker snapshots ---------------------------------------------------
+
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def _snapshot_path(pid):
+    return os.path.join(METRICS_DIR, f'{pid}.json')
+
+
+def _write_snapshot():
+    path = _snapshot_path(os.getpid())
+    with open(path + '.tmp', 'w') as f:
+        json.dump(snapshot(), f)
+    os.replace(path + '.tmp', path)
+
+
+def _writer():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            _write_snapshot()
+        except OSError as e:
+            print(f"⚠ Could not write metrics snapshot: {e}")
+
+
+def start_writer():
+    """Start flushing snapshots to METRICS_DIR from this process"""
+    global _writer_pid
+    if not METRICS_DIR:
+        return
+    # Threads don't survive fork, so start lazily in the serving process
+    with _writer_lock:
+        if _writer_pid == os.getpid():
+            return
+        _writer_pid = os.getpid()
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    threading.Thread(target=_writer, name='metrics-writer', daemon=True).start()
+
+
+def _read_snapshots():
+    if not METRICS_DIR or not os.path.isdir(METRICS_DIR):
+        return []
+    snapshots = []
+    stale_after = max(FLUSH_SECONDS * 6, 30)
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith('.json') or name == f'{os.getpid()}.json':
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            # Workers that stopped writing are gone (or recycled by max-requests)
+            if time.time() - os.path.getmtime(path) > stale_after:
+                os.remove(path)
+                continue
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            pass
+    return snapshots
+
+
+# -- Flask integration ----------------------------------------------------------
+
+# The frontend's styles; anything else is reported as "other"
+STYLES = ('minimal', 'acid', 'hard', 'melodic', 'dub', 'industrial')
+
+_SAFE_LABEL = re.compile(r'[a-z0-9_-]{1,32}')
+
+
+def instrument(app, service, styles=()):
+    """Count and time every request to a Flask app and serve /metrics from it
+
+    The style label is taken from the request body when it is one of styles
+    so user input can't create unbounded series. Handlers that pick a backend
+    at runtime can set flask.g.metrics_backend.
+    """
+    from flask import Response, g, request
+
+    styles = set(styles or STYLES)
+
+    @app.before_request
+    def start_timer():
+        start_writer()
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        data = request.get_json(silent=True) if request.is_json else None
+        style = data.get('style') if isinstance(data, dict) else request.args.get('style')
+        style = style if style in styles else ('' if style is None else 'other')
+        backend = g.get('metrics_backend', service)
+        backend = backend if _SAFE_LABEL.fullmatch(str(backend)) else 'other'
+        REQUESTS.inc(service=service, endpoint=endpoint, method=request.method,
+                     status=response.status_code, style=style, backend=backend)
+        REQUEST_SECONDS.observe(time.perf_counter() - started,
+                                service=service, endpoint=endpoint, style=style, backend=backend)
+        return response
+
+    def metrics_endpoint():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+    return app
+
+
+class MetricsMiddleware:
+    """ASGI version of instrument(); handlers may set request.state.metrics_style / metrics_backend"""
+
+    def __init__(self, app, service, styles=()):
+        self.app = app
+        self.service = service
+        self.styles = set(styles or STYLES)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        start_writer()
+        started = time.perf_counter()
+
+        async def send_timed(message):
+            if message['type'] == 'http.response.start':
+                self.record(scope, message['status'], time.perf_counter() - started)
+            await send(message)
+
+        await self.app(scope, receive, send_timed)
+
+    def record(self, scope, status, seconds):
+        # The router fills in the matched route (and mount prefix) as it dispatches
+        route = scope.get('route')
+        endpoint = scope.get('root_path', '') + route.path if route is not None else 'unmatched'
+        state = scope.get('state') or {}
+        style = state.get('metrics_style')
+        style = style if style in self.styles else ('' if style is None else 'other')
+        backend = str(state.get('metrics_backend', self.service))
+        backend = backend if _SAFE_LABEL.fullmatch(backend) else 'other'
+        REQUESTS.inc(service=self.service, endpoint=endpoint, method=scope['method'],
+                     status=status, style=style, backend=backend)
+        REQUEST_SECONDS.observe(seconds, service=self.service, endpoint=endpoint, style=style, backend=backend)
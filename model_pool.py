@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Shared MusicGen Model Pool
+Loads each model once per process and keeps the weights fork-friendly
+
+MUSICGEN_PRELOAD controls when the model is loaded:
+  off        - lazily on the first generation (default)
+  background - on a thread in each serving process; /health reports 503 until ready
+  startup    - synchronously at import, before a pre-fork server forks workers
+
+Threads do not survive fork, so `background` never starts its thread at
+import (which under gunicorn --preload is the master). Each process starts
+it on its first request through start_background_load(), and the dev
+server's __main__ starts it right away.
+
+With `startup` and a pre-forking server (gunicorn --preload) every worker
+inherits the parent's weights copy-on-write instead of loading its own copy.
+Weights are frozen and gc.freeze() is called so workers never write to
+those pages. MUSICGEN_SHARE_MEMORY=1 additionally moves the tensors into
+shared memory for torch.multiprocessing handoff. Pre-fork sharing is meant
+for CPU hosts; CUDA cannot be initialised before fork.
+"""
+
+import gc
+import multiprocessing
+import os
+import threading
+import time
+
+import torch
+from transformers import AutoProcessor, MusicgenForConditionalGeneration
+
+import cpu_inference
+import metrics
+
+PRELOAD_MODE = os.environ.get('MUSICGEN_PRELOAD', 'off')
+SHARE_MEMORY = os.environ.get('MUSICGEN_SHARE_MEMORY', '0') == '1'
+
+_models = {}  # model_name -> (model, processor)
+_lock = threading.Lock()
+_state = {'status': 'idle', 'error': None, 'load_seconds': None, 'pid': None}
+_background = {'load_fn': None, 'pid': None}
+_background_lock = threading.Lock()  # Not _lock, which is held for the whole load
+
+# Thread counts must be set before torch starts any parallel work
+cpu_inference.configure_threads()
+
+
+def freeze_for_sharing(model):
+    """Make weights read-only so forked workers keep sharing their pages"""
+    model.eval()
+    for param in model.parameters():
+        param.requires_grad_(False)
+    if SHARE_MEMORY:
+        model.share_memory()
+    # Keep the garbage collector from touching (and copying) the loaded objects
+    gc.freeze()
+    return model
+
+
+def time_decoding(model):
+    """Report audio decoding as its own stage, including the decode inside model.generate"""
+    decode = model.audio_encoder.decode
+
+    def timed_decode(*args, **kwargs):
+        with metrics.stage('decode'):
+            return decode(*args, **kwargs)
+
+    model.audio_encoder.decode = timed_decode
+    return model
+
+
+def get_model(model_name):
+    """Return (model, processor), loading them on first use"""
+    with _lock:
+        if model_name in _models:
+            return _models[model_name]
+
+        _state.update(status='loading', error=None)
+        started = time.time()
+        try:
+            processor = AutoProcessor.from_pretrained(model_name)
+            model = MusicgenForConditionalGeneration.from_pretrained(model_name)
+
+            # Move to GPU if available
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            model = cpu_inference.optimize_for_cpu(model.to(device))
+            model = time_decoding(freeze_for_sharing(model))
+        except Exception as e:
+            _state.update(status='failed', error=str(e))
+            raise
+
+        _models[model_name] = (model, processor)
+        _state.update(status='ready', load_seconds=round(time.time() - started, 1), pid=os.getpid())
+        metrics.MODEL_LOAD_SECONDS.set(_state['load_seconds'], model=model_name)
+        return _models[model_name]
+
+
+def preload(load_fn):
+    """Start loading according to MUSICGEN_PRELOAD"""
+    if multiprocessing.current_process().name != 'MainProcess':
+        return  # A spawned helper (e.g. an audio encoder) re-importing the server script
+    if PRELOAD_MODE == 'background':
+        _background['load_fn'] = load_fn
+    elif PRELOAD_MODE == 'startup':
+        print("🔄 Preloading MusicGen model before serving...")
+        if not load_fn():
+            raise RuntimeError("MusicGen preload failed")
+
+
+def start_background_load():
+    """Start the background load in this process (once per pid); cheap to call per request"""
+    if _background['load_fn'] is None or _background['pid'] == os.getpid():
+        return
+    with _background_lock:
+        if _background['pid'] == os.getpid():
+            return
+        _background['pid'] = os.getpid()
+    print(f"🔄 Preloading MusicGen model in the background (pid {os.getpid()})...")
+    threading.Thread(target=_background['load_fn'], name='musicgen-preload', daemon=True).start()
+
+
+def is_ready():
+    """Whether this process can serve generations without a cold load"""
+    return _state['status'] == 'ready' or PRELOAD_MODE == 'off'
+
+
+def load_status():
+    return dict(_state, preload=PRELOAD_MODE, shared_memory=SHARE_MEMORY)
@@ -4,14 +4,24 @@ Multi-Service TECHNO Generator
 Supports multiple AI music generation APIs
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
-import requests
 import time
 import os
 
+import http_pool
+import metrics
+import single_flight
+import track_catalog
+from backend_router import BackendRouter, NoBackendAvailable
+from health_prober import prober_from_env
+from rate_limiter import RateLimited, get_limiter, limiter_stats, rate_limited_response
+
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app, 'multi')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
 
 # TECHNO styles for all services
 TECHNO_STYLES = {
@@ -25,33 +35,60 @@ TECHNO_STYLES = {
 
 class APIService:
     """Base class for API services"""
-    def __init__(self, name, base_url, requires_auth=True):
+    def __init__(self, name, base_url, requires_auth=True, pool_name=None):
         self.name = name
         self.base_url = base_url
         self.requires_auth = requires_auth
+        self.pool_name = pool_name or name.lower()
+    
+    @property
+    def session(self):
+        """Keep-alive connection pool shared by every call to this upstream"""
+        return http_pool.get_session(self.pool_name)
+    
+    def post(self, path, api_key, headers, data):
+        """POST through the shared per-key rate limiter for this upstream"""
+        return get_limiter(self.pool_name).request(
+            api_key, lambda: self.session.post(f"{self.base_url}{path}", headers=headers, json=data, timeout=30)
+        )
     
-    def test_connection(self, api_key=None):
-        """Test if service is available"""
+    def test_connection(self, api_key=None, timeout=5):
+        """Test if service is available (blocking - requests read health_prober instead)"""
         try:
             headers = {}
             if api_key and self.requires_auth:
                 headers['Authorization'] = f'Bearer {api_key}'
             
-            response = requests.get(f"{self.base_url}/health", headers=headers, timeout=5)
+            response = self.session.get(f"{self.base_url}/health", headers=headers, timeout=timeout)
             return response.status_code == 200
-        except:
+        except Exception:
             return False
     
-    def generate(self, prompt, style, api_key=None, **kwargs):
-        """Generate music - implemented by subclasses"""
+    success_status = 200
+    
+    def build_request(self, prompt, style, api_key=None, **kwargs):
+        """(path, headers, json body) for a generation - implemented by subclasses"""
         raise NotImplementedError
+    
+    def generate(self, prompt, style, api_key=None, **kwargs):
+        """Generate music"""
+        path, headers, data = self.build_request(prompt, style, api_key, **kwargs)
+        try:
+            response = self.post(path, api_key, headers, data)
+            if response.status_code == self.success_status:
+                return response.json()
+        except RateLimited:
+            raise
+        except Exception as e:
+            print(f"{self.name} error: {e}")
+        return None
 
 class SunoService(APIService):
     """Suno AI service"""
     def __init__(self):
-        super().__init__("Suno AI", "https://api.sunoai.ai/v1", True)
+        super().__init__("Suno AI", os.environ.get('SUNO_API_BASE', "https://api.sunoai.ai/v1"), True, 'suno')
     
-    def generate(self, prompt, style, api_key=None, **kwargs):
+    def build_request(self, prompt, style, api_key=None, **kwargs):
         headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
         data = {
             'prompt': prompt,
@@ -59,42 +96,30 @@ class SunoService(APIService):
             'tags': f'techno, {style}, electronic, instrumental',
             'model': 'chirp-v3-5'
         }
-        
-        try:
-            response = requests.post(f"{self.base_url}/generate", headers=headers, json=data, timeout=30)
-            if response.status_code == 200:
-                return response.json()
-        except Exception as e:
-            print(f"Suno error: {e}")
-        return None
+        return "/generate", headers, data
 
 class MuzicService(APIService):
     """Muzic/Audiocraft service"""
     def __init__(self):
-        super().__init__("Muzic", "https://api.muzic.ai/v1", True)
+        super().__init__("Muzic", os.environ.get('MUZIC_API_BASE', "https://api.muzic.ai/v1"), True, 'muzic')
     
-    def generate(self, prompt, style, api_key=None, **kwargs):
+    def build_request(self, prompt, style, api_key=None, **kwargs):
         headers = {'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'}
         data = {
             'text': prompt,
             'duration': kwargs.get('duration', 20),
             'model': 'musicgen-medium'
         }
-        
-        try:
-            response = requests.post(f"{self.base_url}/generate", headers=headers, json=data, timeout=30)
-            if response.status_code == 200:
-                return response.json()
-        except Exception as e:
-            print(f"Muzic error: {e}")
-        return None
+        return "/generate", headers, data
 
 class ReplicateService(APIService):
     """Replicate MusicGen service"""
+    success_status = 201
+    
     def __init__(self):
-        super().__init__("Replicate", "https://api.replicate.com/v1", True)
+        super().__init__("Replicate", os.environ.get('REPLICATE_API_BASE', "https://api.replicate.com/v1"), True, 'replicate')
     
-    def generate(self, prompt, style, api_key=None, **kwargs):
+    def build_request(self, prompt, style, api_key=None, **kwargs):
         headers = {'Authorization': f'Token {api_key}', 'Content-Type': 'application/json'}
         data = {
             'version': 'b05b1dff1d8c6dc63d14b0cdb42135378dcb87f6373b0d3d341ede46ca9bd0d2',
@@ -104,14 +129,7 @@ class ReplicateService(APIService):
                 'model_version': 'musicgen-medium'
             }
         }
-        
-        try:
-            response = requests.post(f"{self.base_url}/predictions", headers=headers, json=data, timeout=30)
-            if response.status_code == 201:
-                return response.json()
-        except Exception as e:
-            print(f"Replicate error: {e}")
-        return None
+        return "/predictions", headers, data
 
 # Initialize services
 SERVICES = {
@@ -120,6 +138,31 @@ SERVICES = {
     'replicate': ReplicateService()
 }
 
+# Latency/error stats and circuit breakers for every service, used by service "auto"
+router = BackendRouter(
+    SERVICES.keys(),
+    failure_threshold=int(os.environ.get('ROUTER_FAILURE_THRESHOLD', 3)),
+    cooldown=float(os.environ.get('ROUTER_COOLDOWN', 30)),
+    neutral_errors=(RateLimited,)
+)
+
+# Background health checks; /services and the router only read the cached results
+health_prober = prober_from_env({name: service.test_connection for name, service in SERVICES.items()})
+router.health_check = health_prober.is_healthy
+
+# Identical requests in flight share one upstream generation (and its credits)
+generation_flight = single_flight.flight_from_env('multi')
+
+def generation_key(service_name, keys, style, user_prompt, duration):
+    # Candidates count too: a follower must hold a key for whichever service answered
+    return single_flight.make_key('multi', service_name, user_prompt, style=style, duration=duration,
+                                  candidates=sorted(keys), credentials=keys)
+
+@app.before_request
+def ensure_prober():
+    # Never started at import: each serving process starts its own prober thread
+    health_prober.start()
+
 def create_techno_prompt(style, user_input, service='suno'):
     """Create optimized TECHNO prompt for specific service"""
     base_style = TECHNO_STYLES.get(style, TECHNO_STYLES['minimal'])
@@ -136,7 +179,8 @@ def home():
     return """
     <h1>🤖 Multi-Service TECHNO Generator</h1>
     <p>POST to /generate with JSON: {"style": "minimal", "prompt": "dark vibes", "service": "suno", "api_key": "your-key"}</p>
-    <p><strong>Services:</strong> suno, muzic, replicate</p>
+    <p><strong>Services:</strong> suno, muzic, replicate, or "auto" to pick the fastest healthy one</p>
+    <p>With "auto", pass "api_keys": {"suno": "...", "replicate": "..."} and optionally "hedge": true</p>
     <p><strong>Styles:</strong> minimal, acid, hard, melodic, dub, industrial</p>
     <h3>🔑 API Keys Required:</h3>
     <ul>
@@ -151,20 +195,32 @@ def health():
     return jsonify({
         'status': 'healthy',
         'service': 'multi-techno-generator',
-        'available_services': list(SERVICES.keys())
+        'available_services': list(SERVICES.keys()),
+        'upstream_pools': http_pool.pool_stats(),
+        'routing': router.stats(),
+        'rate_limits': limiter_stats(),
+        'service_health': health_prober.stats(),
+        'single_flight': generation_flight.stats(),
+        'track_catalog': catalog.stats()
     })
 
-@app.route('/services')
-def list_services():
-    """List available services and their status"""
+def services_status():
     status = {}
+    routing = router.stats()['backends']
     for name, service in SERVICES.items():
         status[name] = {
             'name': service.name,
             'requires_auth': service.requires_auth,
-            'available': True  # We can't test without API keys
+            'available': health_prober.is_healthy(name) and routing[name]['state'] != 'open',
+            'health': health_prober.status(name),
+            'routing': routing[name]
         }
-    return jsonify(status)
+    return status
+
+@app.route('/services')
+def list_services():
+    """List available services and their status"""
+    return jsonify(services_status())
 
 @app.route('/test', methods=['POST'])
 def test_api():
@@ -192,68 +248,112 @@ def test_api():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def service_keys(data, service_name):
+    """API key per candidate service; api_keys entries override the shared api_key"""
+    api_key = data.get('api_key')
+    api_keys = data.get('api_keys') or {}
+    names = list(SERVICES.keys()) if service_name == 'auto' else [service_name]
+    keys = {}
+    for name in names:
+        key = api_keys.get(name, api_key)
+        if key or not SERVICES[name].requires_auth:
+            keys[name] = key
+    return keys
+
+def catalog_track(name, result, style, user_prompt, prompt):
+    """Track for a service's generation result, recorded in the track catalog
+
+    Called once by the single-flight leader, so every shared request gets the same track id.
+    """
+    return catalog.add({
+        'id': result.get('id') or track_catalog.new_track_id(name),
+        'title': f'{style.title()} TECHNO - {user_prompt}',
+        'audio_url': result.get('audio_url'),
+        'style': style,
+        'prompt': prompt,
+        'status': result.get('status', 'processing'),
+        'service': SERVICES[name].name,
+        'created_at': result.get('created_at', time.time())
+    }, name)
+
 @app.route('/generate', methods=['POST'])
 def generate_techno():
-    """Generate TECHNO using specified service"""
+    """Generate TECHNO using the specified service, or the best one for auto"""
     try:
         data = request.get_json()
         
         style = data.get('style', 'minimal')
         user_prompt = data.get('prompt', 'TECHNO')
         service_name = data.get('service', 'suno')
-        api_key = data.get('api_key')
         duration = min(int(data.get('duration', 20)), 30)
+        hedge = bool(data.get('hedge', False))
         
-        if service_name not in SERVICES:
+        if service_name != 'auto' and service_name not in SERVICES:
             return jsonify({'error': f'Unknown service: {service_name}'}), 400
         
-        service = SERVICES[service_name]
-        
-        if service.requires_auth and not api_key:
+        keys = service_keys(data, service_name)
+        if not keys:
+            if service_name == 'auto':
+                return jsonify({
+                    'error': 'Missing API keys',
+                    'instructions': 'Include api_key or api_keys for at least one service'
+                }), 400
+            service = SERVICES[service_name]
             return jsonify({
                 'error': f'Missing API key for {service.name}',
                 'instructions': f'Get API key for {service.name} and include in request'
             }), 400
         
-        # Create service-specific prompt
-        full_prompt = create_techno_prompt(style, user_prompt, service_name)
+        prompts = {name: create_techno_prompt(style, user_prompt, name) for name in keys}
         
-        print(f"🎵 Generating {style} TECHNO with {service.name}...")
-        print(f"📝 Prompt: {full_prompt}")
+        print(f"🎵 Generating {style} TECHNO with {service_name}...")
         
-        # Generate with selected service
-        result = service.generate(
-            prompt=full_prompt,
-            style=style,
-            api_key=api_key,
-            duration=duration
-        )
+        def generate_with(name):
+            print(f"📝 {SERVICES[name].name} prompt: {prompts[name]}")
+            return SERVICES[name].generate(
+                prompt=prompts[name],
+                style=style,
+                api_key=keys[name],
+                duration=duration
+            )
+        
+        def generate():
+            # Explicit services go through the router too, so their stats stay current
+            used, result = router.call(list(keys), generate_with, hedge=hedge and service_name == 'auto')
+            return used, catalog_track(used, result, style, user_prompt, prompts[used]) if result else None
+        
+        try:
+            used, track = generation_flight.do(
+                generation_key(service_name, keys, style, user_prompt, duration),
+                generate
+            )
+        except NoBackendAvailable as e:
+            return jsonify({
+                'error': str(e),
+                'details': 'Every candidate service is failing; try again shortly',
+                'routing': router.stats()['backends']
+            }), 503
         
-        if result:
-            track_id = result.get('id', f'{service_name}_{int(time.time())}')
+        if track:
+            g.metrics_backend = used
+            service = SERVICES[used]
             
             return jsonify({
                 'success': True,
-                'track': {
-                    'id': track_id,
-                    'title': f'{style.title()} TECHNO - {user_prompt}',
-                    'audio_url': result.get('audio_url'),
-                    'style': style,
-                    'prompt': full_prompt,
-                    'status': result.get('status', 'processing'),
-                    'service': service.name,
-                    'created_at': result.get('created_at', time.time())
-                },
+                'track': track,
                 'message': f'Real {style} TECHNO generation started with {service.name}!',
                 'service_used': service.name
             })
         else:
+            names = ', '.join(SERVICES[name].name for name in keys)
             return jsonify({
-                'error': f'Generation failed with {service.name}',
+                'error': f'Generation failed with {names}',
                 'details': 'API may be busy or key invalid',
-                'prompt': full_prompt
+                'prompt': prompts.get(service_name, next(iter(prompts.values())))
             }), 500
             
+    except RateLimited as e:
+        return rate_limited_response(e)
     except Exception as e:
         print(f"❌ Generation error: {str(e)}")
         return jsonify({
@@ -269,5 +369,6 @@ if __name__ == '__main__':
     print("🌐 Services:", list(SERVICES.keys()))
     print("🔑 Requires: API keys for chosen services")
     print("=" * 60)
+    health_prober.start()
     
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
@@ -4,23 +4,54 @@ MusicGen AI TECHNO Generator Server
 Using Meta's MusicGen model for local generation
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, url_for, redirect, Response
 from flask_cors import CORS
 import torch
 import torchaudio
-from transformers import AutoTokenizer, MusicgenForConditionalGeneration
-import tempfile
+from transformers.generation.streamers import BaseStreamer
 import os
+import threading
 import time
 
+import audio_store
+import metrics
+import model_pool
+import single_flight
+import track_catalog
+from cpu_inference import inference_context, inference_stats, record_generation
+from encoder_cache import encoder_cache_from_env
+from batcher import MicroBatcher
+from generation_cache import GenerationCache, cache_from_env
+from job_queue import JobQueue, QueueFull
+from long_form import generate_long, window_count
+from musicgen_streaming import stream_wav
+from seeded_sampling import sampling_kwargs
+
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app, 'musicgen')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
 
 # Global model variables
 model = None
+processor = None
 tokenizer = None
 model_loaded = False
 
+# Use smaller model for faster loading/generation
+MODEL_NAME = "facebook/musicgen-small"  # ~1.5GB vs ~3.3GB for medium
+
+# Finished tracks keyed on prompt, duration, seed, guidance and model
+generation_cache = cache_from_env()
+
+# Generated files and the /audio/<id> URLs they are served from
+audio_files = audio_store.store_from_env()
+
+# T5 hidden states for recent prompts, so repeated styles skip the text encoder
+encoder_cache = encoder_cache_from_env()
+
 # TECHNO-specific prompts optimized for MusicGen
 TECHNO_STYLES = {
     'minimal': 'minimal techno with repetitive 4/4 beats, deep bass, hypnotic loops, 128 BPM',
@@ -33,7 +64,7 @@ TECHNO_STYLES = {
 
 def load_model():
     """Load MusicGen model (this will download ~1.5GB first time)"""
-    global model, tokenizer, model_loaded
+    global model, processor, tokenizer, model_loaded
     
     if model_loaded:
         return True
@@ -41,66 +72,174 @@ def load_model():
     try:
         print("🔄 Loading MusicGen model (this may take a few minutes first time)...")
         
-        # Use smaller model for faster loading/generation
-        model_name = "facebook/musicgen-small"  # ~1.5GB vs ~3.3GB for medium
-        
-        tokenizer = AutoTokenizer.from_pretrained(model_name)
-        model = MusicgenForConditionalGeneration.from_pretrained(model_name)
-        
-        # Move to GPU if available
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model = model.to(device)
+        # Shared per process, so other apps mounted alongside reuse the same weights
+        model, processor = model_pool.get_model(MODEL_NAME)
+        tokenizer = processor.tokenizer
         
         model_loaded = True
-        print(f"✅ MusicGen model loaded on {device}")
+        print(f"✅ MusicGen model loaded on {model.device}")
         return True
         
     except Exception as e:
         print(f"❌ Failed to load model: {e}")
         return False
 
-def generate_techno_audio(prompt, duration=20):
+class ProgressStreamer(BaseStreamer):
+    """Reports decoding progress of queued jobs from model.generate"""
+
+    def __init__(self, jobs, max_new_tokens):
+        self.jobs = jobs
+        self.max_new_tokens = max_new_tokens
+        self.steps = -1  # First put() is the decoder start token
+
+    def put(self, value):
+        self.steps += 1
+        progress = min(self.steps / self.max_new_tokens, 0.99)
+        for job in self.jobs:
+            job.progress = progress
+
+    def restart(self):
+        self.steps = -1
+        return True
+
+    def end(self):
+        pass
+
+def duration_bucket(duration):
+    """Round duration up so similar requests share one max_new_tokens"""
+    return -(-duration // BATCH_BUCKET_SECONDS) * BATCH_BUCKET_SECONDS
+
+def generate_batch(key, batch):
+    """Run one padded model.generate for a batch of (prompt, duration, job)"""
+    bucket, seed, guidance_scale = key
+    prompts = [prompt for prompt, _, _ in batch]
+    jobs = [job for _, _, job in batch if job]
+    print(f"🎛 Batch of {len(batch)} for {bucket}s bucket")
+    
+    # Tokenize all prompts together, padded to the longest
+    with metrics.stage('tokenize'):
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+        
+        # Move inputs to same device as model
+        device = next(model.parameters()).device
+        inputs = {k: v.to(device) for k, v in inputs.items()}
+        inputs = encoder_cache.conditioning(model, inputs, guidance_scale)
+    
+    max_new_tokens = bucket * 50  # Approximate tokens per second
+    streamer = ProgressStreamer(jobs, max_new_tokens) if jobs else None
+    
+    # Generate audio
+    started = time.time()
+    with inference_context(model), metrics.stage('generate'):
+        audio_values = encoder_cache.generate(
+            model,
+            inputs,
+            max_new_tokens=max_new_tokens,
+            guidance_scale=guidance_scale,
+            streamer=streamer,
+            **sampling_kwargs(model, seed)
+        )
+    # Rate the audio every request gets back, not one bucket for the whole batch
+    audio_seconds = sum(duration for _, duration, _ in batch)
+    rtf = record_generation(time.time() - started, audio_seconds)
+    if rtf is not None:
+        print(f"⏱ Real-time factor {rtf:.2f} for {audio_seconds}s of audio in a batch of {len(batch)}")
+    
+    # Split the batch back out, trimming each track to its requested length
+    sample_rate = model.config.audio_encoder.sample_rate
+    paths = []
+    for i, (_, duration, _) in enumerate(batch):
+        audio = audio_values[i, 0, :duration * sample_rate].float().cpu()
+        
+        # Scratch file, moved into the cache or swept once it expires
+        path = audio_files.new_path('.wav')
+        with metrics.stage('save'):
+            torchaudio.save(path, audio.unsqueeze(0), sample_rate)
+        paths.append(path)
+    
+    return paths
+
+# Seconds of audio decoded per chunk on /generate/stream
+STREAM_WINDOW_SECONDS = float(os.environ.get('MUSICGEN_STREAM_WINDOW', 1.0))
+MAX_STREAMS = int(os.environ.get('MUSICGEN_STREAM_CONCURRENCY', 1))
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+# Long-form tracks are generated in overlapping windows (see long_form.py)
+LONG_FORM = {
+    'window': float(os.environ.get('MUSICGEN_LONG_WINDOW', 30)),
+    'overlap': float(os.environ.get('MUSICGEN_LONG_OVERLAP', 10)),
+    'crossfade': float(os.environ.get('MUSICGEN_LONG_CROSSFADE', 1.0))
+}
+MAX_LONG_DURATION = int(os.environ.get('MUSICGEN_MAX_LONG_DURATION', 600))
+
+# Concurrent generations are merged into one model.generate per duration bucket
+BATCH_BUCKET_SECONDS = int(os.environ.get('MUSICGEN_BATCH_BUCKET', 5))
+generation_batcher = MicroBatcher(
+    generate_batch,
+    window=int(os.environ.get('MUSICGEN_BATCH_WINDOW_MS', 100)) / 1000,
+    max_batch=int(os.environ.get('MUSICGEN_MAX_BATCH', 4)),
+    name='musicgen-batcher'
+)
+
+def generate_techno_audio(prompt, duration=20, job=None, seed=None, guidance_scale=3.0):
     """Generate TECHNO audio using MusicGen"""
     try:
+        # Queued jobs were already counted when /generate checked the cache
+        cache_key = GenerationCache.make_key(prompt, duration, seed, guidance_scale, MODEL_NAME)
+        cached_file = generation_cache.get(cache_key, record=job is None)
+        if cached_file:
+            print(f"⚡ Cache hit for: {prompt}")
+            return cached_file
+        
         if not model_loaded:
             if not load_model():
                 return None
         
         print(f"🎵 Generating audio for: {prompt}")
         
-        # Tokenize the prompt
-        inputs = tokenizer(prompt, return_tensors="pt", padding=True)
-        
-        # Move inputs to same device as model
-        device = next(model.parameters()).device
-        inputs = {k: v.to(device) for k, v in inputs.items()}
+        # Only requests sharing a seed and guidance scale can share a batch
+        batch_key = (duration_bucket(duration), seed, guidance_scale)
+        audio_file = generation_batcher.submit(batch_key, (prompt, duration, job)).result()
+        audio_file = generation_cache.put(cache_key, audio_file)
+        audio_files.prepare(audio_file)
+        return audio_file
         
-        # Generate audio
-        with torch.no_grad():
-            audio_values = model.generate(
-                **inputs,
-                max_new_tokens=duration * 50,  # Approximate tokens per second
-                do_sample=True,
-                guidance_scale=3.0,
-            )
+    except Exception as e:
+        print(f"❌ Audio generation error: {e}")
+        return None
+
+def generate_long_audio(params, job=None):
+    """Generate a long-form track window by window, reporting progress after each one"""
+    try:
+        cache_key = generation_key(params)
+        cached_file = generation_cache.get(cache_key, record=job is None)
+        if cached_file:
+            print(f"⚡ Cache hit for: {params['prompt']}")
+            return cached_file
         
-        # Convert to numpy and save as temporary file
-        audio_values = audio_values.cpu().numpy().squeeze()
+        if not model_loaded and not load_model():
+            return None
         
-        # Create temporary audio file
-        temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-        sample_rate = model.config.audio_encoder.sample_rate
+        def on_progress(done, total):
+            print(f"🪟 Window {done}/{total} done")
+            if job:
+                job.progress = min(done / total, 0.99)
         
-        torchaudio.save(
-            temp_file.name,
-            torch.from_numpy(audio_values).unsqueeze(0),
-            sample_rate
+        path = audio_files.new_path('.wav')
+        started = time.time()
+        generate_long(
+            model, processor, params['prompt'], params['duration'], path,
+            guidance_scale=params['guidance_scale'], seed=params['seed'], on_progress=on_progress, **LONG_FORM
         )
-        
-        return temp_file.name
+        rtf = record_generation(time.time() - started, params['duration'])
+        if rtf is not None:
+            print(f"⏱ Real-time factor {rtf:.2f} for {params['duration']}s long-form track")
+        audio_file = generation_cache.put(cache_key, path)
+        audio_files.prepare(audio_file)
+        return audio_file
         
     except Exception as e:
-        print(f"❌ Audio generation error: {e}")
+        print(f"❌ Long-form generation error: {e}")
         return None
 
 def create_techno_prompt(style, user_input):
@@ -108,24 +247,170 @@ def create_techno_prompt(style, user_input):
     base_style = TECHNO_STYLES.get(style, TECHNO_STYLES['minimal'])
     return f"{base_style}, {user_input}, electronic dance music, instrumental, professional production"
 
+class InvalidRequest(ValueError):
+    """A generation request with missing or malformed parameters (answered with 400)"""
+
+def parse_generation_request(data):
+    """Read generation parameters from a JSON body or query string"""
+    if data is None:
+        raise InvalidRequest('Expected a JSON body')
+    style = data.get('style', 'minimal')
+    user_prompt = data.get('prompt', 'TECHNO')
+    seed = data.get('seed')
+    long_form = data.get('long_form') in (True, 1, '1', 'true')
+    
+    try:
+        return {
+            'style': style,
+            'user_prompt': user_prompt,
+            'prompt': create_techno_prompt(style, user_prompt),  # TECHNO-optimized prompt
+            # 1 to 30 seconds, or up to MUSICGEN_MAX_LONG_DURATION in long-form mode
+            'duration': max(1, min(int(data.get('duration', 20)), MAX_LONG_DURATION if long_form else 30)),
+            'seed': int(seed) if seed is not None else None,
+            'guidance_scale': float(data.get('guidance_scale', 3.0)),
+            'long_form': long_form
+        }
+    except (TypeError, ValueError) as e:
+        raise InvalidRequest(f'Invalid generation parameters: {e}')
+
+def generation_key(params):
+    """Cache key covering every setting that shapes the output"""
+    extra = {'long_form': LONG_FORM} if params['long_form'] else {}
+    return GenerationCache.make_key(
+        params['prompt'], params['duration'], params['seed'], params['guidance_scale'], MODEL_NAME, **extra
+    )
+
+def flight_key(params):
+    """Single-flight key: identical requests in flight share one job"""
+    if not single_flight.ENABLED:
+        return None
+    return single_flight.make_key(
+        params['prompt'], params['duration'], params['seed'], params['guidance_scale'], MODEL_NAME,
+        long_form=params['long_form']
+    )
+
+def window_total(params):
+    return window_count(params['duration'], LONG_FORM['window'], LONG_FORM['overlap']) if params['long_form'] else 1
+
+def run_generation_job(job):
+    """Job queue handler - runs on the dedicated generation worker"""
+    params = job.params
+    print(f"🎵 Generating {params['style']} TECHNO with MusicGen (job {job.id})...")
+    print(f"📝 Prompt: {params['prompt']}")
+    print(f"⏱ Duration: {params['duration']} seconds")
+    
+    if params['long_form']:
+        audio_file = generate_long_audio(params, job=job)
+    else:
+        audio_file = generate_techno_audio(
+            params['prompt'],
+            params['duration'],
+            job=job,
+            seed=params['seed'],
+            guidance_scale=params['guidance_scale']
+        )
+    if not audio_file or not os.path.exists(audio_file):
+        job.error = 'Audio generation failed - MusicGen may need more memory or different settings'
+        return None
+    
+    return build_track(params, audio_file)
+
+def build_track(params, audio_file, cached=False):
+    """Track metadata returned once a job has audio, recorded in the track catalog
+
+    With the generation cache on, the catalog id comes from the cache key, so
+    a cache hit returns the row written when the audio was generated instead
+    of adding a duplicate.
+    """
+    track = {
+        'id': f"musicgen_{generation_key(params)[:24]}" if generation_cache.enabled
+              else track_catalog.new_track_id('musicgen'),
+        'title': f"{params['style'].title()} TECHNO - {params['user_prompt']}",
+        'audio_file': audio_file,  # Local file path
+        'audio_id': audio_files.audio_id(audio_file),
+        'style': params['style'],
+        'prompt': params['prompt'],
+        'status': 'generated',
+        'duration': params['duration'],
+        'long_form': params['long_form'],
+        'model': 'musicgen-small'
+    }
+    if cached and catalog.get(track['id']):
+        return track
+    return catalog.add(track, 'musicgen')
+
+def track_payload(track):
+    """Track as returned to clients, with absolute URLs the browser can play and download"""
+    return dict(track, **audio_files.track_urls(track['audio_id']))
+
+# Workers only feed the batcher, which owns the model; extra requests wait in a bounded queue
+generation_queue = JobQueue(
+    run_generation_job,
+    max_size=int(os.environ.get('MUSICGEN_QUEUE_SIZE', 16)),
+    workers=generation_batcher.max_batch,
+    ttl=int(os.environ.get('MUSICGEN_JOB_TTL', 3600)),
+    name='musicgen'
+)
+
+# Long-form jobs bypass the batcher and hold the model for minutes, so they get
+# their own few workers and never tie up the ones short jobs need
+long_jobs = JobQueue(
+    run_generation_job,
+    max_size=int(os.environ.get('MUSICGEN_QUEUE_SIZE', 16)),
+    workers=int(os.environ.get('MUSICGEN_LONG_CONCURRENCY', 1)),
+    ttl=int(os.environ.get('MUSICGEN_JOB_TTL', 3600)),
+    name='musicgen-long'
+)
+
+def queue_for(params):
+    return long_jobs if params['long_form'] else generation_queue
+
+def find_job(job_id):
+    return generation_queue.get(job_id) or long_jobs.get(job_id)
+
+# Read when /metrics is rendered
+metrics.QUEUE_DEPTH.set_function(lambda: generation_queue.depth(), queue='musicgen')
+metrics.QUEUE_DEPTH.set_function(lambda: long_jobs.depth(), queue='musicgen-long')
+metrics.QUEUE_DEPTH.set_function(lambda: generation_batcher.stats()['pending'], queue='musicgen-batcher')
+metrics.CACHE_HITS.set_function(lambda: generation_cache.stats()['hits'], cache='generation')
+metrics.CACHE_MISSES.set_function(lambda: generation_cache.stats()['misses'], cache='generation')
+metrics.CACHE_HITS.set_function(lambda: encoder_cache.stats()['hits'], cache='encoder')
+metrics.CACHE_MISSES.set_function(lambda: encoder_cache.stats()['misses'], cache='encoder')
+
+@app.before_request
+def ensure_model_loading():
+    model_pool.start_background_load()
+
 @app.route('/')
 def home():
     return f"""
     <h1>🤖 MusicGen TECHNO Generator</h1>
     <p>POST to /generate with JSON: {{"style": "minimal", "prompt": "dark warehouse vibes"}}</p>
     <p>Styles: minimal, acid, hard, melodic, dub, industrial</p>
+    <p>Add "long_form": true for tracks up to {MAX_LONG_DURATION // 60} minutes</p>
     <p>Model loaded: {'✅ Yes' if model_loaded else '❌ No - will load on first generation'}</p>
     <p>Device: {'🚀 GPU' if torch.cuda.is_available() else '💻 CPU'}</p>
     """
 
 @app.route('/health')
 def health():
+    # With preloading enabled, report not-ready until the weights are in memory
+    ready = model_pool.is_ready()
     return jsonify({
-        'status': 'healthy', 
+        'status': 'healthy' if ready else 'loading',
         'service': 'musicgen-techno-generator',
         'model_loaded': model_loaded,
-        'gpu_available': torch.cuda.is_available()
-    })
+        'model_pool': model_pool.load_status(),
+        'gpu_available': torch.cuda.is_available(),
+        'queue': generation_queue.stats(),
+        'long_jobs': long_jobs.stats(),
+        'cache': generation_cache.stats(),
+        'encoder_cache': encoder_cache.stats(),
+        'audio': audio_files.stats(),
+        'batching': generation_batcher.stats(),
+        'track_catalog': catalog.stats(),
+        'inference': inference_stats(model if model_loaded else None)
+    }), 200 if ready else 503
 
 @app.route('/load_model', methods=['POST'])
 def load_model_endpoint():
@@ -160,50 +445,56 @@ def test_api():
 
 @app.route('/generate', methods=['POST'])
 def generate_techno():
-    """Generate real TECHNO track using MusicGen"""
+    """Queue a real TECHNO track for MusicGen and return its job id"""
     try:
-        data = request.get_json()
-        
-        style = data.get('style', 'minimal')
-        user_prompt = data.get('prompt', 'TECHNO')
-        duration = min(int(data.get('duration', 20)), 30)  # Max 30 seconds
+        params = parse_generation_request(request.get_json(silent=True))
+        style = params['style']
         
-        # Create TECHNO-optimized prompt
-        full_prompt = create_techno_prompt(style, user_prompt)
-        
-        print(f"🎵 Generating {style} TECHNO with MusicGen...")
-        print(f"📝 Prompt: {full_prompt}")
-        print(f"⏱ Duration: {duration} seconds")
-        
-        # Generate audio
-        audio_file = generate_techno_audio(full_prompt, duration)
-        
-        if audio_file and os.path.exists(audio_file):
-            # In a real implementation, you'd serve this file or upload to cloud storage
-            # For now, just return success with file path
-            track_id = f'musicgen_{int(time.time())}'
-            
+        # Identical generations are served straight from the cache
+        cache_key = generation_key(params)
+        cached_file = generation_cache.get(cache_key)
+        if cached_file:
+            job = queue_for(params).add_completed(params, build_track(params, cached_file, cached=True))
             return jsonify({
                 'success': True,
-                'track': {
-                    'id': track_id,
-                    'title': f'{style.title()} TECHNO - {user_prompt}',
-                    'audio_file': audio_file,  # Local file path
-                    'style': style,
-                    'prompt': full_prompt,
-                    'status': 'generated',
-                    'duration': duration,
-                    'model': 'musicgen-small'
-                },
-                'message': f'Real {style} TECHNO generated with MusicGen!',
-                'note': 'Audio file generated locally - implement file serving for web access'
+                'job_id': job.id,
+                'status': job.status,
+                'cached': True,
+                'status_url': f'{request.script_root}/jobs/{job.id}',
+                'audio_url': audio_files.track_urls(job.result['audio_id'])['audio_url'],
+                'track': track_payload(job.result),
+                'message': f'{style.title()} TECHNO served from cache'
             })
-        else:
-            return jsonify({
-                'error': 'Audio generation failed',
-                'details': 'MusicGen model may need more memory or different settings',
-                'prompt': full_prompt
-            }), 500
+        
+        # An identical request already queued or running is joined rather than repeated
+        jobs = queue_for(params)
+        job, joined = jobs.submit_or_join(params, key=flight_key(params))
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'shared': joined,
+            'status_url': f'{request.script_root}/jobs/{job.id}',
+            'audio_url': url_for('job_audio', job_id=job.id, _external=True),
+            'queue_depth': jobs.depth(),
+            'windows': window_total(job.params),
+            'message': f'Joined an identical {style} TECHNO generation' if joined
+                       else f'{style.title()} TECHNO queued for MusicGen'
+        }), 202
+        
+    except QueueFull as e:
+        response = jsonify({
+            'error': 'Generation queue is full',
+            'queue_depth': e.depth,
+            'max_queue': e.max_size,
+            'details': 'Retry shortly'
+        })
+        response.headers['Retry-After'] = '10'
+        return response, 429
+    
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
             
     except Exception as e:
         print(f"❌ Generation error: {str(e)}")
@@ -213,14 +504,137 @@ def generate_techno():
             'details': 'Check system requirements and model loading'
         }), 500
 
+@app.route('/generate/stream', methods=['GET', 'POST'])
+def generate_stream():
+    """Stream a TECHNO track as WAV while MusicGen is still decoding
+
+    ?cached=1 never generates: it redirects to the finished track's
+    /audio/<id> (for download links), or answers 404 until there is one.
+    """
+    try:
+        # GET lets an <audio> element point straight at this endpoint
+        params = parse_generation_request(request.get_json(silent=True) or request.args)
+        if params['long_form']:
+            return jsonify({'error': 'Long-form tracks are generated as jobs - POST to /generate'}), 400
+        duration = params['duration']
+        seed = params['seed']
+        guidance_scale = params['guidance_scale']
+        
+        cache_key = generation_key(params)
+        cached_file = generation_cache.get(cache_key)
+        if request.args.get('cached') == '1':
+            if not cached_file:
+                return jsonify({'error': 'Track has not finished streaming yet'}), 404
+            return redirect(f'{request.script_root}/audio/{cache_key}')
+        if cached_file:
+            return audio_files.send(cache_key)
+        
+        if not model_loaded and not load_model():
+            return jsonify({'error': 'Failed to load model'}), 500
+        
+        # Each stream runs its own model.generate beside the queue worker, so only a few at once
+        if not stream_slots.acquire(blocking=False):
+            return jsonify({
+                'error': 'Too many streams in progress',
+                'max_streams': MAX_STREAMS,
+                'details': 'Retry shortly, or POST to /generate to queue the track'
+            }), 429, {'Retry-After': '10'}
+        try:
+            print(f"📡 Streaming {params['style']} TECHNO: {params['prompt']}")
+        
+            with metrics.stage('tokenize'):
+                inputs = tokenizer(params['prompt'], return_tensors="pt", padding=True)
+                device = next(model.parameters()).device
+                inputs = {k: v.to(device) for k, v in inputs.items()}
+                inputs = encoder_cache.conditioning(model, inputs, guidance_scale)
+        
+            sample_rate = model.config.audio_encoder.sample_rate
+            frame_rate = model.config.audio_encoder.frame_rate
+            play_steps = max(int(frame_rate * STREAM_WINDOW_SECONDS), model.decoder.num_codebooks + 1)
+        
+            def save_to_cache(audio):
+                path = audio_files.new_path('.wav')
+                audio = torch.from_numpy(audio[:duration * sample_rate]).unsqueeze(0)
+                with metrics.stage('save'):
+                    torchaudio.save(path, audio, sample_rate)
+                audio_files.prepare(generation_cache.put(cache_key, path))
+        
+            stream = stream_wav(
+                model,
+                inputs,
+                {'max_new_tokens': duration * 50, 'guidance_scale': guidance_scale, **sampling_kwargs(model, seed)},
+                play_steps=play_steps,
+                on_complete=save_to_cache,
+                generate=encoder_cache.generate
+            )
+            response = Response(stream, mimetype='audio/wav', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # Don't let a proxy hold chunks back
+            })
+        except BaseException:
+            stream_slots.release()
+            raise
+        # Held until the response is closed, which also stops the generate thread
+        response.call_on_close(stream_slots.release)
+        return response
+    
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        print(f"❌ Streaming error: {str(e)}")
+        return jsonify({
+            'error': f'Streaming failed: {str(e)}',
+            'type': type(e).__name__
+        }), 500
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report progress of a queued generation"""
+    job = find_job(job_id)
+    if not job:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    
+    status = job.to_dict()
+    status['queue_depth'] = queue_for(job.params).depth()
+    status['windows'] = window_total(job.params)
+    if job.status == 'completed':
+        status['track'] = track_payload(job.result)
+        status['audio_url'] = status['track']['audio_url']
+    return jsonify(status)
+
+@app.route('/jobs/<job_id>/audio')
+def job_audio(job_id):
+    """Return the generated audio once the job is complete"""
+    job = find_job(job_id)
+    if not job:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    if job.status != 'completed':
+        return jsonify({'error': f'Job is {job.status}', 'progress': job.progress}), 409
+    
+    if not audio_files.resolve(job.result['audio_id']):
+        return jsonify({'error': 'Audio file no longer available'}), 410
+    return audio_files.send(job.result['audio_id'])
+
+@app.route('/audio/<audio_id>')
+def serve_audio(audio_id):
+    """Generated audio with Range support, so players can seek without re-downloading"""
+    return audio_files.send(audio_id)
+
+model_pool.preload(load_model)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5003))
     print("🎵 Starting MusicGen TECHNO Generator")
     print(f"📡 Server: http://localhost:{port}")
     print("🎛 Styles:", list(TECHNO_STYLES.keys()))
-    print("🔄 Note: Model will auto-load on first generation")
+    if model_pool.PRELOAD_MODE == 'off':
+        print("🔄 Note: Model will auto-load on first generation (set MUSICGEN_PRELOAD to load at startup)")
+    print("📬 /generate returns a job id - poll /jobs/<id>, then play its audio_url")
+    print("📡 /generate/stream plays while MusicGen is still decoding")
     print("💾 First run downloads ~1.5GB MusicGen model")
     print("🚀 GPU recommended for faster generation")
     print("=" * 60)
+    model_pool.start_background_load()
     
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+MusicGen Audio Streaming
+Decodes audio tokens window by window while model.generate is still running
+"""
+
+import queue
+import struct
+import threading
+
+import numpy as np
+import torch
+from transformers.generation.streamers import BaseStreamer
+
+import metrics
+from cpu_inference import inference_context
+
+
+class StreamCancelled(Exception):
+    """Raised inside model.generate once the client has gone away"""
+
+
+class MusicgenStreamer(BaseStreamer):
+    """Collects generated codes and pushes decoded audio every play_steps tokens
+
+    Only batch size 1 is supported. Each window is decoded through the audio
+    encoder together with everything generated so far; the last `stride`
+    samples are held back until the next window so chunk edges stay clean.
+    """
+
+    def __init__(self, model, play_steps=50, stride=None, timeout=None):
+        self.decoder = model.decoder
+        self.audio_encoder = model.audio_encoder
+        self.generation_config = model.generation_config
+        self.play_steps = play_steps
+        if stride is not None:
+            self.stride = stride
+        else:
+            hop_length = int(np.prod(self.audio_encoder.config.upsampling_ratios))
+            self.stride = hop_length * (play_steps - self.decoder.num_codebooks) // 6
+        self.token_cache = None
+        self.to_yield = 0
+        self.audio_queue = queue.Queue()
+        self.stop_signal = None
+        self.timeout = timeout
+        self.cancelled = threading.Event()
+
+    def decode(self, input_ids):
+        """Undo the codebook delay pattern and decode codes to a float waveform"""
+        _, delay_pattern_mask = self.decoder.build_delay_pattern_mask(
+            input_ids[:, :1],
+            pad_token_id=self.generation_config.decoder_start_token_id,
+            max_length=input_ids.shape[-1],
+        )
+        input_ids = self.decoder.apply_delay_pattern_mask(input_ids, delay_pattern_mask)
+        input_ids = input_ids[input_ids != self.generation_config.pad_token_id].reshape(
+            1, self.decoder.num_codebooks, -1
+        )
+        input_ids = input_ids[None, ...].to(self.audio_encoder.device)
+        output_values = self.audio_encoder.decode(input_ids, audio_scales=[None])
+        return output_values.audio_values[0, 0].cpu().float().numpy()
+
+    def put(self, value):
+        if self.cancelled.is_set():
+            raise StreamCancelled()
+
+        batch_size = value.shape[0] // self.decoder.num_codebooks
+        if batch_size > 1:
+            raise ValueError("MusicgenStreamer only supports batch size 1")
+
+        if self.token_cache is None:
+            self.token_cache = value
+        else:
+            self.token_cache = torch.cat([self.token_cache, value[:, None]], dim=-1)
+
+        if self.token_cache.shape[-1] % self.play_steps == 0:
+            audio_values = self.decode(self.token_cache)
+            self.audio_queue.put(audio_values[self.to_yield:-self.stride], timeout=self.timeout)
+            self.to_yield = len(audio_values) - self.stride
+
+    def end(self):
+        if self.token_cache is not None:
+            audio_values = self.decode(self.token_cache)
+        else:
+            audio_values = np.zeros(self.to_yield)
+        self.audio_queue.put(audio_values[self.to_yield:], timeout=self.timeout)
+        self.audio_queue.put(self.stop_signal, timeout=self.timeout)
+
+    def restart(self):
+        """Forget a failed attempt's tokens so generate can run again; False once audio went out"""
+        if self.to_yield:
+            return False
+        self.token_cache = None
+        return True
+
+    def fail(self, error):
+        """Unblock the consumer when generation dies part way through"""
+        self.audio_queue.put(error)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        value = self.audio_queue.get(timeout=self.timeout)
+        if value is self.stop_signal:
+            raise StopIteration()
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+
+def wav_stream_header(sample_rate, channels=1, bits_per_sample=16):
+    """RIFF header for a WAV of unknown length, as used for live streams"""
+    block_align = channels * bits_per_sample // 8
+    data_size = 0xFFFFFFFF - 36
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', data_size + 36, b'WAVE',
+        b'fmt ', 16, 1, channels, sample_rate, sample_rate * block_align, block_align, bits_per_sample,
+        b'data', data_size
+    )
+
+
+def pcm16(audio):
+    """Float waveform in [-1, 1] to little-endian 16-bit PCM bytes"""
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+def stream_wav(model, inputs, generate_kwargs, play_steps=50, on_complete=None, generate=None):
+    """Run model.generate on a background thread and yield WAV bytes as they decode
+
+    on_complete(audio) receives the full float waveform if the stream finishes.
+    generate(model, inputs, **kwargs), e.g. EncoderCache.generate, replaces
+    the plain model.generate call.
+    """
+    streamer = MusicgenStreamer(model, play_steps=play_steps, timeout=300)
+    sample_rate = model.config.audio_encoder.sample_rate
+
+    def run():
+        try:
+            with inference_context(model), metrics.stage('generate'):
+                if generate is not None:
+                    generate(model, inputs, streamer=streamer, **generate_kwargs)
+                else:
+                    model.generate(**inputs, streamer=streamer, **generate_kwargs)
+        except StreamCancelled:
+            print("🛑 Stream cancelled by client")
+        except Exception as e:
+            print(f"❌ Streaming generation error: {e}")
+            streamer.fail(e)
+
+    threading.Thread(target=run, name='musicgen-stream', daemon=True).start()
+
+    chunks = []
+    completed = False
+    try:
+        yield wav_stream_header(sample_rate)
+        for audio in streamer:
+            if len(audio):
+                chunks.append(audio)
+                yield pcm16(audio)
+        completed = True
+    finally:
+        # Also runs when the client disconnects, which stops the generate thread
+        streamer.cancelled.set()
+        if completed and on_complete and chunks:
+            on_complete(np.concatenate(chunks))
@@ -21,8 +21,14 @@ from flask_cors import CORS
 import time
 import random
 
+import metrics
+import track_catalog
+
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app, 'quiet')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
 
 # TECHNO styles (same as simple_server.py)
 TECHNO_STYLES = {
@@ -83,18 +89,18 @@ def generate_techno():
         time.sleep(random.uniform(1, 3))
         
         # Mock successful response
-        track_id = f'techno_{int(time.time())}'
+        track = catalog.add({
+            'id': track_catalog.new_track_id('quiet'),
+            'title': f'{style.title()} TECHNO - {prompt}',
+            'audio_url': 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav',
+            'style': style,
+            'prompt': f'{TECHNO_STYLES[style]}, {prompt}',
+            'status': 'mock_generated'
+        }, 'quiet')
         
         return jsonify({
             'success': True,
-            'track': {
-                'id': track_id,
-                'title': f'{style.title()} TECHNO - {prompt}',
-                'audio_url': 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav',
-                'style': style,
-                'prompt': f'{TECHNO_STYLES[style]}, {prompt}',
-                'status': 'mock_generated'
-            },
+            'track': track,
             'message': f'Mock {style} TECHNO generated (quiet mode)!'
         })
         
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Upstream Rate Limiter
+Per-key token buckets plus a per-provider concurrency cap in front of every upstream call
+
+A burst from one API key queues behind that key's bucket instead of getting
+the key throttled upstream, and no provider ever sees more than its
+concurrency cap from this process. Callers wait in line until their
+deadline, then get RateLimited with a Retry-After hint. Upstream 429s pause
+the offending key for as long as the provider asks. A caller turned away
+at the concurrency cap gets its token back, and keys whose bucket has
+refilled are dropped once a minute, so idle keys cost no memory.
+
+Settings (UPSTREAM_<PROVIDER>_<SETTING> overrides UPSTREAM_<SETTING>, e.g. UPSTREAM_SUNO_RATE):
+  UPSTREAM_RATE            - sustained requests per second per key (default 1)
+  UPSTREAM_BURST           - requests a key may burst before queueing (default 5)
+  UPSTREAM_MAX_CONCURRENCY - concurrent calls per provider (default 8)
+  UPSTREAM_MAX_WAIT        - seconds a call may queue before failing (default 10)
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import metrics
+
+
+class RateLimited(Exception):
+    """Raised when a call can't be made before its deadline, or upstream answered 429"""
+
+    def __init__(self, provider, retry_after, upstream=False):
+        source = 'upstream' if upstream else 'local'
+        super().__init__(f"{provider} rate limit reached ({source}), retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+        self.upstream = upstream
+
+
+def parse_retry_after(value, default=5.0):
+    """Seconds from a Retry-After header given as seconds or an HTTP date"""
+    if not value:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def _key_id(key):
+    # Never keep raw API keys around as dict keys
+    return hashlib.sha256((key or '').encode('utf-8')).hexdigest()[:16]
+
+
+class ProviderLimiter:
+    """Token bucket per key and a concurrency cap for one provider"""
+
+    SWEEP_INTERVAL = 60  # Seconds between sweeps of idle keys
+
+    def __init__(self, name, rate=1.0, burst=5, max_concurrency=8, max_wait=10.0):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait
+        self._buckets = {}  # key id -> [tokens, updated_at]
+        self._blocked_until = {}  # key id -> time upstream told us to wait until
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphore = None  # (event loop, asyncio.Semaphore)
+        self._lock = threading.Lock()
+        self._swept_at = time.time()
+        self.in_flight = 0
+        self.waited = 0
+        self.rejected = 0
+        self.upstream_429s = 0
+
+    def _reserve(self, key_id, now):
+        """Take a token, returning how long the caller must wait for it"""
+        tokens, updated_at = self._buckets.get(key_id, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        wait = max(self._blocked_until.get(key_id, 0) - now, 0.0)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / self.rate)
+        return tokens, wait
+
+    def _take(self, key, max_wait):
+        """Spend a token for key, returning how long to sleep before using it"""
+        key_id = _key_id(key)
+        with self._lock:
+            now = time.time()
+            tokens, wait = self._reserve(key_id, now)
+            if wait > max_wait:
+                self.rejected += 1
+                raise RateLimited(self.name, wait)
+            # Spending the token now (possibly going negative) queues callers in arrival order
+            self._buckets[key_id] = [tokens - 1, now]
+            if wait > 0:
+                self.waited += 1
+            if now - self._swept_at > self.SWEEP_INTERVAL:
+                self._sweep(now)
+        return wait
+
+    def _refund(self, key):
+        """Give back the token of a call that never reached upstream"""
+        with self._lock:
+            bucket = self._buckets.get(_key_id(key))
+            if bucket is not None:
+                bucket[0] = min(self.burst, bucket[0] + 1)
+
+    def _sweep(self, now):
+        # A refilled, unpaused key behaves exactly like one never seen, so forget it
+        self._swept_at = now
+        for key_id, until in list(self._blocked_until.items()):
+            if until <= now:
+                del self._blocked_until[key_id]
+        for key_id, (tokens, updated_at) in list(self._buckets.items()):
+            if tokens + (now - updated_at) * self.rate >= self.burst and key_id not in self._blocked_until:
+                del self._buckets[key_id]
+
+    def _concurrency_rejected(self):
+        with self._lock:
+            self.rejected += 1
+        return RateLimited(self.name, 1.0)
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @contextmanager
+    def slot(self, key, max_wait=None):
+        """Hold a rate-limited, concurrency-capped slot for one upstream call"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.time() + max_wait
+        wait = self._take(key, max_wait)
+        if wait > 0:
+            time.sleep(wait)
+
+        if not self._semaphore.acquire(timeout=max(deadline - time.time(), 0)):
+            self._refund(key)
+            raise self._concurrency_rejected()
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+            self._semaphore.release()
+
+    @asynccontextmanager
+    async def async_slot(self, key, max_wait=None):
+        """slot() for coroutines; the concurrency cap is per event loop"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.time() + max_wait
+        wait = self._take(key, max_wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        loop = asyncio.get_running_loop()
+        if self._async_semaphore is None or self._async_semaphore[0] is not loop:
+            self._async_semaphore = (loop, asyncio.Semaphore(self.max_concurrency))
+        semaphore = self._async_semaphore[1]
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=max(deadline - time.time(), 0.001))
+        except asyncio.TimeoutError:
+            self._refund(key)
+            raise self._concurrency_rejected()
+        self._enter()
+        try:
+            yield
+        finally:
+            self._exit()
+            semaphore.release()
+
+    def note_retry_after(self, key, seconds):
+        with self._lock:
+            self.upstream_429s += 1
+            key_id = _key_id(key)
+            self._blocked_until[key_id] = max(self._blocked_until.get(key_id, 0), time.time() + seconds)
+
+    def request(self, key, send, max_wait=None):
+        """Run send() -> response inside a slot, turning upstream 429s into RateLimited"""
+        with self.slot(key, max_wait):
+            started = time.perf_counter()
+            try:
+                response = send()
+            except Exception:
+                metrics.record_upstream(self.name, 'error', time.perf_counter() - started)
+                raise
+        metrics.record_upstream(self.name, response.status_code, time.perf_counter() - started)
+        return self._check_response(key, response)
+
+    async def async_request(self, key, send, max_wait=None):
+        """request() for coroutines; send() returns an awaitable response"""
+        async with self.async_slot(key, max_wait):
+            started = time.perf_counter()
+            try:
+                response = await send()
+            except Exception:
+                metrics.record_upstream(self.name, 'error', time.perf_counter() - started)
+                raise
+        metrics.record_upstream(self.name, response.status_code, time.perf_counter() - started)
+        return self._check_response(key, response)
+
+    def _check_response(self, key, response):
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            self.note_retry_after(key, retry_after)
+            raise RateLimited(self.name, retry_after, upstream=True)
+        return response
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            return {
+                'rate_per_key': self.rate,
+                'burst': self.burst,
+                'max_concurrency': self.max_concurrency,
+                'in_flight': self.in_flight,
+                'keys': len(self._buckets),
+                'keys_paused': sum(1 for until in self._blocked_until.values() if until > now),
+                'waited': self.waited,
+                'rejected': self.rejected,
+                'upstream_429s': self.upstream_429s
+            }
+
+
+_limiters = {}
+_lock = threading.Lock()
+
+
+def _setting(name, setting, default):
+    value = os.environ.get(f'UPSTREAM_{name.upper()}_{setting}', os.environ.get(f'UPSTREAM_{setting}'))
+    return float(value) if value else default
+
+
+def get_limiter(name):
+    """Shared limiter for one upstream provider, e.g. 'suno', 'udio' or 'replicate'"""
+    with _lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = ProviderLimiter(
+                name,
+                rate=_setting(name, 'RATE', 1.0),
+                burst=_setting(name, 'BURST', 5),
+                max_concurrency=int(_setting(name, 'MAX_CONCURRENCY', 8)),
+                max_wait=_setting(name, 'MAX_WAIT', 10.0)
+            )
+            _limiters[name] = limiter
+        return limiter
+
+
+def limiter_stats():
+    with _lock:
+        limiters = dict(_limiters)
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def rate_limited_response(e):
+    """Flask (body, status, headers) tuple for a RateLimited error"""
+    from flask import jsonify
+
+    retry_after = max(int(e.retry_after + 0.999), 1)
+    return jsonify({
+        'error': str(e),
+        'provider': e.provider,
+        'retry_after': retry_after
+    }), 429, {'Retry-After': str(retry_after)}
@@ -8,24 +8,36 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS
 import requests
 import os
-import time
+
+import http_pool
+import metrics
+import single_flight
+import track_catalog
+from job_queue import JobQueue
+from rate_limiter import RateLimited, get_limiter, limiter_stats, rate_limited_response
+from udio_tracker import UdioStatusTracker, TrackTimeout
 
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app, 'real_udio')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
 
 class UdioWrapper:
-    API_BASE_URL = "https://www.udio.com/api"
+    API_BASE_URL = os.environ.get('UDIO_API_BASE', "https://www.udio.com/api")
 
     def __init__(self, auth_token):
         self.auth_token = auth_token
-        self.all_track_ids = []
 
-    def make_request(self, url, method, data=None, headers=None):
+    def make_request(self, url, method, data=None, headers=None, max_wait=None):
         try:
+            session = http_pool.get_session('udio')
             if method == 'POST':
-                response = requests.post(url, headers=headers, json=data)
+                send = lambda: session.post(url, headers=headers, json=data, timeout=30)
             else:
-                response = requests.get(url, headers=headers)
+                send = lambda: session.get(url, headers=headers, timeout=30)
+            # Raises RateLimited for the caller rather than returning None
+            response = get_limiter('udio').request(self.auth_token, send, max_wait)
             response.raise_for_status()
             return response
         except requests.exceptions.RequestException as e:
@@ -53,50 +65,24 @@ class UdioWrapper:
             })
         return headers
 
-    def create_song(self, prompt, seed=-1, custom_lyrics=None):
-        song_result = self.generate_song(prompt, seed, custom_lyrics)
-        if not song_result:
-            return None
-        track_ids = song_result.get('track_ids', [])
-        self.all_track_ids.extend(track_ids)
-        return self.process_songs(track_ids, "techno_tracks")
-
-    def generate_song(self, prompt, seed, custom_lyrics=None):
+    def generate_request(self, prompt, seed, custom_lyrics=None):
+        """(url, headers, json body) for a generation"""
         url = f"{self.API_BASE_URL}/generate-proxy"
         headers = self.get_headers()
         data = {"prompt": prompt, "samplerOptions": {"seed": seed}}
         if custom_lyrics:
             data["lyricInput"] = custom_lyrics
+        return url, headers, data
+
+    def generate_song(self, prompt, seed, custom_lyrics=None):
+        url, headers, data = self.generate_request(prompt, seed, custom_lyrics)
         response = self.make_request(url, 'POST', data, headers)
         return response.json() if response else None
 
-    def process_songs(self, track_ids, folder):
-        """Process generated songs and wait until ready"""
-        print(f"Processing TECHNO tracks: {track_ids}")
-        max_wait_time = 300  # 5 minutes max wait
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait_time:
-            status_result = self.check_song_status(track_ids)
-            if status_result is None:
-                print(f"Error checking song status.")
-                return None
-            elif status_result.get('all_finished', False):
-                songs = []
-                for song in status_result['data']['songs']:
-                    songs.append(song)
-                print(f"TECHNO tracks ready!")
-                return songs
-            else:
-                time.sleep(5)
-        
-        print("Timeout waiting for tracks to complete")
-        return None
-
-    def check_song_status(self, song_ids):
+    def check_song_status(self, song_ids, max_wait=None):
         url = f"{self.API_BASE_URL}/songs?songIds={','.join(song_ids)}"
         headers = self.get_headers(True)
-        response = self.make_request(url, 'GET', None, headers)
+        response = self.make_request(url, 'GET', None, headers, max_wait)
         if response:
             data = response.json()
             all_finished = all(song['finished'] for song in data['songs'])
@@ -104,6 +90,33 @@ class UdioWrapper:
         else:
             return None
 
+def fetch_song_statuses(auth_token, track_ids):
+    """One batched songs?songIds= call for the status tracker"""
+    try:
+        status_result = UdioWrapper(auth_token).check_song_status(track_ids, max_wait=0)
+    except RateLimited:
+        # Not an error - this token's tracks are simply checked again next tick
+        return []
+    return status_result['data']['songs'] if status_result else None
+
+# Every waiting generation shares one poller instead of sleeping in its own request
+status_tracker = UdioStatusTracker(
+    fetch_song_statuses,
+    min_interval=float(os.environ.get('UDIO_POLL_MIN_SECONDS', 2)),
+    max_interval=float(os.environ.get('UDIO_POLL_MAX_SECONDS', 30)),
+    timeout=int(os.environ.get('UDIO_TRACK_TIMEOUT', 300))
+)
+
+# Every generation is a job; the status tracker finishes it, not queue workers
+udio_jobs = JobQueue(None, ttl=int(os.environ.get('UDIO_JOB_TTL', 3600)), name='udio')
+
+# Identical requests in flight share one Udio generation (and its credits)
+generation_flight = single_flight.flight_from_env('udio')
+
+def generation_key(style, full_prompt, mode, auth_token):
+    # Sync requests share finished tracks, async ones share a job, so keep them apart
+    return single_flight.make_key('udio', full_prompt, style=style, mode=mode, credentials=auth_token)
+
 # TECHNO-specific prompts optimized for Udio
 TECHNO_STYLES = {
     'minimal': 'Minimal techno, hypnotic loops, stripped-down beats, repetitive patterns, underground warehouse atmosphere, 130 BPM',
@@ -119,12 +132,29 @@ def create_techno_prompt(style, user_input):
     base_style = TECHNO_STYLES.get(style, TECHNO_STYLES['minimal'])
     return f"{base_style}, {user_input}, electronic dance music, instrumental, club ready, professional production"
 
+def build_track(song, style, user_prompt, full_prompt):
+    return {
+        'id': song.get('id'),
+        'title': song.get('title', f'{style.title()} TECHNO - {user_prompt}'),
+        'audio_url': song.get('song_path'),
+        'style': style,
+        'prompt': full_prompt,
+        'status': 'real_generated',
+        'duration': song.get('duration_seconds', 'unknown'),
+        'created_at': song.get('created_at')
+    }
+
+def catalog_tracks(songs, style, user_prompt, full_prompt):
+    """Tracks for finished songs, recorded in the track catalog"""
+    return [catalog.add(build_track(song, style, user_prompt, full_prompt), 'real_udio') for song in songs]
+
 @app.route('/')
 def home():
     """API home page"""
     return """
     <h1>🤖 Real Udio TECHNO Generator API</h1>
     <p>POST to /generate with JSON: {"style": "minimal", "prompt": "dark warehouse vibes", "auth_token": "your-udio-token"}</p>
+    <p>Returns a job id at once; poll /jobs/&lt;id&gt; for the finished track</p>
     <p>Styles: minimal, acid, hard, melodic, dub, industrial</p>
     <p>Status: Ready for real TECHNO generation!</p>
     """
@@ -132,7 +162,15 @@ def home():
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'real-udio-techno-generator'})
+    return jsonify({
+        'status': 'healthy',
+        'service': 'real-udio-techno-generator',
+        'upstream_pools': http_pool.pool_stats(),
+        'rate_limits': limiter_stats(),
+        'status_tracker': status_tracker.stats(),
+        'single_flight': generation_flight.stats(),
+        'track_catalog': catalog.stats()
+    })
 
 @app.route('/test', methods=['POST'])
 def test_api():
@@ -185,36 +223,11 @@ def generate_techno():
         # Initialize Udio wrapper with real auth token
         udio = UdioWrapper(auth_token)
         
-        # Generate TECHNO track with Udio
-        result = udio.create_song(
-            prompt=full_prompt,
-            seed=-1,  # Random generation
-            custom_lyrics=""  # Instrumental TECHNO
-        )
-        
-        if result and len(result) > 0:
-            track = result[0]  # Get first generated track
-            return jsonify({
-                'success': True,
-                'track': {
-                    'id': track.get('id'),
-                    'title': track.get('title', f'{style.title()} TECHNO - {user_prompt}'),
-                    'audio_url': track.get('song_path'),
-                    'style': style,
-                    'prompt': full_prompt,
-                    'status': 'real_generated',
-                    'duration': track.get('duration_seconds', 'unknown'),
-                    'created_at': track.get('created_at')
-                },
-                'message': f'Real {style} TECHNO generated with Udio!'
-            })
-        else:
-            return jsonify({
-                'error': 'No tracks generated',
-                'details': 'Udio API may be busy or token invalid',
-                'prompt': full_prompt
-            }), 500
+        # Udio takes minutes; the status tracker finishes the job instead of this request thread
+        return start_async_generation(udio, style, user_prompt, full_prompt)
             
+    except RateLimited as e:
+        return rate_limited_response(e)
     except Exception as e:
         print(f"❌ Generation error: {str(e)}")
         return jsonify({
@@ -223,6 +236,68 @@ def generate_techno():
             'details': 'Check your Udio auth token and try again'
         }), 500
 
+def follow_generation(auth_token, track_ids, style, user_prompt, full_prompt):
+    """Record a job that completes once the status tracker sees all track_ids finish"""
+    job = udio_jobs.add_external({'style': style, 'prompt': user_prompt, 'track_ids': track_ids})
+    for track_id in track_ids:
+        catalog.add(dict(build_track({'id': track_id}, style, user_prompt, full_prompt), status='processing'),
+                    'real_udio')
+    
+    def on_done(future):
+        try:
+            songs = future.result()
+        except (TrackTimeout, RuntimeError) as e:
+            for track_id in track_ids:
+                catalog.update(track_id, 'failed')
+            udio_jobs.finish(job, error=str(e))
+            return
+        udio_jobs.finish(job, catalog_tracks(songs, style, user_prompt, full_prompt))
+    
+    status_tracker.track(auth_token, track_ids).add_done_callback(on_done)
+    return job
+
+def job_payload(job):
+    status = job.to_dict()
+    status['track_ids'] = job.params['track_ids']
+    if job.status == 'completed':
+        status['track'] = job.result[0]
+        status['tracks'] = job.result
+    return status
+
+def start_async_generation(udio, style, user_prompt, full_prompt):
+    """Start a Udio generation and let the status tracker finish it in the background"""
+    def start():
+        song_result = udio.generate_song(full_prompt, -1, "")
+        track_ids = song_result.get('track_ids', []) if song_result else []
+        if not track_ids:
+            return None
+        return follow_generation(udio.auth_token, track_ids, style, user_prompt, full_prompt)
+    
+    job = generation_flight.do(generation_key(style, full_prompt, 'async', udio.auth_token), start)
+    if job is None:
+        return jsonify({
+            'error': 'No tracks generated',
+            'details': 'Udio API may be busy or token invalid',
+            'prompt': full_prompt
+        }), 500
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'track_ids': job.params['track_ids'],
+        'status_url': f'{request.script_root}/jobs/{job.id}'
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report an async Udio generation"""
+    job = udio_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    
+    return jsonify(job_payload(job))
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))  # Use different port to avoid conflicts
     print("🎵 Starting Real Udio TECHNO Generator")
@@ -231,4 +306,4 @@ if __name__ == '__main__':
     print("🔑 Requires: Real Udio auth token from udio.com")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Seeded MusicGen Sampling
+Reproducible sampling from a per-call torch.Generator instead of the global RNG
+
+torch.manual_seed() reseeds the process-wide RNG that every thread samples
+from, so a seeded request running next to the queue worker, a stream or the
+style pool gets different audio each time (and resets their RNG too).
+model.generate has no generator argument, so SeededSampler does the
+sampling itself as the last logits processor. It applies the model's
+temperature, top-k and top-p, draws each token from its own generator and
+masks out every other token, and generate runs greedy so it keeps exactly
+that token.
+"""
+
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList
+
+
+class SeededSampler(LogitsProcessor):
+    """Samples one token per row from a private generator"""
+
+    def __init__(self, seed, temperature=1.0, top_k=None, top_p=None):
+        self.generator = torch.Generator().manual_seed(seed)
+        self.temperature = temperature or 1.0
+        self.top_k = top_k
+        self.top_p = top_p
+
+    def __call__(self, input_ids, scores):
+        scores = scores.float()
+        if self.temperature != 1.0:
+            scores = scores / self.temperature
+        if self.top_k:
+            kth = torch.topk(scores, min(self.top_k, scores.shape[-1])).values[..., -1:]
+            scores = scores.masked_fill(scores < kth, float('-inf'))
+        if self.top_p is not None and 0 < self.top_p < 1:
+            ordered, order = torch.sort(scores, descending=True)
+            probs = ordered.softmax(dim=-1)
+            # Drop a token once the ones before it already cover top_p; the first always stays
+            drop = probs.cumsum(dim=-1) - probs > self.top_p
+            scores = scores.masked_fill(drop.scatter(-1, order, drop), float('-inf'))
+
+        # The generator lives on the CPU, so draw there whatever device the model is on
+        probs = scores.softmax(dim=-1).cpu()
+        tokens = torch.multinomial(probs, 1, generator=self.generator).to(scores.device)
+        chosen = torch.full_like(scores, float('-inf'))
+        return chosen.scatter(-1, tokens, 0.0)
+
+
+def sampling_kwargs(model, seed):
+    """generate() kwargs that sample, from a generator of its own when seed is given"""
+    if seed is None:
+        return {'do_sample': True}
+    config = model.generation_config
+    sampler = SeededSampler(seed, config.temperature, config.top_k, config.top_p)
+    return {'do_sample': False, 'logits_processor': LogitsProcessorList([sampler])}
@@ -4,22 +4,39 @@ Simple MusicGen TECHNO Generator
 Reliable version with proper error handling
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, redirect, Response
 from flask_cors import CORS
+import threading
 import time
 import os
-import tempfile
 import base64
 
+import audio_store
+import metrics
+import single_flight
+import track_catalog
+from batcher import MicroBatcher
+from generation_cache import GenerationCache, cache_from_env
+from job_queue import JobQueue, QueueFull
+
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app, 'simple_musicgen')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
 
 # Try to import MusicGen dependencies
 musicgen_available = False
 try:
     import torch
     import torchaudio
-    from transformers import MusicgenForConditionalGeneration, AutoProcessor
+    import model_pool
+    from cpu_inference import inference_context, inference_stats, record_generation
+    from encoder_cache import encoder_cache_from_env
+    from musicgen_streaming import stream_wav
+    from seeded_sampling import sampling_kwargs
+    from long_form import generate_long, window_count
     musicgen_available = True
     print("✅ MusicGen dependencies loaded successfully")
 except ImportError as e:
@@ -31,6 +48,18 @@ model = None
 processor = None
 model_loaded = False
 
+# Use the smallest model for faster loading
+MODEL_NAME = "facebook/musicgen-small"
+
+# Finished tracks keyed on prompt, duration, seed, guidance and model
+generation_cache = cache_from_env()
+
+# Generated files and the /audio/<id> URLs they are served from
+audio_files = audio_store.store_from_env()
+
+# T5 hidden states for recent prompts, so repeated styles skip the text encoder
+encoder_cache = encoder_cache_from_env() if musicgen_available else None
+
 # TECHNO-specific prompts
 TECHNO_STYLES = {
     'minimal': 'minimal techno, repetitive beats, deep bass, 128 BPM, electronic',
@@ -41,6 +70,33 @@ TECHNO_STYLES = {
     'industrial': 'industrial techno, mechanical sounds, 135 BPM, electronic, harsh'
 }
 
+def create_techno_prompt(style, user_input):
+    """Create TECHNO prompt for MusicGen"""
+    base_style = TECHNO_STYLES.get(style, TECHNO_STYLES['minimal'])
+    return f"{base_style}, {user_input}"
+
+class InvalidRequest(ValueError):
+    """A generation request with missing or malformed parameters (answered with 400)"""
+
+def parse_generation_request(data, default_duration, max_duration):
+    """Read generation parameters from a JSON body or query string"""
+    if data is None:
+        raise InvalidRequest('Expected a JSON body')
+    style = data.get('style', 'minimal')
+    user_prompt = data.get('prompt', 'TECHNO')
+    seed = data.get('seed')
+    try:
+        return {
+            'style': style,
+            'user_prompt': user_prompt,
+            'prompt': create_techno_prompt(style, user_prompt),
+            'duration': max(1, min(int(data.get('duration', default_duration)), max_duration)),
+            'seed': int(seed) if seed is not None else None,
+            'guidance_scale': float(data.get('guidance_scale', 3.0))
+        }
+    except (TypeError, ValueError) as e:
+        raise InvalidRequest(f'Invalid generation parameters: {e}')
+
 def load_musicgen_model():
     """Load MusicGen model with proper error handling"""
     global model, processor, model_loaded
@@ -54,18 +110,9 @@ def load_musicgen_model():
     try:
         print("🔄 Loading MusicGen model (first time may take 5+ minutes)...")
         
-        # Use the smallest model for faster loading
-        model_name = "facebook/musicgen-small"
-        
-        print("📦 Loading processor...")
-        processor = AutoProcessor.from_pretrained(model_name)
-        
-        print("🧠 Loading model...")
-        model = MusicgenForConditionalGeneration.from_pretrained(model_name)
-        
-        # Use CPU for compatibility (GPU if available)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        model = model.to(device)
+        # Shared per process, so other apps mounted alongside reuse the same weights
+        model, processor = model_pool.get_model(MODEL_NAME)
+        device = model.device
         
         model_loaded = True
         print(f"✅ MusicGen loaded successfully on {device}")
@@ -75,17 +122,19 @@ def load_musicgen_model():
         print(f"❌ Failed to load MusicGen: {e}")
         return False
 
-def generate_audio(prompt, duration=15):
-    """Generate audio with MusicGen"""
-    try:
-        if not load_musicgen_model():
-            return None
-        
-        print(f"🎵 Generating: {prompt}")
-        
-        # Process the prompt
+def duration_bucket(duration):
+    """Round duration up so similar requests share one max_new_tokens"""
+    return -(-duration // BATCH_BUCKET_SECONDS) * BATCH_BUCKET_SECONDS
+
+def generate_batch(key, batch):
+    """Run one padded model.generate for a batch of (prompt, duration)"""
+    bucket, seed, guidance_scale = key
+    print(f"🎛 Batch of {len(batch)} for {bucket}s bucket")
+    
+    # Process all prompts together, padded to the longest
+    with metrics.stage('tokenize'):
         inputs = processor(
-            text=[prompt],
+            text=[prompt for prompt, _ in batch],
             padding=True,
             return_tensors="pt",
         )
@@ -93,28 +142,146 @@ def generate_audio(prompt, duration=15):
         # Move to same device as model
         device = next(model.parameters()).device
         inputs = {k: v.to(device) for k, v in inputs.items()}
+        inputs = encoder_cache.conditioning(model, inputs, guidance_scale)
+    
+    # Generate audio
+    started = time.time()
+    with inference_context(model), metrics.stage('generate'):
+        audio_values = encoder_cache.generate(model, inputs, max_new_tokens=bucket * 50, guidance_scale=guidance_scale,
+                                              **sampling_kwargs(model, seed))
+    # Rate the audio every request gets back, not one bucket for the whole batch
+    audio_seconds = sum(duration for _, duration in batch)
+    rtf = record_generation(time.time() - started, audio_seconds)
+    if rtf is not None:
+        print(f"⏱ Real-time factor {rtf:.2f} for {audio_seconds}s of audio in a batch of {len(batch)}")
+    
+    # Split the batch back out, trimming each track to its requested length
+    sample_rate = model.config.audio_encoder.sample_rate
+    paths = []
+    for i, (_, duration) in enumerate(batch):
+        audio_tensor = audio_values[i, 0, :duration * sample_rate].float().cpu()
         
-        # Generate audio
-        with torch.no_grad():
-            audio_values = model.generate(**inputs, max_new_tokens=duration * 50)
+        # Scratch file, moved into the cache or swept once it expires
+        path = audio_files.new_path('.wav')
+        with metrics.stage('save'):
+            torchaudio.save(path, audio_tensor.unsqueeze(0), sample_rate)
+        paths.append(path)
+    
+    return paths
+
+# Seconds of audio decoded per chunk on /generate/stream
+STREAM_WINDOW_SECONDS = float(os.environ.get('MUSICGEN_STREAM_WINDOW', 1.0))
+MAX_STREAMS = int(os.environ.get('MUSICGEN_STREAM_CONCURRENCY', 1))
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+# Concurrent requests are merged into one model.generate per duration bucket
+BATCH_BUCKET_SECONDS = int(os.environ.get('MUSICGEN_BATCH_BUCKET', 5))
+generation_batcher = MicroBatcher(
+    generate_batch,
+    window=int(os.environ.get('MUSICGEN_BATCH_WINDOW_MS', 100)) / 1000,
+    max_batch=int(os.environ.get('MUSICGEN_MAX_BATCH', 4)),
+    name='musicgen-batcher'
+)
+
+# Long-form tracks are generated in overlapping windows (see long_form.py)
+LONG_FORM = {
+    'window': float(os.environ.get('MUSICGEN_LONG_WINDOW', 30)),
+    'overlap': float(os.environ.get('MUSICGEN_LONG_OVERLAP', 10)),
+    'crossfade': float(os.environ.get('MUSICGEN_LONG_CROSSFADE', 1.0))
+}
+MAX_LONG_DURATION = int(os.environ.get('MUSICGEN_MAX_LONG_DURATION', 600))
+
+def run_long_job(job):
+    """Job queue handler for /generate/long, updating progress after every window"""
+    params = job.params
+    cache_key = GenerationCache.make_key(
+        params['prompt'], params['duration'], params['seed'], params['guidance_scale'], MODEL_NAME,
+        long_form=LONG_FORM
+    )
+    audio_file = generation_cache.get(cache_key, record=False)
+    if not audio_file:
+        if not load_musicgen_model():
+            job.error = 'Failed to load MusicGen model'
+            return None
         
-        # Convert to numpy
-        audio_np = audio_values[0, 0].cpu().numpy()
+        def on_progress(done, total):
+            print(f"🪟 Window {done}/{total} done (job {job.id})")
+            job.progress = min(done / total, 0.99)
         
-        # Save to temporary file
-        temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-        sample_rate = model.config.audio_encoder.sample_rate
+        path = audio_files.new_path('.wav')
+        generate_long(
+            model, processor, params['prompt'], params['duration'], path,
+            guidance_scale=params['guidance_scale'], seed=params['seed'], on_progress=on_progress, **LONG_FORM
+        )
+        audio_file = generation_cache.put(cache_key, path)
+        audio_files.prepare(audio_file)
+    
+    return catalog.add({
+        'id': track_catalog.new_track_id('simple_musicgen'),
+        'title': f"{params['style'].title()} TECHNO - {params['user_prompt']}",
+        'audio_id': audio_files.audio_id(audio_file),
+        'style': params['style'],
+        'prompt': params['prompt'],
+        'status': 'generated',
+        'duration': f"{params['duration']} seconds",
+        'service': 'MusicGen AI (long-form)'
+    }, 'simple_musicgen')
+
+# Long-form tracks hold the model for minutes, so only a few run at once (one by default)
+long_jobs = JobQueue(
+    run_long_job,
+    max_size=int(os.environ.get('MUSICGEN_QUEUE_SIZE', 16)),
+    workers=int(os.environ.get('MUSICGEN_LONG_CONCURRENCY', 1)),
+    ttl=int(os.environ.get('MUSICGEN_JOB_TTL', 3600)),
+    name='musicgen-long'
+)
+
+# Read when /metrics is rendered
+metrics.QUEUE_DEPTH.set_function(lambda: long_jobs.depth(), queue='simple-musicgen-long')
+metrics.QUEUE_DEPTH.set_function(lambda: generation_batcher.stats()['pending'], queue='simple-musicgen-batcher')
+metrics.CACHE_HITS.set_function(lambda: generation_cache.stats()['hits'], cache='generation')
+metrics.CACHE_MISSES.set_function(lambda: generation_cache.stats()['misses'], cache='generation')
+if musicgen_available:
+    metrics.CACHE_HITS.set_function(lambda: encoder_cache.stats()['hits'], cache='encoder')
+    metrics.CACHE_MISSES.set_function(lambda: encoder_cache.stats()['misses'], cache='encoder')
+
+# Identical requests arriving while a generation runs wait for it instead of starting another
+generation_flight = single_flight.flight_from_env('simple-musicgen')
+
+def generate_audio(prompt, duration=15, seed=None, guidance_scale=3.0):
+    """Generate audio with MusicGen"""
+    try:
+        cache_key = GenerationCache.make_key(prompt, duration, seed, guidance_scale, MODEL_NAME)
+        cached_file = generation_cache.get(cache_key)
+        if cached_file:
+            print(f"⚡ Cache hit for: {prompt}")
+            return cached_file
         
-        # Convert to tensor and save
-        audio_tensor = torch.from_numpy(audio_np).unsqueeze(0)
-        torchaudio.save(temp_file.name, audio_tensor, sample_rate)
+        def generate():
+            if not load_musicgen_model():
+                return None
+            
+            print(f"🎵 Generating: {prompt}")
+            
+            # Only requests sharing a seed and guidance scale can share a batch
+            batch_key = (duration_bucket(duration), seed, guidance_scale)
+            audio_file = generation_batcher.submit(batch_key, (prompt, duration)).result()
+            audio_file = generation_cache.put(cache_key, audio_file)
+            audio_files.prepare(audio_file)
+            return audio_file
         
-        return temp_file.name
+        flight_key = single_flight.make_key(prompt, duration, seed, guidance_scale, MODEL_NAME)
+        return generation_flight.do(flight_key, generate)
         
     except Exception as e:
         print(f"❌ Audio generation error: {e}")
         return None
 
+@app.before_request
+def ensure_model_loading():
+    if musicgen_available:
+        model_pool.start_background_load()
+
 @app.route('/')
 def home():
     status = "✅ Available" if musicgen_available else "❌ Not installed"
@@ -128,6 +295,8 @@ def home():
     <p><strong>Device:</strong> {device}</p>
     <br>
     <p>POST to /generate: {{"style": "minimal", "prompt": "dark vibes"}}</p>
+    <p>GET /generate/stream?style=minimal&prompt=dark+vibes to play while generating</p>
+    <p>POST to /generate/long with "duration" up to {MAX_LONG_DURATION}s, then poll /jobs/&lt;id&gt;</p>
     <p>Styles: minimal, acid, hard, melodic, dub, industrial</p>
     <br>
     <h3>Setup:</h3>
@@ -136,12 +305,23 @@ def home():
 
 @app.route('/health')
 def health():
+    # With preloading enabled, report not-ready until the weights are in memory
+    ready = not musicgen_available or model_pool.is_ready()
     return jsonify({
-        'status': 'healthy',
+        'status': 'healthy' if ready else 'loading',
         'musicgen_available': musicgen_available,
         'model_loaded': model_loaded,
-        'gpu_available': musicgen_available and torch.cuda.is_available()
-    })
+        'model_pool': model_pool.load_status() if musicgen_available else None,
+        'gpu_available': musicgen_available and torch.cuda.is_available(),
+        'batching': generation_batcher.stats(),
+        'cache': generation_cache.stats(),
+        'encoder_cache': encoder_cache.stats() if musicgen_available else None,
+        'audio': audio_files.stats(),
+        'long_jobs': long_jobs.stats(),
+        'single_flight': generation_flight.stats(),
+        'track_catalog': catalog.stats(),
+        'inference': inference_stats(model if model_loaded else None) if musicgen_available else None
+    }), 200 if ready else 503
 
 @app.route('/test', methods=['POST'])
 def test_api():
@@ -170,39 +350,40 @@ def generate_techno():
         }), 400
     
     try:
-        data = request.get_json()
-        style = data.get('style', 'minimal')
-        user_prompt = data.get('prompt', 'TECHNO')
-        duration = min(int(data.get('duration', 15)), 20)  # Max 20 seconds
-        
-        # Create full prompt
-        base_style = TECHNO_STYLES.get(style, TECHNO_STYLES['minimal'])
-        full_prompt = f"{base_style}, {user_prompt}"
+        params = parse_generation_request(request.get_json(silent=True), 15, 20)  # Max 20 seconds
+        style = params['style']
+        user_prompt = params['user_prompt']
+        full_prompt = params['prompt']
+        duration = params['duration']
+        seed = params['seed']
+        guidance_scale = params['guidance_scale']
         
         print(f"🎵 Generating {style} TECHNO...")
         print(f"📝 Prompt: {full_prompt}")
         print(f"⏱ Duration: {duration} seconds")
         
         # Generate audio
-        audio_file = generate_audio(full_prompt, duration)
+        audio_file = generate_audio(full_prompt, duration, seed=seed, guidance_scale=guidance_scale)
         
         if audio_file and os.path.exists(audio_file):
-            # Return file path (in real deployment, you'd serve this or upload to cloud)
-            track_id = f'musicgen_{int(time.time())}'
+            audio_id = audio_files.audio_id(audio_file)
+            track = catalog.add({
+                'id': track_catalog.new_track_id('simple_musicgen'),
+                'title': f'{style.title()} TECHNO - {user_prompt}',
+                'audio_file': audio_file,  # Local path
+                'audio_id': audio_id,
+                **audio_files.track_urls(audio_id),
+                'style': style,
+                'prompt': full_prompt,
+                'status': 'generated',
+                'duration': f'{duration} seconds',
+                'service': 'MusicGen AI',
+                'note': 'Real AI-generated TECHNO!'
+            }, 'simple_musicgen')
             
             return jsonify({
                 'success': True,
-                'track': {
-                    'id': track_id,
-                    'title': f'{style.title()} TECHNO - {user_prompt}',
-                    'audio_file': audio_file,  # Local path
-                    'style': style,
-                    'prompt': full_prompt,
-                    'status': 'generated',
-                    'duration': f'{duration} seconds',
-                    'service': 'MusicGen AI',
-                    'note': 'Real AI-generated TECHNO!'
-                },
+                'track': track,
                 'message': f'Real {style} TECHNO generated with MusicGen AI!',
                 'file_info': {
                     'path': audio_file,
@@ -215,6 +396,9 @@ def generate_techno():
                 'details': 'MusicGen may need more memory or different settings'
             }), 500
             
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    
     except Exception as e:
         print(f"❌ Generation error: {str(e)}")
         return jsonify({
@@ -222,6 +406,154 @@ def generate_techno():
             'type': type(e).__name__
         }), 500
 
+@app.route('/generate/stream', methods=['GET', 'POST'])
+def generate_stream():
+    """Stream TECHNO as WAV while MusicGen is still decoding
+
+    ?cached=1 never generates: it redirects to the finished track's
+    /audio/<id> (for download links), or answers 404 until there is one.
+    """
+    if not musicgen_available:
+        return jsonify({
+            'error': 'MusicGen not installed',
+            'install': 'Run: pip install transformers torch torchaudio'
+        }), 400
+    
+    try:
+        # GET lets an <audio> element point straight at this endpoint
+        params = parse_generation_request(request.get_json(silent=True) or request.args, 15, 20)
+        style = params['style']
+        full_prompt = params['prompt']
+        duration = params['duration']
+        seed = params['seed']
+        guidance_scale = params['guidance_scale']
+        
+        cache_key = GenerationCache.make_key(full_prompt, duration, seed, guidance_scale, MODEL_NAME)
+        cached_file = generation_cache.get(cache_key)
+        if request.args.get('cached') == '1':
+            if not cached_file:
+                return jsonify({'error': 'Track has not finished streaming yet'}), 404
+            return redirect(f'{request.script_root}/audio/{cache_key}')
+        if cached_file:
+            return audio_files.send(cache_key)
+        
+        if not load_musicgen_model():
+            return jsonify({'error': 'Failed to load MusicGen model'}), 500
+        
+        # Each stream runs its own model.generate beside the queue worker, so only a few at once
+        if not stream_slots.acquire(blocking=False):
+            return jsonify({
+                'error': 'Too many streams in progress',
+                'max_streams': MAX_STREAMS,
+                'details': 'Retry shortly, or POST to /generate to queue the track'
+            }), 429, {'Retry-After': '10'}
+        try:
+            print(f"📡 Streaming {style} TECHNO: {full_prompt}")
+        
+            with metrics.stage('tokenize'):
+                inputs = processor(text=[full_prompt], padding=True, return_tensors="pt")
+                device = next(model.parameters()).device
+                inputs = {k: v.to(device) for k, v in inputs.items()}
+                inputs = encoder_cache.conditioning(model, inputs, guidance_scale)
+        
+            sample_rate = model.config.audio_encoder.sample_rate
+            frame_rate = model.config.audio_encoder.frame_rate
+            play_steps = max(int(frame_rate * STREAM_WINDOW_SECONDS), model.decoder.num_codebooks + 1)
+        
+            def save_to_cache(audio):
+                path = audio_files.new_path('.wav')
+                audio_tensor = torch.from_numpy(audio[:duration * sample_rate]).unsqueeze(0)
+                with metrics.stage('save'):
+                    torchaudio.save(path, audio_tensor, sample_rate)
+                audio_files.prepare(generation_cache.put(cache_key, path))
+        
+            stream = stream_wav(
+                model,
+                inputs,
+                {'max_new_tokens': duration * 50, 'guidance_scale': guidance_scale},
+                play_steps=play_steps,
+                on_complete=save_to_cache,
+                generate=encoder_cache.generate
+            )
+            response = Response(stream, mimetype='audio/wav', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'  # Don't let a proxy hold chunks back
+            })
+        except BaseException:
+            stream_slots.release()
+            raise
+        # Held until the response is closed, which also stops the generate thread
+        response.call_on_close(stream_slots.release)
+        return response
+        
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    
+    except Exception as e:
+        print(f"❌ Streaming error: {str(e)}")
+        return jsonify({
+            'error': f'Streaming failed: {str(e)}',
+            'type': type(e).__name__
+        }), 500
+
+@app.route('/generate/long', methods=['POST'])
+def generate_long_techno():
+    """Queue a multi-minute TECHNO track, generated in overlapping windows"""
+    if not musicgen_available:
+        return jsonify({
+            'error': 'MusicGen not installed',
+            'install': 'Run: pip install transformers torch torchaudio'
+        }), 400
+    
+    try:
+        params = parse_generation_request(request.get_json(silent=True), 120, MAX_LONG_DURATION)
+        style = params['style']
+        flight_key = single_flight.make_key(
+            params['prompt'], params['duration'], params['seed'], params['guidance_scale'], MODEL_NAME,
+            long_form=True
+        ) if single_flight.ENABLED else None
+        job, joined = long_jobs.submit_or_join(params, key=flight_key)
+        
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'shared': joined,
+            'status_url': f'{request.script_root}/jobs/{job.id}',
+            'windows': window_count(params['duration'], LONG_FORM['window'], LONG_FORM['overlap']),
+            'message': f"{params['duration']}s {style} TECHNO queued for MusicGen"
+        }), 202
+        
+    except QueueFull as e:
+        return jsonify({'error': 'Long-form queue is full', 'queue_depth': e.depth}), 429, {'Retry-After': '60'}
+    
+    except InvalidRequest as e:
+        return jsonify({'error': str(e)}), 400
+    
+    except Exception as e:
+        print(f"❌ Long-form error: {str(e)}")
+        return jsonify({
+            'error': f'Generation failed: {str(e)}',
+            'type': type(e).__name__
+        }), 500
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of a long-form generation"""
+    job = long_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': f'Unknown job: {job_id}'}), 404
+    
+    status = job.to_dict()
+    if job.status == 'completed':
+        status['track'] = dict(job.result, **audio_files.track_urls(job.result['audio_id']))
+    return jsonify(status)
+
+@app.route('/audio/<audio_id>')
+def serve_audio(audio_id):
+    """Generated audio with Range support, so players can seek without re-downloading"""
+    return audio_files.send(audio_id)
+
 @app.route('/load_model', methods=['POST'])
 def load_model():
     """Manually load the model"""
@@ -240,6 +572,9 @@ def load_model():
             'error': 'Failed to load MusicGen model'
         }), 500
 
+if musicgen_available:
+    model_pool.preload(load_musicgen_model)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5006))
     print("🎵 Starting Simple MusicGen TECHNO Generator")
@@ -253,4 +588,6 @@ if __name__ == '__main__':
         print("   (Downloads ~1.5GB model on first use)")
     
     print("=" * 60)
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    if musicgen_available:
+        model_pool.start_background_load()
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
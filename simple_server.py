@@ -6,11 +6,18 @@ For testing the frontend interface
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
+import os
 import time
 import random
 
+import metrics
+import track_catalog
+
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app, 'simple')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
 
 # TECHNO styles
 TECHNO_STYLES = {
@@ -71,18 +78,18 @@ def generate_techno():
         time.sleep(random.uniform(1, 3))
         
         # Mock successful response
-        track_id = f'techno_{int(time.time())}'
+        track = catalog.add({
+            'id': track_catalog.new_track_id('simple'),
+            'title': f'{style.title()} TECHNO - {prompt}',
+            'audio_url': 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav',
+            'style': style,
+            'prompt': f'{TECHNO_STYLES[style]}, {prompt}',
+            'status': 'mock_generated'
+        }, 'simple')
         
         return jsonify({
             'success': True,
-            'track': {
-                'id': track_id,
-                'title': f'{style.title()} TECHNO - {prompt}',
-                'audio_url': 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav',
-                'style': style,
-                'prompt': f'{TECHNO_STYLES[style]}, {prompt}',
-                'status': 'mock_generated'
-            },
+            'track': track,
             'message': f'Mock {style} TECHNO generated successfully!'
         })
         
@@ -96,4 +103,4 @@ def generate_techno():
 if __name__ == '__main__':
     print("🎵 Starting TECHNO Generator Mock Server on port 5000")
     print("Available styles:", list(TECHNO_STYLES.keys()))
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Single-Flight Request Deduplication
+Identical concurrent generations share one upstream call or model run
+
+When a style preset goes viral, many clients send the same style and prompt
+within seconds. The first request for a key becomes the leader and does the
+work; requests arriving while it is in flight wait for the leader and get
+the same result (or the same exception). Nothing is kept once the call
+finishes, so later identical requests generate again unless a cache serves
+them.
+
+Keys come from make_key() over the full prompt and every parameter that
+shapes the output. Prompts are normalised (case and whitespace). Callers
+pass their API key or token as credentials, so only requests made with the
+same credentials share a generation. Otherwise one account's invalid or
+throttled key would fail another's request, tracks made on one account
+would be handed to another, and the per-key rate limits would be bypassed.
+Only a digest of the credentials goes into the key.
+
+Settings:
+  SINGLE_FLIGHT - set to 0 to give every request its own generation (default 1)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+
+import metrics
+from rate_limiter import _key_id
+
+ENABLED = os.environ.get('SINGLE_FLIGHT', '1') != '0'
+
+
+def normalize(value):
+    """Case- and whitespace-insensitive form of a prompt"""
+    return ' '.join(value.split()).lower() if isinstance(value, str) else value
+
+
+def make_key(*parts, credentials=None, **params):
+    """Stable key for a generation; strings are normalised before hashing
+
+    credentials is an API key, or a dict of them per service; it is digested
+    before normalising, so keys differing only in case stay apart.
+    """
+    if isinstance(credentials, dict):
+        params['credentials'] = {name: _key_id(key) for name, key in credentials.items()}
+    elif credentials is not None:
+        params['credentials'] = _key_id(credentials)
+    payload = json.dumps(
+        [[normalize(part) for part in parts], {name: normalize(value) for name, value in params.items()}],
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one call"""
+
+    def __init__(self, name, enabled=True):
+        self.name = name
+        self.enabled = enabled
+        self.leaders = 0
+        self.collapsed = 0
+        self._calls = {}  # key -> concurrent Future, for threads
+        self._async_calls = {}  # key -> asyncio Future, for coroutines
+        self._lock = threading.Lock()
+
+    def _join(self, calls, key, future):
+        """The in-flight leader's future for key, or None after making future the leader's"""
+        with self._lock:
+            leader = calls.get(key)
+            if leader is not None:
+                self.collapsed += 1
+            else:
+                calls[key] = future
+                self.leaders += 1
+        if leader is not None:
+            metrics.COLLAPSED.inc(flight=self.name)
+        return leader
+
+    def do(self, key, fn):
+        """fn() for the first caller with key; everyone else waits for its result"""
+        if not self.enabled:
+            return fn()
+        future = Future()
+        leader = self._join(self._calls, key, future)
+        if leader is not None:
+            return leader.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def ado(self, key, fn):
+        """Coroutine version of do(): awaits fn() once per key on the running loop"""
+        if not self.enabled:
+            return await fn()
+        future = asyncio.get_running_loop().create_future()
+        leader = self._join(self._async_calls, key, future)
+        if leader is not None:
+            # A follower giving up must not cancel the leader's call
+            return await asyncio.shield(leader)
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # Followers may not exist; don't log it as unretrieved
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._async_calls.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'in_flight': len(self._calls) + len(self._async_calls),
+                'leaders': self.leaders,
+                'collapsed': self.collapsed
+            }
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def flight_from_env(name):
+    """Single-flight group for name, shared by every app in the process"""
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = SingleFlight(name, enabled=ENABLED)
+        return _shared[name]
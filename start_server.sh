@@ -7,10 +7,11 @@ echo "====================================="
 echo "1. Mock Server (Recommended for testing)"
 echo "2. Udio Server (Requires API key)" 
 echo "3. Quiet Server (No warnings)"
-echo "4. Kill all servers"
+echo "4. Production Server (gunicorn, pick a backend)"
+echo "5. Kill all servers"
 echo ""
 
-read -p "Choose option (1-4): " choice
+read -p "Choose option (1-5): " choice
 
 case $choice in
     1)
@@ -26,11 +27,18 @@ case $choice in
         python quiet_server.py
         ;;
     4)
+        python launcher.py --list
+        read -p "Backend to run: " backend
+        echo "🚀 Starting $backend under the production launcher..."
+        python launcher.py "$backend"
+        ;;
+    5)
         echo "🛑 Stopping all servers..."
         pkill -f "python.*server"
+        pkill -f "python.*launcher"
         echo "✅ All servers stopped"
         ;;
     *)
-        echo "❌ Invalid option. Please choose 1-4."
+        echo "❌ Invalid option. Please choose 1-5."
         ;;
 esac
\ No newline at end of file
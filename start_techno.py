@@ -25,7 +25,7 @@ def main():
         print("✅ Demo server already running on port 5005")
     else:
         print("🚀 Starting demo server...")
-        subprocess.Popen(['python', 'demo_server.py'])
+        subprocess.Popen(['python', 'launcher.py', 'demo'])
         time.sleep(2)
     
     # Check if HTTP server is running
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Pre-Generated Style Pool
+Keeps a stock of ready tracks per TECHNO style so common requests are served instantly
+
+Stock lives on disk, one directory per style, one `<seed>.wav` file per
+track. A request claims a track by renaming it out of the pool. The rename is
+atomic, so any number of workers can share one pool and no track is handed
+out twice. Each track has its own random seed.
+
+One process per pool directory runs the producer; the others wait on a file
+lock and take over if it exits. When a style's stock drops below the
+watermark, the producer refills it to the full stock, one track at a time.
+It runs at idle priority: the thread is niced, it waits while `busy()`
+reports foreground work, and `generate` is expected to give up (return
+False) when foreground work starts mid-track.
+
+Settings:
+  STYLE_POOL_STOCK     - tracks kept per style (default 4, 0 disables the pool)
+  STYLE_POOL_WATERMARK - refill a style when its stock drops below this (default 2)
+  STYLE_POOL_DIR       - pool directory (default <tmp>/techno_style_pool)
+  STYLE_POOL_DURATION  - seconds per pre-generated track (default 20)
+  STYLE_POOL_NICE      - nice value for the producer thread (default 19)
+"""
+
+import errno
+import fcntl
+import os
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+
+DEFAULT_POOL_DIR = os.path.join(tempfile.gettempdir(), 'techno_style_pool')
+
+
+class StylePool:
+    """Per-style stock of generated tracks
+
+    generate(style, seed, path) writes one track to path and returns True, or
+    returns False if it stopped early to make way for foreground work.
+    """
+
+    def __init__(self, generate, styles, stock=4, watermark=2, directory=DEFAULT_POOL_DIR, duration=20,
+                 busy=None, nice=19, poll_interval=5.0):
+        self.generate = generate
+        self.styles = list(styles)
+        self.stock = stock
+        self.watermark = min(watermark, stock)
+        self.directory = directory
+        self.duration = duration
+        self.busy = busy or (lambda: False)
+        self.nice = nice
+        self.poll_interval = poll_interval
+        self.enabled = stock > 0
+        self.produced = 0
+        self.yielded = 0
+        self.failed = 0
+        self.served = 0
+        self.empty = 0
+        self.producing = False
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pid = None
+        for style in self.styles:
+            os.makedirs(self._style_dir(style), exist_ok=True)
+
+    def _style_dir(self, style):
+        return os.path.join(self.directory, style)
+
+    def _ready(self, style):
+        """Ready track files for style, oldest first"""
+        try:
+            entries = [entry for entry in os.scandir(self._style_dir(style))
+                       if entry.is_file() and entry.name.endswith('.wav') and not entry.name.startswith('.')]
+        except OSError:
+            return []
+        return [entry.path for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime)]
+
+    def count(self, style):
+        return len(self._ready(style))
+
+    def start(self):
+        # Threads don't survive fork, so start lazily in the serving process
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='style-pool', daemon=True).start()
+
+    def claim(self, style, target):
+        """Move a ready track for style to target; returns its seed, or None if the stock is empty"""
+        if not self.enabled or style not in self.styles:
+            return None
+        for path in self._ready(style):
+            try:
+                os.rename(path, target)
+            except FileNotFoundError:
+                continue  # Another worker claimed it first
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Pool and target on different filesystems: claim in place, then copy across
+                claimed = f'{path}.{os.getpid()}.claim'
+                try:
+                    os.rename(path, claimed)
+                except FileNotFoundError:
+                    continue
+                shutil.move(claimed, target)
+            os.utime(target)  # Its age now counts from when it was served
+            with self._lock:
+                self.served += 1
+            self._wakeup.set()
+            return int(os.path.splitext(os.path.basename(path))[0])
+        with self._lock:
+            self.empty += 1
+        self._wakeup.set()
+        return None
+
+    def _set_idle_priority(self):
+        try:
+            # On Linux this renices just the calling thread
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), self.nice)
+        except (AttributeError, OSError) as e:
+            print(f"⚠ Could not lower style pool priority: {e}")
+
+    def _run(self):
+        self._set_idle_priority()
+        lock_file = open(os.path.join(self.directory, 'producer.lock'), 'w')
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                # Another process is producing; take over if it goes away
+                time.sleep(self.poll_interval * 6)
+        with self._lock:
+            self.producing = True
+        self._remove_partials()
+        print(f"🏭 Style pool producer running in process {os.getpid()}")
+
+        while True:
+            style = self._next_style()
+            if style is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            if self.busy():
+                time.sleep(1)
+                continue
+            self._produce(style)
+
+    def _next_style(self):
+        """Style to refill next: below the watermark, or still filling back up, fewest tracks first"""
+        counts = {style: self.count(style) for style in self.styles}
+        with self._lock:
+            for style, count in counts.items():
+                if count < self.watermark:
+                    self._refilling.add(style)
+                elif count >= self.stock:
+                    self._refilling.discard(style)
+            if not self._refilling:
+                return None
+            return min(self._refilling, key=lambda style: counts[style])
+
+    def _produce(self, style):
+        seed = secrets.randbits(31)
+        target = os.path.join(self._style_dir(style), f'{seed}.wav')
+        # Hidden until complete, so claims never see a partial track
+        partial = os.path.join(self._style_dir(style), f'.{seed}.partial.wav')
+        try:
+            completed = self.generate(style, seed, partial)
+        except Exception as e:
+            print(f"❌ Style pool generation for {style} failed: {e}")
+            completed = None
+        if completed:
+            os.replace(partial, target)
+            with self._lock:
+                self.produced += 1
+            return
+        if os.path.exists(partial):
+            os.remove(partial)
+        with self._lock:
+            if completed is None:
+                self.failed += 1
+            else:
+                self.yielded += 1
+        if completed is None:
+            time.sleep(self.poll_interval)
+
+    def _remove_partials(self):
+        """Drop tracks a previous producer left half-written"""
+        for style in self.styles:
+            for entry in os.scandir(self._style_dir(style)):
+                if entry.name.startswith('.') or entry.name.endswith('.claim'):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def stats(self):
+        stock = {style: self.count(style) for style in self.styles} if self.enabled else {}
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'stock': stock,
+                'target_stock': self.stock,
+                'watermark': self.watermark,
+                'producing': self.producing,
+                'refilling': sorted(self._refilling),
+                'produced': self.produced,
+                'yielded': self.yielded,
+                'failed': self.failed,
+                'served': self.served,
+                'empty': self.empty
+            }
+
+
+def pool_from_env(generate, styles, busy=None, enabled=True):
+    """Style pool configured from STYLE_POOL_* settings"""
+    return StylePool(
+        generate,
+        styles,
+        stock=int(os.environ.get('STYLE_POOL_STOCK', 4)) if enabled else 0,
+        watermark=int(os.environ.get('STYLE_POOL_WATERMARK', 2)),
+        directory=os.environ.get('STYLE_POOL_DIR', DEFAULT_POOL_DIR),
+        duration=int(os.environ.get('STYLE_POOL_DURATION', 20)),
+        busy=busy,
+        nice=int(os.environ.get('STYLE_POOL_NICE', 19))
+    )
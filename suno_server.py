@@ -4,14 +4,24 @@ Suno AI TECHNO Generator Server
 Alternative to Udio using Suno API
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_cors import CORS
-import requests
-import time
+import json
 import os
+import time
+
+import http_pool
+import metrics
+import single_flight
+import track_catalog
+from rate_limiter import RateLimited, get_limiter, limiter_stats, rate_limited_response
+from track_store import TrackPoller, store_from_env
 
 app = Flask(__name__)
 CORS(app)
+metrics.instrument(app, 'suno')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
 
 # TECHNO-specific prompts optimized for Suno AI
 TECHNO_STYLES = {
@@ -26,10 +36,10 @@ TECHNO_STYLES = {
 class SunoAPI:
     def __init__(self, api_key):
         self.api_key = api_key
-        self.base_url = "https://api.sunoai.ai/v1"
+        self.base_url = os.environ.get('SUNO_API_BASE', "https://api.sunoai.ai/v1")
         
-    def generate_music(self, prompt, make_instrumental=True, tags="techno, electronic"):
-        """Generate music using Suno API"""
+    def generate_request(self, prompt, make_instrumental=True, tags="techno, electronic"):
+        """(url, headers, json body) for a generation"""
         headers = {
             'Authorization': f'Bearer {self.api_key}',
             'Content-Type': 'application/json'
@@ -41,14 +51,19 @@ class SunoAPI:
             'tags': tags,
             'model': 'chirp-v3-5'
         }
+        return f"{self.base_url}/generate", headers, data
+    
+    def generate_music(self, prompt, make_instrumental=True, tags="techno, electronic"):
+        """Generate music using Suno API"""
+        url, headers, data = self.generate_request(prompt, make_instrumental, tags)
         
         try:
-            response = requests.post(
-                f"{self.base_url}/generate",
+            response = get_limiter('suno').request(self.api_key, lambda: http_pool.get_session('suno').post(
+                url,
                 headers=headers,
                 json=data,
                 timeout=30
-            )
+            ))
             
             if response.status_code == 200:
                 return response.json()
@@ -56,6 +71,8 @@ class SunoAPI:
                 print(f"Suno API Error: {response.status_code} - {response.text}")
                 return None
                 
+        except RateLimited:
+            raise
         except Exception as e:
             print(f"Request error: {e}")
             return None
@@ -65,26 +82,65 @@ class SunoAPI:
         headers = {'Authorization': f'Bearer {self.api_key}'}
         
         try:
-            response = requests.get(
+            # Status checks never queue; the poller just tries again next round
+            response = get_limiter('suno').request(self.api_key, lambda: http_pool.get_session('suno').get(
                 f"{self.base_url}/tracks/{track_id}",
                 headers=headers,
                 timeout=10
-            )
+            ), max_wait=0)
             
             if response.status_code == 200:
                 return response.json()
             else:
                 return None
                 
+        except RateLimited:
+            return None
         except Exception as e:
             print(f"Status check error: {e}")
             return None
 
+def fetch_track_status(track_id, api_key):
+    return SunoAPI(api_key).get_track_status(track_id)
+
+def catalog_status(state):
+    catalog.update(state['track_id'], state['status'], state['audio_url'])
+
+# /status answers from here; the poller is the only thing asking Suno
+track_store = store_from_env(on_update=catalog_status)
+track_poller = TrackPoller(
+    track_store,
+    fetch_track_status,
+    interval=float(os.environ.get('TRACK_POLL_INTERVAL', 3)),
+    workers=int(os.environ.get('TRACK_POLL_WORKERS', 8)),
+    pending_ttl=int(os.environ.get('TRACK_PENDING_TTL', 600))
+)
+MAX_WAIT_SECONDS = 60
+# The poller times a track out after TRACK_PENDING_TTL; streams never outlive that by much
+MAX_STREAM_SECONDS = track_poller.pending_ttl + 60
+
+# Identical requests in flight share one Suno generation (and its credits)
+generation_flight = single_flight.flight_from_env('suno')
+
+def generation_key(style, full_prompt, api_key):
+    return single_flight.make_key('suno', full_prompt, style=style, instrumental=True, credentials=api_key)
+
 def create_techno_prompt(style, user_input):
     """Create optimized TECHNO prompt for Suno"""
     base_style = TECHNO_STYLES.get(style, TECHNO_STYLES['minimal'])
     return f"{base_style}, {user_input}, 128 BPM, club ready, professional production"
 
+def build_track(result, style, user_prompt, full_prompt):
+    return {
+        'id': result['id'],
+        'title': f'{style.title()} TECHNO - {user_prompt}',
+        'audio_url': result.get('audio_url'),
+        'style': style,
+        'prompt': full_prompt,
+        'status': result.get('status', 'processing'),
+        'created_at': result.get('created_at')
+    }
+
 @app.route('/')
 def home():
     return """
@@ -92,11 +148,21 @@ def home():
     <p>POST to /generate with JSON: {"style": "minimal", "prompt": "dark warehouse vibes", "api_key": "your-suno-key"}</p>
     <p>Styles: minimal, acid, hard, melodic, dub, industrial</p>
     <p>Get API key from: https://app.suno.ai/account</p>
+    <p>GET /status/&lt;track_id&gt;?wait=30 long-polls, /status/&lt;track_id&gt;/events streams updates</p>
     """
 
 @app.route('/health')
 def health():
-    return jsonify({'status': 'healthy', 'service': 'suno-techno-generator'})
+    return jsonify({
+        'status': 'healthy',
+        'service': 'suno-techno-generator',
+        'upstream_pools': http_pool.pool_stats(),
+        'rate_limits': limiter_stats(),
+        'track_store': track_store.stats(),
+        'track_poller': track_poller.stats(),
+        'single_flight': generation_flight.stats(),
+        'track_catalog': catalog.stats()
+    })
 
 @app.route('/test', methods=['POST'])
 def test_api():
@@ -143,25 +209,30 @@ def generate_techno():
         # Initialize Suno API
         suno = SunoAPI(api_key)
         
-        # Generate TECHNO track
-        result = suno.generate_music(
-            prompt=full_prompt,
-            make_instrumental=True,
-            tags=f"techno, {style}, electronic, instrumental"
-        )
+        def generate():
+            result = suno.generate_music(
+                prompt=full_prompt,
+                make_instrumental=True,
+                tags=f"techno, {style}, electronic, instrumental"
+            )
+            if result and 'id' in result:
+                track_store.add(
+                    result['id'], api_key,
+                    status=result.get('status', 'processing'),
+                    audio_url=result.get('audio_url'),
+                    style=style
+                )
+                catalog.add(build_track(result, style, user_prompt, full_prompt), 'suno')
+                track_poller.wake()
+            return result
+        
+        # Generate TECHNO track, or wait for the identical one already being generated
+        result = generation_flight.do(generation_key(style, full_prompt, api_key), generate)
         
         if result and 'id' in result:
             return jsonify({
                 'success': True,
-                'track': {
-                    'id': result['id'],
-                    'title': f'{style.title()} TECHNO - {user_prompt}',
-                    'audio_url': result.get('audio_url'),
-                    'style': style,
-                    'prompt': full_prompt,
-                    'status': result.get('status', 'processing'),
-                    'created_at': result.get('created_at')
-                },
+                'track': build_track(result, style, user_prompt, full_prompt),
                 'message': f'Real {style} TECHNO generation started with Suno!',
                 'track_id': result['id']
             })
@@ -172,6 +243,8 @@ def generate_techno():
                 'prompt': full_prompt
             }), 500
             
+    except RateLimited as e:
+        return rate_limited_response(e)
     except Exception as e:
         print(f"❌ Generation error: {str(e)}")
         return jsonify({
@@ -180,19 +253,54 @@ def generate_techno():
             'details': 'Check your Suno API key and try again'
         }), 500
 
+def public_state(state):
+    return {
+        'track_id': state['track_id'],
+        'status': state['status'],
+        'audio_url': state['audio_url'],
+        'finished': state['finished'],
+        'version': state['version'],
+        'updated_at': state['updated_at']
+    }
+
 @app.route('/status/<track_id>')
 def check_status(track_id):
-    """Check generation status"""
-    try:
-        # This would check with Suno API for real status
-        # For now, return mock status
-        return jsonify({
-            'track_id': track_id,
-            'status': 'completed',
-            'audio_url': 'https://example.com/track.mp3'
-        })
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    """Check generation status from the track store
+
+    ?wait=N holds the request for up to N seconds until the track moves past
+    ?version= (default: the current version) or finishes.
+    """
+    state = track_store.get(track_id)
+    if not state:
+        return jsonify({'error': f'Unknown track: {track_id}'}), 404
+    
+    wait = min(request.args.get('wait', 0, type=float), MAX_WAIT_SECONDS)
+    if wait > 0 and not state['finished']:
+        version = request.args.get('version', state['version'], type=int)
+        state = track_store.wait(track_id, version, wait)
+    return jsonify(public_state(state))
+
+@app.route('/status/<track_id>/events')
+def status_events(track_id):
+    """Server-sent events with every status change until the track finishes"""
+    if not track_store.get(track_id):
+        return jsonify({'error': f'Unknown track: {track_id}'}), 404
+    
+    def events():
+        version = 0
+        deadline = time.time() + MAX_STREAM_SECONDS
+        while time.time() < deadline:
+            state = track_store.wait(track_id, version, timeout=min(15, deadline - time.time()))
+            if state['version'] > version:
+                version = state['version']
+                yield f"event: status\ndata: {json.dumps(public_state(state))}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+            if state['finished']:
+                return
+        yield f"event: timeout\ndata: {json.dumps(public_state(track_store.get(track_id)))}\n\n"
+    
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5002))
@@ -202,4 +310,4 @@ if __name__ == '__main__':
     print("🔑 Requires: Suno API key from app.suno.ai")
     print("=" * 60)
     
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import math
+import os
+import sys
+import time
+
+import pytest
+
+np = pytest.importorskip('numpy')
+soundfile = pytest.importorskip('soundfile')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_encoding import AudioEncoder, _resample_polyphase, resample  # noqa: E402
+
+RATE = 32000
+
+
+def write_tone(path, frequency, seconds=0.5):
+    t = np.arange(int(RATE * seconds)) / RATE
+    soundfile.write(path, (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32), RATE, subtype='FLOAT')
+
+
+@pytest.fixture
+def encoder(tmp_path):
+    encoder = AudioEncoder(str(tmp_path / 'encoded'), formats=('flac', 'wav'), workers=1)
+    yield encoder
+    if encoder._pool:
+        encoder._pool.shutdown()
+
+
+def test_regenerated_source_is_encoded_again(tmp_path, encoder):
+    source = str(tmp_path / 'track.wav')
+    write_tone(source, 440)
+    first = encoder.get(source, 'track', 'flac')
+    assert first and encoder.get(source, 'track', 'flac') == first
+
+    # The cache regenerates the entry under the same id
+    time.sleep(0.01)
+    write_tone(source, 880, seconds=1.0)
+    second = encoder.get(source, 'track', 'flac')
+
+    assert second != first
+    data, rate = soundfile.read(second)
+    assert rate == RATE and len(data) == RATE
+    assert encoder.stats()['encoded'] == 2
+
+
+@pytest.mark.parametrize('resampler', [resample, _resample_polyphase], ids=['resample', 'numpy'])
+@pytest.mark.parametrize('rate,target', [(32000, 48000), (48000, 32000), (44100, 48000)])
+def test_resampled_tone_keeps_its_pitch(resampler, rate, target):
+    def tone(sample_rate, frames):
+        t = np.arange(frames) / sample_rate
+        return np.stack([np.sin(2 * np.pi * 1000 * t), 0.5 * np.cos(2 * np.pi * 1000 * t)], axis=1)
+
+    data = tone(rate, rate // 10).astype(np.float32)
+    if resampler is _resample_polyphase:
+        g = math.gcd(rate, target)
+        out = resampler(data, target // g, rate // g)
+    else:
+        out = resampler(data, rate, target)
+
+    assert out.shape == (target // 10, 2) and out.dtype == np.float32
+    # Edges see the zero padding; the middle must match a tone sampled at the new rate
+    edge = target // 100
+    assert np.abs(out - tone(target, len(out)))[edge:-edge].max() < 0.01
@@ -0,0 +1,64 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batcher import MicroBatcher  # noqa: E402
+
+
+class RecordingRunner:
+    """run_batch that records its batches; a 'gate' batch holds the thread until opened"""
+
+    def __init__(self):
+        self.batches = []
+        self.gate = threading.Event()
+        self.gated = threading.Event()
+
+    def __call__(self, key, items):
+        if key == 'gate':
+            self.gated.set()
+            self.gate.wait(5)
+        else:
+            self.batches.append((key, list(items)))
+        return [f'{key}:{item}' for item in items]
+
+
+def submit_while_busy(batcher, runner, submissions):
+    """Queue submissions while the batcher thread is busy, so they are all collected together"""
+    batcher.submit('gate', 0)
+    assert runner.gated.wait(5)
+    futures = [batcher.submit(key, item) for key, item in submissions]
+    runner.gate.set()
+    return [future.result(timeout=5) for future in futures]
+
+
+def test_items_are_grouped_by_key():
+    runner = RecordingRunner()
+    batcher = MicroBatcher(runner, window=0.2, max_batch=4)
+
+    results = submit_while_busy(batcher, runner, [('8', 'a'), ('16', 'b'), ('8', 'c'), ('16', 'd')])
+
+    assert results == ['8:a', '16:b', '8:c', '16:d']
+    assert runner.batches == [('8', ['a', 'c']), ('16', ['b', 'd'])]
+    assert batcher.stats()['items_run'] == 5
+
+
+def test_batches_never_exceed_max_batch():
+    runner = RecordingRunner()
+    batcher = MicroBatcher(runner, window=0.2, max_batch=2)
+
+    results = submit_while_busy(batcher, runner, [('8', i) for i in range(5)])
+
+    assert results == [f'8:{i}' for i in range(5)]
+    assert [items for _, items in runner.batches] == [[0, 1], [2, 3], [4]]
+
+
+def test_other_keys_collected_past_max_batch_are_split():
+    runner = RecordingRunner()
+    batcher = MicroBatcher(runner, window=0.2, max_batch=2)
+
+    # Collection stops when the first key is full, by which time '16' holds three items
+    submit_while_busy(batcher, runner, [('8', 'a'), ('16', 'b'), ('16', 'c'), ('16', 'd'), ('8', 'e')])
+
+    assert runner.batches == [('8', ['a', 'e']), ('16', ['b', 'c']), ('16', ['d'])]
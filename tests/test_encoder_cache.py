@@ -0,0 +1,110 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('transformers')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoder_cache import EncoderCache  # noqa: E402
+
+HIDDEN = 8
+
+
+class FakeTextEncoder:
+    def __call__(self, input_ids, attention_mask):
+        return SimpleNamespace(last_hidden_state=torch.ones(*input_ids.shape, HIDDEN))
+
+
+class FakeMusicgen:
+    """Records generate() calls; rejects cached encoder outputs like an incompatible release would"""
+
+    def __init__(self, accept_plain=True):
+        self.text_encoder = FakeTextEncoder()
+        self.generation_config = SimpleNamespace(guidance_scale=3.0)
+        self.accept_plain = accept_plain
+        self.calls = []
+
+    def generate(self, **kwargs):
+        self.calls.append(kwargs)
+        if 'encoder_outputs' in kwargs:
+            raise TypeError("unexpected keyword argument 'encoder_outputs'")
+        if not self.accept_plain:
+            raise RuntimeError('out of memory')
+        return 'audio'
+
+
+class FakeStreamer:
+    def __init__(self, restartable):
+        self.restartable = restartable
+        self.restarts = 0
+
+    def restart(self):
+        self.restarts += 1
+        return self.restartable
+
+
+def tokenized():
+    return {
+        'input_ids': torch.tensor([[5, 6, 7], [8, 9, 0]]),
+        'attention_mask': torch.tensor([[1, 1, 1], [1, 1, 0]]),
+    }
+
+
+def test_rejected_cache_falls_back_to_plain_inputs_and_disables_the_model():
+    cache = EncoderCache(kv_max_bytes=0)
+    model = FakeMusicgen()
+
+    inputs = cache.conditioning(model, tokenized(), guidance_scale=3.0)
+    assert 'encoder_outputs' in inputs
+    assert cache.generate(model, inputs, max_new_tokens=10) == 'audio'
+
+    assert len(model.calls) == 2
+    plain = model.calls[1]
+    assert 'encoder_outputs' not in plain and 'past_key_values' not in plain
+    assert torch.equal(plain['attention_mask'], tokenized()['attention_mask'])
+    assert plain['max_new_tokens'] == 10
+    assert cache.stats()['disabled_models'] == 1
+
+    # From now on the model skips the cache and generates in one call
+    inputs = cache.conditioning(model, tokenized(), guidance_scale=3.0)
+    assert 'encoder_outputs' not in inputs
+    assert cache.generate(model, inputs) == 'audio'
+    assert len(model.calls) == 3
+
+
+def test_failure_without_the_cache_is_raised_and_keeps_the_cache():
+    cache = EncoderCache(kv_max_bytes=0)
+    model = FakeMusicgen(accept_plain=False)
+
+    inputs = cache.conditioning(model, tokenized(), guidance_scale=3.0)
+    with pytest.raises(RuntimeError):
+        cache.generate(model, inputs)
+    assert len(model.calls) == 2
+    assert cache.stats()['disabled_models'] == 0
+
+
+def test_streamer_that_already_sent_audio_is_not_retried():
+    cache = EncoderCache(kv_max_bytes=0)
+    model = FakeMusicgen()
+    streamer = FakeStreamer(restartable=False)
+
+    inputs = cache.conditioning(model, tokenized(), guidance_scale=3.0)
+    with pytest.raises(TypeError):
+        cache.generate(model, inputs, streamer=streamer)
+    assert len(model.calls) == 1
+    assert streamer.restarts == 1
+
+
+def test_streamer_is_restarted_before_the_retry():
+    cache = EncoderCache(kv_max_bytes=0)
+    model = FakeMusicgen()
+    streamer = FakeStreamer(restartable=True)
+
+    inputs = cache.conditioning(model, tokenized(), guidance_scale=3.0)
+    assert cache.generate(model, inputs, streamer=streamer) == 'audio'
+    assert streamer.restarts == 1
+    assert model.calls[1]['streamer'] is streamer
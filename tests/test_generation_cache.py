@@ -0,0 +1,60 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generation_cache import GenerationCache  # noqa: E402
+
+
+def generated(tmp_path, name, size=100):
+    path = tmp_path / f'{name}.tmp'
+    path.write_bytes(b'\0' * size)
+    return str(path)
+
+
+def test_least_recently_used_entry_is_evicted_by_bytes(tmp_path):
+    cache = GenerationCache(directory=str(tmp_path / 'cache'), max_bytes=250)
+
+    cache.put('a', generated(tmp_path, 'a'))
+    cache.put('b', generated(tmp_path, 'b'))
+    assert cache.get('a')  # a is now the most recently used
+    cache.put('c', generated(tmp_path, 'c'))
+
+    assert cache.get('b') is None
+    assert not os.path.exists(os.path.join(cache.directory, 'b.wav'))
+    assert cache.get('a') and cache.get('c')
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['evictions'] == 1
+
+
+def test_replacing_an_entry_counts_its_bytes_once(tmp_path):
+    cache = GenerationCache(directory=str(tmp_path / 'cache'), max_bytes=250)
+
+    cache.put('a', generated(tmp_path, 'a'))
+    cache.put('a', generated(tmp_path, 'a2'))
+    cache.put('b', generated(tmp_path, 'b'))
+
+    assert cache.get('a') and cache.get('b')
+    assert cache.stats()['evictions'] == 0
+
+
+def test_oversized_entry_evicts_everything(tmp_path):
+    cache = GenerationCache(directory=str(tmp_path / 'cache'), max_bytes=250)
+
+    cache.put('a', generated(tmp_path, 'a'))
+    cache.put('big', generated(tmp_path, 'big', size=300))
+
+    assert cache.get('a') is None and cache.get('big') is None
+    assert os.listdir(cache.directory) == []
+
+
+def test_restart_keeps_entries_within_the_limit(tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = GenerationCache(directory=directory, max_bytes=1000)
+    for name in 'abc':
+        cache.put(name, generated(tmp_path, name))
+
+    restarted = GenerationCache(directory=directory, max_bytes=250)
+
+    assert restarted.stats()['entries'] == 2
+    assert restarted.stats()['evictions'] == 1
@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from health_prober import HealthProber  # noqa: E402
+
+
+class StandIn:
+    """Local upstream whose /<name>/health answers 200 or 503 and counts hits"""
+
+    def __init__(self):
+        self.healthy = {}
+        self.hits = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.hits += 1
+                name = self.path.strip('/').split('/')[0]
+                self.send_response(200 if stand_in.healthy.get(name, True) else 503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def probe(self, name):
+        return lambda: requests.get(f'{self.url}/{name}/health', timeout=2).status_code == 200
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+@pytest.mark.parametrize('healthy', [True, False])
+def test_result_is_cached_until_the_ttl_expires(stand_in, healthy):
+    stand_in.healthy['svc'] = healthy
+    prober = HealthProber({'svc': stand_in.probe('svc')}, ttl=0.3)
+
+    assert prober.probe_now('svc')['healthy'] is healthy
+    assert stand_in.hits == 1
+
+    # The upstream flips, but readers keep the cached result and nothing is probed
+    stand_in.healthy['svc'] = not healthy
+    for _ in range(5):
+        status = prober.status('svc')
+        assert status['healthy'] is healthy and not status['stale']
+        assert prober.is_healthy('svc') is healthy
+    assert stand_in.hits == 1
+
+    time.sleep(0.4)
+    status = prober.status('svc')
+    assert status['healthy'] is None and status['stale']
+    assert prober.is_healthy('svc')
+    assert stand_in.hits == 1
+
+
+@pytest.fixture
+def service_server(stand_in, monkeypatch):
+    import multi_service_server
+
+    # Keep the background thread from probing; the tests probe synchronously
+    monkeypatch.setattr(multi_service_server.health_prober, 'start', lambda: None)
+    monkeypatch.setattr(multi_service_server.health_prober, '_results', {})
+    for name, service in multi_service_server.SERVICES.items():
+        monkeypatch.setattr(service, 'base_url', f'{stand_in.url}/{name}')
+    return multi_service_server
+
+
+def test_services_answers_from_the_cache(stand_in, service_server):
+    stand_in.healthy['muzic'] = False
+    for name in service_server.SERVICES:
+        service_server.health_prober.probe_now(name)
+    probed = stand_in.hits
+
+    client = service_server.app.test_client()
+    body = client.get('/services').get_json()
+    assert stand_in.hits == probed
+
+    assert body['muzic']['health']['healthy'] is False
+    assert body['suno']['health']['healthy'] is True
+    assert body['replicate']['health']['healthy'] is True
+
+
+def test_down_service_is_taken_out_of_routing(stand_in, service_server):
+    stand_in.healthy['suno'] = False
+    for name in service_server.SERVICES:
+        service_server.health_prober.probe_now(name)
+
+    status = service_server.services_status()
+    assert status['suno']['available'] is False
+    assert status['muzic']['available'] and status['replicate']['available']
+
+    ranked = service_server.router.rank(['suno', 'muzic', 'replicate'])
+    assert ranked[-1] == 'suno'
+
+    # Once it recovers it is routed to again
+    stand_in.healthy['suno'] = True
+    service_server.health_prober.probe_now('suno')
+    assert service_server.services_status()['suno']['available']
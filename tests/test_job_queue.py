@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import JobQueue, QueueFull  # noqa: E402
+
+
+class BlockingHandler:
+    """Holds every job until released, so jobs stay queued or running"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.calls = []
+
+    def __call__(self, job):
+        self.calls.append(job.params)
+        self.started.set()
+        self.release.wait(5)
+        return f"done:{job.params['prompt']}"
+
+
+def test_identical_requests_join_the_unfinished_job():
+    handler = BlockingHandler()
+    jobs = JobQueue(handler, max_size=4)
+
+    job, joined = jobs.submit_or_join({'prompt': 'kick'}, key='kick')
+    assert not joined
+    same, joined = jobs.submit_or_join({'prompt': 'kick'}, key='kick')
+    assert joined and same is job
+    other, joined = jobs.submit_or_join({'prompt': 'hat'}, key='hat')
+    assert not joined and other is not job
+    assert job.shared == 1
+    assert jobs.stats()['collapsed'] == 1
+
+    handler.release.set()
+    assert job.done.wait(5) and other.done.wait(5)
+    assert job.result == 'done:kick'
+    assert handler.calls == [{'prompt': 'kick'}, {'prompt': 'hat'}]
+
+    # A finished job is not joined again
+    again, joined = jobs.submit_or_join({'prompt': 'kick'}, key='kick')
+    assert not joined and again is not job
+    assert again.done.wait(5)
+
+
+def test_requests_without_a_key_never_join():
+    handler = BlockingHandler()
+    handler.release.set()
+    jobs = JobQueue(handler, max_size=4)
+
+    first, _ = jobs.submit_or_join({'prompt': 'kick'})
+    second, joined = jobs.submit_or_join({'prompt': 'kick'})
+    assert not joined and second is not first
+    assert first.done.wait(5) and second.done.wait(5)
+
+
+def test_full_queue_raises_with_its_depth():
+    handler = BlockingHandler()
+    jobs = JobQueue(handler, max_size=2)
+
+    running = jobs.submit({'prompt': 'running'})
+    assert handler.started.wait(5)
+    queued = jobs.submit({'prompt': 'a'}, key='a')
+    jobs.submit({'prompt': 'b'}, key='b')
+    assert jobs.depth() == 2
+
+    with pytest.raises(QueueFull) as full:
+        jobs.submit({'prompt': 'c'}, key='c')
+    assert (full.value.depth, full.value.max_size) == (2, 2)
+
+    # Joining a queued job needs no free slot
+    job, joined = jobs.submit_or_join({'prompt': 'a'}, key='a')
+    assert joined and job is queued
+
+    handler.release.set()
+    assert running.done.wait(5) and queued.done.wait(5)
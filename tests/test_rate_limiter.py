@@ -0,0 +1,64 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import ProviderLimiter, RateLimited, _key_id  # noqa: E402
+
+
+def test_concurrency_timeout_refunds_the_token():
+    # One token per ~17 minutes, so a token that isn't refunded is gone for the test
+    limiter = ProviderLimiter('test', rate=0.001, burst=2, max_concurrency=1)
+
+    with limiter.slot('key'):
+        with pytest.raises(RateLimited):
+            with limiter.slot('key', max_wait=0.05):
+                pass
+
+    # Both tokens are still there: one for the call that ran, one given back
+    with limiter.slot('key', max_wait=0):
+        pass
+    with pytest.raises(RateLimited):
+        with limiter.slot('key', max_wait=0):
+            pass
+    assert limiter.stats()['rejected'] == 2
+
+
+def test_async_concurrency_timeout_refunds_the_token():
+    limiter = ProviderLimiter('test', rate=0.001, burst=2, max_concurrency=1)
+
+    async def run():
+        async with limiter.async_slot('key'):
+            with pytest.raises(RateLimited):
+                async with limiter.async_slot('key', max_wait=0.05):
+                    pass
+        async with limiter.async_slot('key', max_wait=0):
+            pass
+
+    asyncio.run(run())
+    assert limiter.stats()['rejected'] == 1
+
+
+def test_idle_keys_are_swept():
+    limiter = ProviderLimiter('test', rate=100, burst=1)
+    limiter.SWEEP_INTERVAL = 0
+
+    for key in ('idle', 'paused'):
+        with limiter.slot(key):
+            pass
+    limiter.note_retry_after('paused', 60)
+    assert limiter.stats()['keys'] == 2
+
+    # Both buckets refill within 10ms; only the key upstream paused is kept
+    time.sleep(0.05)
+    with limiter.slot('busy'):
+        pass
+    stats = limiter.stats()
+    assert stats['keys'] == 2
+    assert stats['keys_paused'] == 1
+    assert _key_id('idle') not in limiter._buckets
+    assert _key_id('paused') in limiter._buckets
@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from track_store import TrackStore  # noqa: E402
+
+
+def test_wait_wakes_on_a_version_bump():
+    store = TrackStore()
+    store.add('t1', 'key')
+
+    timer = threading.Timer(0.1, store.update, args=('t1', 'streaming', 'http://audio/t1'))
+    timer.start()
+    started = time.time()
+    state = store.wait('t1', version=1, timeout=5)
+    timer.join()
+
+    assert time.time() - started < 2
+    assert state['version'] == 2 and state['status'] == 'streaming'
+    assert state['audio_url'] == 'http://audio/t1'
+
+
+def test_wait_returns_at_once_for_a_newer_or_finished_track():
+    store = TrackStore()
+    store.add('t1', 'key')
+    store.update('t1', 'complete')
+
+    started = time.time()
+    assert store.wait('t1', version=0, timeout=5)['finished']
+    assert store.wait('t1', version=5, timeout=5)['status'] == 'complete'
+    assert store.wait('missing', timeout=5) is None
+    assert time.time() - started < 1
+
+
+def test_wait_times_out_with_the_unchanged_state():
+    store = TrackStore()
+    store.add('t1', 'key')
+
+    state = store.wait('t1', version=1, timeout=0.1)
+    assert state['version'] == 1 and not state['finished']
+
+
+def test_finished_tracks_are_evicted_least_recently_used_first():
+    store = TrackStore(max_finished=2)
+    for track_id in ('a', 'b', 'c'):
+        store.add(track_id, 'key')
+    store.update('a', 'complete')
+    store.update('b', 'complete')
+    store.get('a')
+    store.update('c', 'complete')
+
+    assert store.get('b') is None
+    assert store.get('a') and store.get('c')
+    assert store.stats()['evictions'] == 1
+
+
+def test_pending_tracks_are_never_evicted():
+    store = TrackStore(max_finished=1)
+    for track_id in ('a', 'b', 'c'):
+        store.add(track_id, 'key')
+    store.add('done', 'key', status='complete')
+
+    assert [track_id for track_id, _, _ in store.pending()] == ['a', 'b', 'c']
+    assert store.stats()['tracks'] == 4
+
+
+def test_evicted_tracks_are_read_back_from_sqlite(tmp_path):
+    store = TrackStore(str(tmp_path / 'tracks.db'), max_finished=1)
+    store.add('a', 'key')
+    store.update('a', 'complete', 'http://audio/a')
+    store.add('b', 'key', status='complete')
+    assert store.stats()['tracks'] == 1
+
+    state = store.get('a')
+    assert state['status'] == 'complete' and state['audio_url'] == 'http://audio/a'
+    assert store.wait('b', version=5, timeout=5)['status'] == 'complete'
+    assert store.get('missing') is None
+
+
+def test_restore_times_out_pending_tracks(tmp_path):
+    db_path = str(tmp_path / 'tracks.db')
+    store = TrackStore(db_path)
+    store.add('pending', 'key')
+    store.add('done', 'key', status='complete')
+
+    restored = TrackStore(db_path)
+    assert restored.get('pending')['status'] == 'timeout'
+    assert restored.get('done')['status'] == 'complete'
+    assert restored.pending() == []
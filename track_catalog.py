@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Track Catalog
+Persistent, indexed history of every track any backend has generated
+
+Every server writes the tracks it hands out to one SQLite file, and /tracks
+pages through it newest first. Each filter (style, backend, prompt) has an
+index on (filter, created_at, id), and pages continue from a cursor instead
+of an OFFSET. A page is one index range scan however many tracks the
+catalog holds. Prompts are stored with a hash of their normalised text, so
+"has this prompt been generated before" is one index lookup too.
+
+The database runs in WAL mode, so every worker process and thread can share
+it. Readers never block the writer. Each thread opens its own connection.
+
+Settings:
+  TRACK_CATALOG_DB - SQLite file for the catalog (default <tmp>/techno_tracks.db)
+"""
+
+import base64
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+
+from single_flight import normalize
+
+DEFAULT_CATALOG_DB = os.path.join(tempfile.gettempdir(), 'techno_tracks.db')
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS tracks (
+        id TEXT PRIMARY KEY,
+        backend TEXT NOT NULL,
+        style TEXT,
+        prompt TEXT,
+        prompt_hash TEXT,
+        status TEXT,
+        audio_url TEXT,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        track TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS tracks_created ON tracks (created_at, id)',
+    'CREATE INDEX IF NOT EXISTS tracks_style ON tracks (style, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS tracks_backend ON tracks (backend, created_at, id)',
+    'CREATE INDEX IF NOT EXISTS tracks_prompt ON tracks (prompt_hash, created_at, id)',
+]
+
+# Re-adding a track (e.g. once it finishes) updates it but keeps its place in the history
+UPSERT = '''
+    INSERT INTO tracks (id, backend, style, prompt, prompt_hash, status, audio_url, created_at, updated_at, track)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET
+        status = excluded.status,
+        audio_url = COALESCE(excluded.audio_url, tracks.audio_url),
+        updated_at = excluded.updated_at,
+        track = excluded.track
+'''
+
+FILTERS = ('style', 'backend', 'prompt_hash')
+
+
+def new_track_id(backend):
+    """Unique track id; ids from one backend sort by creation time"""
+    return f'{backend}_{time.time_ns() // 1_000_000}_{secrets.token_hex(6)}'
+
+
+def prompt_hash(prompt):
+    """Hash of a prompt's normalised text, the key for dedupe lookups"""
+    if not prompt:
+        return None
+    return hashlib.sha256(normalize(prompt).encode()).hexdigest()
+
+
+def encode_cursor(created_at, track_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, track_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, track_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(created_at), str(track_id)
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid cursor: {cursor}')
+
+
+class TrackCatalog:
+    """Track history in SQLite, shared by every process pointed at the same file"""
+
+    def __init__(self, db_path=DEFAULT_CATALOG_DB):
+        self.db_path = db_path
+        self.writes = 0
+        self.errors = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = self._connection()
+        with db:
+            for statement in SCHEMA:
+                db.execute(statement)
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or forks
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.db_path, timeout=10)
+            db.row_factory = sqlite3.Row
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def add(self, track, backend):
+        """Record a track dict (which must have an 'id') and return it
+
+        A catalog failure is logged rather than raised, so it never costs
+        the client the track it just generated.
+        """
+        now = time.time()
+        prompt = track.get('prompt')
+        try:
+            with self._connection() as db:
+                db.execute(UPSERT, (
+                    track['id'], backend, track.get('style'), prompt, prompt_hash(prompt),
+                    track.get('status'), track.get('audio_url'), now, now, json.dumps(track, default=str)
+                ))
+            with self._lock:
+                self.writes += 1
+        except sqlite3.Error as e:
+            with self._lock:
+                self.errors += 1
+            print(f"❌ Could not catalog track {track.get('id')}: {e}")
+        return track
+
+    def update(self, track_id, status, audio_url=None):
+        """Record a catalogued track's new status"""
+        try:
+            with self._connection() as db:
+                db.execute(
+                    'UPDATE tracks SET status = ?, audio_url = COALESCE(?, audio_url), updated_at = ? WHERE id = ?',
+                    (status, audio_url, time.time(), track_id)
+                )
+        except sqlite3.Error as e:
+            with self._lock:
+                self.errors += 1
+            print(f"❌ Could not update catalogued track {track_id}: {e}")
+
+    def _row(self, row):
+        track = json.loads(row['track'])
+        track.update(id=row['id'], backend=row['backend'], status=row['status'], audio_url=row['audio_url'],
+                     created_at=row['created_at'], updated_at=row['updated_at'])
+        return track
+
+    def get(self, track_id):
+        row = self._connection().execute('SELECT * FROM tracks WHERE id = ?', (track_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def page(self, style=None, backend=None, prompt=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """(tracks, next cursor) newest first; next cursor is None on the last page"""
+        values = {'style': style, 'backend': backend, 'prompt_hash': prompt_hash(prompt)}
+        clauses = [f'{name} = ?' for name in FILTERS if values[name] is not None]
+        params = [values[name] for name in FILTERS if values[name] is not None]
+        if cursor:
+            clauses.append('(created_at, id) < (?, ?)')
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        rows = self._connection().execute(
+            f'SELECT * FROM tracks {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+            params + [limit + 1]
+        ).fetchall()
+        tracks = [self._row(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1]['created_at'], rows[limit - 1]['id']) if len(rows) > limit else None
+        return tracks, next_cursor
+
+    def listing(self, args):
+        """/tracks response body and status code for the query arguments in args"""
+        try:
+            limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+            tracks, next_cursor = self.page(
+                style=args.get('style'),
+                backend=args.get('backend'),
+                prompt=args.get('prompt'),
+                cursor=args.get('cursor'),
+                limit=limit
+            )
+        except ValueError as e:
+            return {'error': str(e)}, 400
+        except sqlite3.Error as e:
+            return {'error': f'Track catalog unavailable: {e}'}, 503
+        return {'tracks': tracks, 'count': len(tracks), 'next_cursor': next_cursor}, 200
+
+    def stats(self):
+        try:
+            # Tracks are never deleted, so the highest rowid is the count without a table scan
+            total = self._connection().execute('SELECT MAX(rowid) FROM tracks').fetchone()[0] or 0
+        except sqlite3.Error:
+            total = None
+        with self._lock:
+            return {'db': self.db_path, 'tracks': total, 'writes': self.writes, 'errors': self.errors}
+
+
+def install(app, catalog):
+    """Serve GET /tracks from a Flask app"""
+    from flask import jsonify, request
+
+    def tracks():
+        body, status = catalog.listing(request.args)
+        return jsonify(body), status
+
+    app.add_url_rule('/tracks', 'tracks', tracks)
+    return app
+
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def catalog_from_env():
+    """Track catalog shared by every app in the process"""
+    with _shared_lock:
+        if 'catalog' not in _shared:
+            _shared['catalog'] = TrackCatalog(os.environ.get('TRACK_CATALOG_DB') or DEFAULT_CATALOG_DB)
+        return _shared['catalog']
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Track Status Store
+Remembers every generated track's latest upstream status so /status never has to ask upstream
+
+A background poller refreshes the pending tracks in bulk; readers get the
+stored state straight from memory and can block until it changes.
+
+Credentials are never persisted, so a track still pending when the server
+stopped can't be polled again. On restore it is marked timed out instead of
+being left pending forever.
+
+Only the most recently used finished tracks stay in memory. With
+TRACK_STORE_DB set, older ones are read back from SQLite when asked for;
+without it they are forgotten.
+
+Settings:
+  TRACK_STORE_DB           - SQLite file to persist track states across restarts (default: memory only)
+  TRACK_STORE_MAX_FINISHED - finished tracks kept in memory (default 1000)
+  TRACK_POLL_INTERVAL      - seconds between refreshes of pending tracks (default 3)
+  TRACK_POLL_WORKERS       - concurrent upstream status calls per refresh (default 8)
+  TRACK_PENDING_TTL        - seconds before a track that never finishes is marked timed out (default 600)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+FINISHED_STATUSES = {'complete', 'completed', 'succeeded', 'failed', 'error', 'canceled', 'timeout'}
+
+
+def is_finished(status):
+    return (status or '').lower() in FINISHED_STATUSES
+
+
+class TrackStore:
+    """Latest known state per track id, optionally written through to SQLite
+
+    Credentials needed to poll a track are kept in memory only and never persisted.
+    on_update(state), if given, is called after every status change.
+    """
+
+    def __init__(self, db_path=None, on_update=None, max_finished=1000):
+        self.db_path = db_path
+        self.on_update = on_update
+        self.max_finished = max_finished
+        self.evictions = 0
+        self._tracks = {}
+        self._finished = OrderedDict()  # finished track ids, least recently used first
+        self._credentials = {}
+        self._cond = threading.Condition()
+        self._db_lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._open_db()
+
+    def _open_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS tracks (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._db.commit()
+        restored = [json.loads(state) for state, in self._db.execute('SELECT state FROM tracks ORDER BY updated_at')]
+        with self._cond:
+            for state in restored:
+                self._remember(state)
+        for state in restored:
+            if not state['finished']:
+                self.update(state['track_id'], 'timeout')
+
+    def _remember(self, state):
+        # Caller holds self._cond
+        track_id = state['track_id']
+        self._tracks[track_id] = state
+        if not state['finished']:
+            return
+        self._finished[track_id] = None
+        self._finished.move_to_end(track_id)
+        while len(self._finished) > self.max_finished:
+            evicted, _ = self._finished.popitem(last=False)
+            del self._tracks[evicted]
+            self.evictions += 1
+
+    def _load(self, track_id):
+        """Read an evicted track back from SQLite"""
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute('SELECT state FROM tracks WHERE id = ?', (track_id,)).fetchone()
+        if row is None:
+            return None
+        state = json.loads(row[0])
+        with self._cond:
+            # Keep whatever arrived in memory meanwhile, it is at least as new
+            if track_id not in self._tracks:
+                self._remember(state)
+            return dict(self._tracks[track_id])
+
+    def _persist(self, state):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO tracks (id, state, updated_at) VALUES (?, ?, ?)',
+                (state['track_id'], json.dumps(state), state['updated_at'])
+            )
+            self._db.commit()
+
+    def add(self, track_id, credentials, status='processing', audio_url=None, **extra):
+        """Start tracking a newly submitted track"""
+        state = dict(extra, track_id=track_id, status=status, audio_url=audio_url,
+                     finished=is_finished(status), created_at=time.time(), updated_at=time.time(), version=1)
+        with self._cond:
+            self._remember(state)
+            if not state['finished']:
+                self._credentials[track_id] = credentials
+            self._cond.notify_all()
+        self._persist(state)
+        return dict(state)
+
+    def update(self, track_id, status, audio_url=None):
+        """Record a fresh upstream status; returns True if anything changed"""
+        with self._cond:
+            state = self._tracks.get(track_id)
+            if state is None:
+                return False
+            audio_url = audio_url or state['audio_url']
+            if status == state['status'] and audio_url == state['audio_url']:
+                return False
+            state = dict(state, status=status, audio_url=audio_url, finished=is_finished(status),
+                         updated_at=time.time(), version=state['version'] + 1)
+            self._remember(state)
+            if state['finished']:
+                self._credentials.pop(track_id, None)
+            self._cond.notify_all()
+        self._persist(state)
+        if self.on_update:
+            self.on_update(dict(state))
+        return True
+
+    def get(self, track_id):
+        with self._cond:
+            state = self._tracks.get(track_id)
+            if state is not None:
+                if track_id in self._finished:
+                    self._finished.move_to_end(track_id)
+                return dict(state)
+        return self._load(track_id)
+
+    def wait(self, track_id, version=0, timeout=30):
+        """Block until the track moves past version or finishes, then return its state"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                state = self._tracks.get(track_id)
+                if state is None:
+                    break
+                if state['finished'] or state['version'] > version:
+                    return dict(state)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return dict(state)
+                self._cond.wait(remaining)
+        # Only finished tracks are evicted, so there is nothing to wait for
+        return self._load(track_id)
+
+    def pending(self):
+        """(track_id, credentials, created_at) for every unfinished track we can still poll"""
+        with self._cond:
+            return [(track_id, credentials, self._tracks[track_id]['created_at'])
+                    for track_id, credentials in self._credentials.items()]
+
+    def stats(self):
+        with self._cond:
+            return {
+                'tracks': len(self._tracks),
+                'pending': len(self._credentials),
+                'max_finished': self.max_finished,
+                'evictions': self.evictions,
+                'persistent': self._db is not None
+            }
+
+
+class TrackPoller:
+    """Refreshes every pending track in the store from one background thread
+
+    fetch_status(track_id, credentials) returns the upstream track dict
+    (with 'status' and optionally 'audio_url') or None on error.
+    """
+
+    def __init__(self, store, fetch_status, interval=3.0, workers=8, pending_ttl=600):
+        self.store = store
+        self.fetch_status = fetch_status
+        self.interval = interval
+        self.workers = workers
+        self.pending_ttl = pending_ttl
+        self.polls = 0
+        self.upstream_calls = 0
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        # Threads don't survive fork, so start lazily in the serving process
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name='track-poller', daemon=True).start()
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='track-poll') as pool:
+            while True:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+                try:
+                    self.poll_once(pool)
+                except Exception as e:
+                    print(f"❌ Track poll failed: {e}")
+
+    def _refresh(self, track_id, credentials):
+        result = self.fetch_status(track_id, credentials)
+        if result and result.get('status'):
+            self.store.update(track_id, result['status'], result.get('audio_url'))
+
+    def poll_once(self, pool):
+        pending = self.store.pending()
+        if not pending:
+            return
+        self.polls += 1
+        now = time.time()
+        due = []
+        for track_id, credentials, created_at in pending:
+            if now - created_at > self.pending_ttl:
+                self.store.update(track_id, 'timeout')
+            else:
+                due.append((track_id, credentials))
+        self.upstream_calls += len(due)
+        list(pool.map(lambda item: self._refresh(*item), due))
+
+    def stats(self):
+        return {
+            'interval_s': self.interval,
+            'polls': self.polls,
+            'upstream_calls': self.upstream_calls
+        }
+
+
+def store_from_env(on_update=None):
+    return TrackStore(
+        os.environ.get('TRACK_STORE_DB') or None,
+        on_update,
+        max_finished=int(os.environ.get('TRACK_STORE_MAX_FINISHED', 1000))
+    )
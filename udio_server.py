@@ -6,13 +6,19 @@ Direct API integration for reliable TECHNO generation
 
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import requests
 import json
 import time
 import os
 
+import http_pool
+import metrics
+import track_catalog
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend requests
+metrics.instrument(app, 'udio')
+catalog = track_catalog.catalog_from_env()
+track_catalog.install(app, catalog)
 
 # TECHNO-specific prompts and styles
 TECHNO_STYLES = {
@@ -25,7 +31,7 @@ TECHNO_STYLES = {
 }
 
 # Udio API endpoints
-UDIO_API_BASE = "https://www.udio.com/api"
+UDIO_API_BASE = os.environ.get('UDIO_API_BASE', "https://www.udio.com/api")
 
 def create_techno_prompt(style, user_input):
     """Create optimized TECHNO prompt"""
@@ -46,10 +52,11 @@ def make_udio_request(endpoint, method='GET', data=None, auth_token=None):
     url = f"{UDIO_API_BASE}/{endpoint}"
     
     try:
+        session = http_pool.get_session('udio')
         if method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=30)
+            response = session.post(url, headers=headers, json=data, timeout=30)
         else:
-            response = requests.get(url, headers=headers, timeout=30)
+            response = session.get(url, headers=headers, timeout=30)
         
         return response
     except Exception as e:
@@ -94,14 +101,14 @@ def generate_techno():
         time.sleep(2)
         
         # Mock successful response
-        track_data = {
-            'id': f'techno_{int(time.time())}',
+        track_data = catalog.add({
+            'id': track_catalog.new_track_id('udio'),
             'title': f'{style.title()} TECHNO - {user_prompt}',
             'audio_url': 'https://www.soundjay.com/misc/sounds/bell-ringing-05.wav',  # Demo audio
             'style': style,
             'prompt': full_prompt,
             'status': 'generated'
-        }
+        }, 'udio')
         
         return jsonify({
             'success': True,
@@ -119,7 +126,12 @@ def generate_techno():
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'service': 'udio-techno-generator'})
+    return jsonify({
+        'status': 'healthy',
+        'service': 'udio-techno-generator',
+        'upstream_pools': http_pool.pool_stats(),
+        'track_catalog': catalog.stats()
+    })
 
 @app.route('/test', methods=['POST'])
 def test_generation():
@@ -154,4 +166,4 @@ if __name__ == '__main__':
     print("=" * 60)
     
     # Run with minimal output
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port, debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
\ No newline at end of file
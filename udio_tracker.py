@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Udio Status Tracker
+Follows every outstanding Udio track from one background asyncio loop
+
+Instead of each request polling `songs?songIds=` in its own sleep loop, all
+in-flight track ids are coalesced into one status call per auth token per
+tick. The tick interval backs off while nothing changes and snaps back when
+new tracks arrive or tracks finish.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+
+class TrackTimeout(Exception):
+    """Raised when tracks don't finish within the tracker timeout"""
+
+
+class _Waiter:
+    def __init__(self, auth_token, track_ids, timeout):
+        self.auth_token = auth_token
+        self.track_ids = list(track_ids)
+        self.deadline = time.time() + timeout
+        self.future = Future()
+
+
+class UdioStatusTracker:
+    """Resolves futures once all of a generation's tracks are finished
+
+    fetch_statuses(auth_token, track_ids) must return a list of song dicts
+    (each with 'id' and 'finished') or None on error. It is blocking and runs
+    on the loop's default executor.
+    """
+
+    def __init__(self, fetch_statuses, min_interval=2.0, max_interval=30.0, backoff=1.5,
+                 timeout=300, max_ids_per_call=50, max_errors=3):
+        self.fetch_statuses = fetch_statuses
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_ids_per_call = max_ids_per_call
+        self.max_errors = max_errors
+        self.interval = min_interval
+
+        self._waiters = []
+        self._songs = {}  # track id -> latest song status
+        self._errors = {}  # auth token -> consecutive failed calls
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._ready = None
+        self._pid = None
+        self.ticks = 0
+        self.upstream_calls = 0
+
+    def _ensure_loop(self):
+        # Threads don't survive fork, so start the loop lazily in the serving process.
+        # Every caller waits for it, not just the one that started it.
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._loop = None  # After a fork this is still the parent's loop
+                self._ready = threading.Event()
+                threading.Thread(target=self._run_loop, args=(self._ready,), name='udio-tracker',
+                                 daemon=True).start()
+            ready = self._ready
+        ready.wait()
+
+    def _run_loop(self, ready):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        ready.set()
+        self._loop.run_until_complete(self._main())
+
+    def track(self, auth_token, track_ids, timeout=None):
+        """Start following track_ids; the returned Future resolves to their songs"""
+        self._ensure_loop()
+        waiter = _Waiter(auth_token, track_ids, timeout or self.timeout)
+        with self._lock:
+            self._waiters.append(waiter)
+        self._loop.call_soon_threadsafe(self._wake)
+        return waiter.future
+
+    def _wake(self):
+        self.interval = self.min_interval
+        self._wakeup.set()
+
+    async def _main(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                # Give other new generations a moment to join the same tick
+                await asyncio.sleep(self.min_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            with self._lock:
+                waiting = bool(self._waiters)
+            if not waiting:
+                self.interval = self.max_interval
+                continue
+
+            progressed = await self._tick()
+            if progressed:
+                self.interval = self.min_interval
+            else:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    async def _tick(self):
+        self.ticks += 1
+        with self._lock:
+            pending = {}
+            for waiter in self._waiters:
+                ids = pending.setdefault(waiter.auth_token, [])
+                for track_id in waiter.track_ids:
+                    song = self._songs.get(track_id)
+                    if not (song and song.get('finished')) and track_id not in ids:
+                        ids.append(track_id)
+
+        calls = []
+        for auth_token, ids in pending.items():
+            for start in range(0, len(ids), self.max_ids_per_call):
+                calls.append((auth_token, ids[start:start + self.max_ids_per_call]))
+
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(None, self.fetch_statuses, auth_token, ids) for auth_token, ids in calls
+        ], return_exceptions=True)
+        self.upstream_calls += len(calls)
+
+        newly_finished = 0
+        failed_tokens = set()
+        with self._lock:
+            for (auth_token, _), songs in zip(calls, results):
+                if songs is None or isinstance(songs, Exception):
+                    self._errors[auth_token] = self._errors.get(auth_token, 0) + 1
+                    if self._errors[auth_token] >= self.max_errors:
+                        failed_tokens.add(auth_token)
+                    continue
+                self._errors[auth_token] = 0
+                for song in songs:
+                    if song.get('finished') and not self._songs.get(song['id'], {}).get('finished'):
+                        newly_finished += 1
+                    self._songs[song['id']] = song
+
+            resolved = self._resolve(failed_tokens)
+        return newly_finished > 0 or resolved > 0
+
+    def _resolve(self, failed_tokens):
+        """Settle finished, failed and timed-out waiters; caller holds the lock"""
+        now = time.time()
+        remaining = []
+        settled = []
+        for waiter in self._waiters:
+            songs = [self._songs.get(track_id) for track_id in waiter.track_ids]
+            if all(song and song.get('finished') for song in songs):
+                waiter.future.set_result(songs)
+            elif waiter.auth_token in failed_tokens:
+                waiter.future.set_exception(RuntimeError("Error checking song status"))
+            elif now > waiter.deadline:
+                waiter.future.set_exception(TrackTimeout("Timeout waiting for tracks to complete"))
+            else:
+                remaining.append(waiter)
+                continue
+            settled.append(waiter)
+
+        self._waiters = remaining
+        for auth_token in failed_tokens:
+            self._errors.pop(auth_token, None)
+
+        # Forget statuses nobody is waiting on any more
+        still_needed = {track_id for waiter in remaining for track_id in waiter.track_ids}
+        for waiter in settled:
+            for track_id in waiter.track_ids:
+                if track_id not in still_needed:
+                    self._songs.pop(track_id, None)
+        return len(settled)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'waiting_generations': len(self._waiters),
+                'tracked_ids': len({track_id for waiter in self._waiters for track_id in waiter.track_ids}),
+                'ticks': self.ticks,
+                'upstream_calls': self.upstream_calls,
+                'interval_s': round(self.interval, 2)
+            }